@@ -5,10 +5,22 @@
 __author__ = """Dr. Dhaval Patel"""
 __email__ = 'drdhaval2785@gmail.com'
 __version__ = '0.2.1'
-__all__ = ['Prakriya', 'VerbFormGenerator', 'main', 'generate']
+__all__ = ['Prakriya', 'VerbFormGenerator', 'main', 'generate',
+           'PrakriyaError', 'TransliterationError', 'FormNotFoundError',
+           'VerbNotFoundError']
 
 
 from .verbforms import Prakriya
 from .generate import VerbFormGenerator
-from .cli import main
-from .cli import generate
+from .exceptions import PrakriyaError, TransliterationError
+from .exceptions import FormNotFoundError, VerbNotFoundError
+# The name is for the console script below, not for the module.
+del generate  # noqa: F821
+
+
+def __getattr__(name):
+    """Import the console scripts (and click) only when asked for."""
+    if name in ('main', 'generate'):
+        from . import cli
+        return getattr(cli, name)
+    raise AttributeError("module 'prakriya' has no attribute " + repr(name))
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Sutra usage statistics and derivation path index.
+
+A derivation path is the sequence of sutra numbers applied in a
+derivation. Many forms share the same path (e.g. the same tense of many
+verbs of a gana), so every distinct path is stored once and referred
+to by its id. ``sutraindex.json`` in the data directory holds
+
+    ``paths`` - list of distinct paths. The id of a path is its index.
+
+    ``forms`` - {verbform: [path id of each derivation of verbform]}.
+
+    ``postings`` - {sutra_num: [ids of paths which apply sutra_num]}.
+
+Sutra numbers are as shown by ``Prakriya`` (``~`` replaced by ``-``).
+
+Example
+-------
+
+    >>> from prakriya.analytics import build_sutra_index, SutraIndex
+    >>> build_sutra_index()   # Once, takes a while.
+    >>> s = SutraIndex()
+    >>> s.forms_for_sutra('3.1.68')
+    >>> s.sutra_frequencies().most_common(10)
+    >>> s.top_paths(10)
+    >>> s.forms_sharing_derivation('Bavati')
+"""
+import json
+import os
+from collections import Counter
+from .export import iter_shards
+from .utils import app_dir, read_json
+
+
+INDEXFILE = 'sutraindex.json'
+
+
+def build_sutra_index(appdir=None, outpath=None):
+    """Read every shard and write the sutra index.
+
+    Returns the number of distinct paths.
+    """
+    if appdir is None:
+        appdir = app_dir('prakriya')
+    if outpath is None:
+        outpath = os.path.join(appdir, INDEXFILE)
+    pathids = {}
+    forms = {}
+    for (slugname, compositedata) in iter_shards(appdir):
+        for (verbform, data) in compositedata.items():
+            ids = []
+            for datum in data:
+                path = tuple(member['sutra_num'].replace('~', '-')
+                             for member in datum.get('derivation', []))
+                ids.append(pathids.setdefault(path, len(pathids)))
+            forms[verbform] = ids
+    paths = [None] * len(pathids)
+    for (path, pathid) in pathids.items():
+        paths[pathid] = list(path)
+    postings = {}
+    for (pathid, path) in enumerate(paths):
+        for sutra_num in set(path):
+            postings.setdefault(sutra_num, []).append(pathid)
+    with open(outpath, 'w') as fout:
+        json.dump({'paths': paths, 'forms': forms, 'postings': postings},
+                  fout)
+    return len(paths)
+
+
+class SutraIndex():
+    """Query the sutra index written by ``build_sutra_index()``."""
+
+    def __init__(self, path=None):
+        """Read the index and list the forms of every path."""
+        if path is None:
+            path = os.path.join(app_dir('prakriya'), INDEXFILE)
+        index = read_json(path)
+        self.paths = index['paths']
+        self.forms = index['forms']
+        self.postings = index['postings']
+        self.pathforms = [[] for path in self.paths]
+        for (verbform, ids) in self.forms.items():
+            for pathid in ids:
+                self.pathforms[pathid].append(verbform)
+
+    def path(self, pathid):
+        """Return the sutra numbers of the path."""
+        return self.paths[pathid]
+
+    def forms_for_sutra(self, sutra_num):
+        """Return the sorted forms derived through the sutra."""
+        verbforms = set()
+        for pathid in self.postings.get(sutra_num, []):
+            verbforms.update(self.pathforms[pathid])
+        return sorted(verbforms)
+
+    def sutra_frequencies(self):
+        """Return a Counter of derivations in which each sutra applies."""
+        counts = Counter()
+        for (sutra_num, ids) in self.postings.items():
+            counts[sutra_num] = sum(len(self.pathforms[pathid])
+                                    for pathid in ids)
+        return counts
+
+    def top_paths(self, top=None):
+        """Return (path id, number of derivations) of most common paths."""
+        counts = Counter(dict((pathid, len(verbforms)) for
+                              (pathid, verbforms) in
+                              enumerate(self.pathforms)))
+        return counts.most_common(top)
+
+    def forms_sharing_derivation(self, verbform):
+        """Return other forms derived by the same sequence of sutras."""
+        verbforms = set()
+        for pathid in self.forms.get(verbform, []):
+            verbforms.update(self.pathforms[pathid])
+        verbforms.discard(verbform)
+        return sorted(verbforms)
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Store records in small compressed blocks, readable one at a time.
+
+The tar.gz has to be read from the start to get at a shard, and the
+extracted JSON takes about 600 MB. In the block store, the records of
+every shard are cut into blocks of about ``blocksize`` bytes of JSON,
+and every block is compressed on its own with zlib (raw deflate, without
+header and checksum, which costs more than a small block). Small blocks
+compress badly alone, so all of them share a preset dictionary
+trained on fragments of sampled records, which keeps the store close
+to the size of the tar.gz. A lookup decompresses one block.
+
+The store lives in ``blocks`` in the data directory.
+
+    ``blocks.dict`` - the preset dictionary.
+
+    ``blocks.bin`` - the compressed blocks, one after another.
+
+    ``blocks.json`` - ``{"blocksize": blocksize, "shards": {shard:
+    [[first form, offset, length], ...]}}`` with the blocks of every
+    shard in the order of their forms.
+
+Example
+-------
+
+    >>> from prakriya import Prakriya
+    >>> from prakriya.blockstore import build_block_store
+    >>> build_block_store()   # Once, takes a while.
+    >>> p = Prakriya()
+    >>> p.use_block_store()
+"""
+import bisect
+import json
+import mmap
+import os
+import random
+import shutil
+import zlib
+from collections import Counter
+from functools import lru_cache
+from .export import iter_shards
+from .utils import app_dir
+
+
+# Size of the window of zlib, and so the largest useful dictionary.
+WBITS = 15
+DICTSIZE = 1 << WBITS
+
+
+def train_dictionary(appdir, size=DICTSIZE, samples=2000):
+    """Return a preset dictionary made from sampled records.
+
+    Fragments (between commas) of the JSON of the records are counted,
+    and the most common ones are put at the end of the dictionary,
+    where zlib finds them at the least cost.
+    """
+    sampler = random.Random(0)
+    sampled = []
+    seen = 0
+    for (slugname, compositedata) in iter_shards(appdir):
+        for (verbform, records) in compositedata.items():
+            seen += 1
+            # Reservoir sampling keeps every record equally likely.
+            if len(sampled) < samples:
+                sampled.append((verbform, records))
+            else:
+                index = sampler.randrange(seen)
+                if index < samples:
+                    sampled[index] = (verbform, records)
+    counts = Counter()
+    for (verbform, records) in sampled:
+        text = json.dumps({verbform: records}, separators=(',', ':'))
+        counts.update(text.split(','))
+    dictionary = b''
+    for (fragment, count) in counts.most_common():
+        if count < 2:
+            break
+        fragment = (fragment + ',').encode('utf-8')
+        if len(dictionary) + len(fragment) > size:
+            break
+        dictionary = fragment + dictionary
+    return dictionary
+
+
+def build_block_store(appdir=None, outdir=None, blocksize=4096,
+                      dictsize=DICTSIZE):
+    """Write the block store of every shard.
+
+    Reads the shards twice, once to train the dictionary. The store is
+    written next to outdir and then replaces it, so that BlockStore
+    objects reading it keep their old files until ``reload()``.
+    Returns the number of blocks, and the bytes of the store
+    and of the JSON it holds.
+    """
+    if appdir is None:
+        appdir = app_dir('prakriya')
+    if outdir is None:
+        outdir = os.path.join(appdir, 'blocks')
+    tmpdir = outdir + '.tmp'
+    if os.path.exists(tmpdir):
+        shutil.rmtree(tmpdir)
+    os.makedirs(tmpdir)
+    zdict = train_dictionary(appdir, dictsize)
+    with open(os.path.join(tmpdir, 'blocks.dict'), 'wb') as fout:
+        fout.write(zdict)
+    index = {}
+    counts = {'blocks': 0, 'bytes': len(zdict), 'json': 0}
+    with open(os.path.join(tmpdir, 'blocks.bin'), 'wb') as fout:
+
+        def write_block(slugname, block):
+            """Compress and append a block of {verbform: records}."""
+            text = json.dumps(block, separators=(',', ':'),
+                              sort_keys=True).encode('utf-8')
+            compressor = zlib.compressobj(9, zlib.DEFLATED, -WBITS,
+                                          zdict=zdict)
+            content = compressor.compress(text) + compressor.flush()
+            index[slugname].append([min(block), fout.tell(), len(content)])
+            fout.write(content)
+            counts['blocks'] += 1
+            counts['bytes'] += len(content)
+            counts['json'] += len(text)
+
+        for (slugname, compositedata) in iter_shards(appdir):
+            index[slugname] = []
+            block = {}
+            size = 0
+            for verbform in sorted(compositedata):
+                block[verbform] = compositedata[verbform]
+                size += len(json.dumps(compositedata[verbform]))
+                if size >= blocksize:
+                    write_block(slugname, block)
+                    block = {}
+                    size = 0
+            if block:
+                write_block(slugname, block)
+    with open(os.path.join(tmpdir, 'blocks.json'), 'w') as fout:
+        json.dump({'blocksize': blocksize, 'shards': index}, fout)
+    counts['bytes'] += os.path.getsize(os.path.join(tmpdir, 'blocks.json'))
+    if os.path.exists(outdir):
+        shutil.rmtree(outdir)
+    os.rename(tmpdir, outdir)
+    return counts
+
+
+class BlockStore():
+    """Read records from a block store.
+
+    The last ``cache`` decompressed blocks are kept.
+    Treat the records as read only.
+    """
+
+    def __init__(self, directory, cache=256):
+        """Read the index and the dictionary and map the blocks."""
+        self.directory = directory
+        self.cache = cache
+        with open(os.path.join(directory, 'blocks.json'), 'r') as fin:
+            shards = json.load(fin)['shards']
+        with open(os.path.join(directory, 'blocks.dict'), 'rb') as fin:
+            self.zdict = fin.read()
+        # shard -> (first forms, [offset, length] of blocks)
+        self.index = {}
+        for (slugname, blocks) in shards.items():
+            self.index[slugname] = ([block[0] for block in blocks],
+                                    [block[1:] for block in blocks])
+        self.fin = open(os.path.join(directory, 'blocks.bin'), 'rb')
+        self.blocks = mmap.mmap(self.fin.fileno(), 0,
+                                access=mmap.ACCESS_READ)
+        self.read_block = lru_cache(maxsize=cache)(self._read_block)
+
+    def _read_block(self, offset, length):
+        """Decompress and parse the block."""
+        decompressor = zlib.decompressobj(-WBITS, zdict=self.zdict)
+        text = decompressor.decompress(self.blocks[offset:offset + length])
+        return json.loads(text.decode('utf-8'))
+
+    def get(self, slugname, verbform):
+        """Return the records of verbform, None if not in the shard."""
+        if slugname not in self.index:
+            return None
+        (firsts, blocks) = self.index[slugname]
+        position = bisect.bisect_right(firsts, verbform) - 1
+        if position < 0:
+            return None
+        return self.read_block(*blocks[position]).get(verbform)
+
+    def get_many(self, slugname, verbforms):
+        """Return {verbform: records} of the verbforms in the shard."""
+        result = {}
+        for verbform in verbforms:
+            records = self.get(slugname, verbform)
+            if records is not None:
+                result[verbform] = records
+        return result
+
+    def close(self):
+        """Close the file of blocks."""
+        self.blocks.close()
+        self.fin.close()
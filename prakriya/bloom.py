@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Bloom filter of all verb forms, to reject unknown forms early.
+
+Most tokens of a running text are not verb forms. Without the filter,
+each of them costs a shard lookup (and maybe extracting and parsing the
+shard) before it is known to be missing. The filter answers
+"certainly not a verb form" from a few bits, and "maybe" otherwise.
+A known form is never rejected.
+
+``bloom.bin`` in the data directory has one JSON line with ``bits``,
+``hashes``, ``count`` and ``version`` (of the dataset, see
+``prakriya.dataset``), followed by the bits.
+``Prakriya`` uses the filter only if its version is that of the data,
+so a filter left over from before an update is ignored.
+
+Example
+-------
+
+    >>> from prakriya.bloom import build_bloom
+    >>> build_bloom()   # Once, and after every update.
+"""
+import hashlib
+import json
+import math
+import os
+from .dataset import read_manifest
+from .export import iter_shards
+from .utils import app_dir
+
+
+BLOOMFILE = 'bloom.bin'
+
+
+class BloomFilter():
+    """Set of strings which may give false positives, but no false negatives.
+
+    ``bits`` is the size of the bit array, ``hashes`` the number of bits
+    set per string.
+    """
+
+    def __init__(self, bits, hashes, data=None):
+        """Start an empty filter, or one with given bytes."""
+        self.bits = bits
+        self.hashes = hashes
+        if data is None:
+            data = bytearray((bits + 7) // 8)
+        self.data = data
+        self.count = 0
+
+    @classmethod
+    def for_capacity(cls, count, error_rate=0.01):
+        """Return an empty filter sized for count strings."""
+        count = max(count, 1)
+        bits = int(math.ceil(-count * math.log(error_rate) /
+                             math.log(2) ** 2))
+        hashes = max(1, int(round(float(bits) / count * math.log(2))))
+        return cls(bits, hashes)
+
+    def positions(self, item):
+        """Return the bits of item, by double hashing one digest."""
+        digest = hashlib.blake2b(item.encode('utf-8'),
+                                 digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.bits
+                for i in range(self.hashes)]
+
+    def add(self, item):
+        """Add a string."""
+        for position in self.positions(item):
+            self.data[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        """Return False if item was certainly not added."""
+        data = self.data
+        for position in self.positions(item):
+            if not data[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def save(self, path, version=None):
+        """Write the filter to path."""
+        header = {'bits': self.bits, 'hashes': self.hashes,
+                  'count': self.count, 'version': version}
+        tmpfile = path + '.tmp'
+        with open(tmpfile, 'wb') as fout:
+            fout.write(json.dumps(header).encode('utf-8') + b'\n')
+            fout.write(bytes(self.data))
+        os.replace(tmpfile, path)
+
+
+def read_bloom(path):
+    """Return (filter, version) saved in path."""
+    with open(path, 'rb') as fin:
+        header = json.loads(fin.readline().decode('utf-8'))
+        data = bytearray(fin.read())
+    bloom = BloomFilter(header['bits'], header['hashes'], data)
+    bloom.count = header['count']
+    return (bloom, header['version'])
+
+
+def build_bloom(appdir=None, path=None, error_rate=0.01):
+    """Read every shard and write the filter of all verb forms.
+
+    Returns the filter.
+    """
+    if appdir is None:
+        appdir = app_dir('prakriya')
+    if path is None:
+        path = os.path.join(appdir, BLOOMFILE)
+    verbforms = []
+    for (slugname, compositedata) in iter_shards(appdir):
+        verbforms.extend(compositedata)
+    bloom = BloomFilter.for_capacity(len(verbforms), error_rate)
+    for verbform in verbforms:
+        bloom.add(verbform)
+    manifest = read_manifest(appdir)
+    bloom.save(path, manifest['version'] if manifest else None)
+    return bloom
+
+
+def load_bloom(appdir):
+    """Return the filter of the dataset in appdir.
+
+    None if there is no filter, or if it is not of the installed version.
+    """
+    path = os.path.join(appdir, BLOOMFILE)
+    if not os.path.isfile(path):
+        return None
+    (bloom, version) = read_bloom(path)
+    manifest = read_manifest(appdir)
+    if version != (manifest['version'] if manifest else None):
+        return None
+    return bloom
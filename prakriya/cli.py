@@ -2,7 +2,17 @@
 
 """Console script for prakriya."""
 
+import csv
+import json
+import multiprocessing
 import click
+from .exceptions import PrakriyaError, FormNotFoundError
+from .exceptions import VerbNotFoundError
+
+
+TRANSLITERATIONS = ['slp1', 'itrans', 'hk', 'iast', 'devanagari', 'wx',
+                    'bengali', 'gujarati', 'gurmukhi', 'kannada',
+                    'malayalam', 'oriya', 'telugu']
 
 
 # Start a click command for testing Prakriya class.
@@ -15,11 +25,15 @@ import click
               type=click.Choice(['slp1', 'itrans', 'hk', 'iast', 'devanagari',
                                  'wx', 'bengali', 'gujarati', 'gurmukhi',
                                  'kannada', 'malayalam', 'oriya', 'telugu']))
+@click.option('--prewarm', default=None, type=click.Path(exists=True),
+              help='Access log whose forms are loaded before the lookup.')
+@click.option('--top', default=None, type=int,
+              help='Load only these many most frequent forms of --prewarm.')
 @click.argument('verbform')
 @click.argument('field',
                 required=False,
                 default='')
-def main(verbform, field, intran, outtran):
+def main(verbform, field, intran, outtran, prewarm, top):
     """Console script to get derivation and other information for given verb form.
 
         $ prakriya [OPTIONS] VERBFORM [FIELD]
@@ -80,7 +94,12 @@ def main(verbform, field, intran, outtran):
     prak = Prakriya()
     prak.input_translit(intran)
     prak.output_translit(outtran)
-    result = prak[verbform, field]
+    if prewarm is not None:
+        prak.prewarm(logfile=prewarm, top=top, scripts=[outtran], wait=True)
+    try:
+        result = prak[verbform, field]
+    except PrakriyaError as error:
+        raise click.ClickException(str(error))
     click.echo(result)
 
 
@@ -113,5 +132,661 @@ def generate(verb, lakara, purusha, vachana, intran, outtran):
     gen = VerbFormGenerator()
     gen.input_translit(intran)
     gen.output_translit(outtran)
-    result = gen[verb, lakara, purusha, vachana]
+    try:
+        result = gen[verb, lakara, purusha, vachana]
+    except PrakriyaError as error:
+        raise click.ClickException(str(error))
     click.echo(result)
+
+
+# Objects of the worker processes of batch commands.
+_WORKER = {}
+
+
+def _split_fields(fields):
+    """Return the list of comma separated fields, None if empty."""
+    if not fields:
+        return None
+    return [field.strip() for field in fields.split(',') if field.strip()]
+
+
+def _init_analyser(intran, outtran, fields, cachename=None):
+    """Start a Prakriya object in the worker, or take the preloaded one."""
+    from prakriya import Prakriya
+    from prakriya.workers import PRELOADED
+    prak = PRELOADED.get('prakriya') or Prakriya()
+    prak.input_translit(intran)
+    prak.output_translit(outtran)
+    if cachename is not None:
+        prak.use_shared_cache(cachename)
+    _WORKER['prakriya'] = prak
+    _WORKER['fields'] = fields
+
+
+def _analyse(verbform):
+    """Return the record of the given verb form."""
+    prak = _WORKER['prakriya']
+    (verbform, result) = next(prak.batch_info([verbform], _WORKER['fields'],
+                                              errors='record'))
+    if isinstance(result, FormNotFoundError):
+        return {'input': verbform, 'error': 'not found'}
+    elif isinstance(result, PrakriyaError):
+        return {'input': verbform, 'error': str(result)}
+    return {'input': verbform, 'result': result}
+
+
+def _init_generator(intran, outtran):
+    """Start a VerbFormGenerator object in the worker."""
+    from prakriya import VerbFormGenerator
+    gen = VerbFormGenerator()
+    gen.input_translit(intran)
+    gen.output_translit(outtran)
+    _WORKER['generator'] = gen
+
+
+def _generate(query):
+    """Return the record of the given (verb, lakara, ...) query."""
+    from prakriya.generate import materialize
+    if len(query) not in [3, 4]:
+        return {'input': ' '.join(query), 'error': 'expected VERB LAKARA '
+                'PURUSHA VACHANA or VERB LAKARA SUFFIX'}
+    gen = _WORKER['generator']
+    record = {'verb': query[0], 'lakara': query[1]}
+    if len(query) == 3:
+        record['suffix'] = query[2]
+    else:
+        record['purusha'] = query[2]
+        record['vachana'] = query[3]
+    (query, result) = next(gen.batch_forms([query], errors='record'))
+    if isinstance(result, (VerbNotFoundError, FormNotFoundError)):
+        record['error'] = 'not found'
+    elif isinstance(result, PrakriyaError):
+        record['error'] = str(result)
+    else:
+        record['result'] = materialize(result)
+    return record
+
+
+def _run(lines, init, initargs, func, jobs, fork=False):
+    """Yield func(line) for every line, in the order of lines.
+
+    If fork is True, the workers are forked from this process after
+    ``prakriya.workers.preload()``.
+    """
+    if jobs == 1:
+        init(*initargs)
+        for line in lines:
+            yield func(line)
+    else:
+        if fork:
+            from prakriya.workers import pool as forked_pool
+            pool = forked_pool(jobs, init, initargs)
+        else:
+            pool = multiprocessing.Pool(jobs, init, initargs)
+        try:
+            for record in pool.imap(func, lines, chunksize=64):
+                yield record
+        finally:
+            pool.terminate()
+
+
+def _read_forms(infile):
+    """Yield non empty lines of infile."""
+    for line in infile:
+        line = line.strip()
+        if line:
+            yield line
+
+
+def _read_queries(infile):
+    """Yield (verb, lakara, purusha, vachana) or (verb, lakara, suffix).
+
+    Other non empty lines are yielded as they are split, and get an error
+    record.
+    """
+    for line in infile:
+        query = tuple(line.replace(',', ' ').split())
+        if query:
+            yield query
+
+
+@click.command()
+@click.option('--intran', default='slp1', type=click.Choice(TRANSLITERATIONS))
+@click.option('--outtran', default='slp1',
+              type=click.Choice(TRANSLITERATIONS))
+@click.option('--format', 'outformat', default='ndjson',
+              type=click.Choice(['ndjson', 'csv']))
+@click.option('--fields', default='',
+              help='Comma separated fields to output. All by default.')
+@click.option('--jobs', default=1, type=int,
+              help='Number of worker processes.')
+@click.option('--shared-cache', default=0, type=int,
+              help='Slots of a cache of results shared by the workers. '
+                   'None by default.')
+@click.option('--preload/--no-preload', default=False,
+              help='Load the shards of all input forms once, and fork '
+                   'the workers which share them.')
+@click.argument('infile', type=click.File('r'), default='-')
+@click.argument('outfile', type=click.File('w'), default='-')
+def batch(infile, outfile, intran, outtran, outformat, fields, jobs,
+          shared_cache, preload):
+    """Console script to analyse many verb forms in one go.
+
+        $ prakriya-batch [OPTIONS] [INFILE] [OUTFILE]
+
+    INFILE has one verb form per line. Standard input by default.
+    OUTFILE is standard output by default.
+
+    ``ndjson`` writes one JSON object per input line with ``input``
+    and ``result`` (or ``error``) keys.
+
+    ``csv`` writes one row per derivation, with ``input`` followed by
+    the fields. ``prakriya`` is written as JSON.
+
+    FIELDS are the same as the FIELD of ``prakriya``.
+
+    With ``--preload`` and more than one job, INFILE is read first, the
+    shards of its forms are loaded once, and the workers are forked
+    from this process (see ``prakriya.workers``).
+    """
+    from prakriya.verbforms import FIELDS
+    from prakriya.utils import convert
+    fields = _split_fields(fields)
+    cache = None
+    if shared_cache:
+        from prakriya.sharedcache import SharedCache
+        cache = SharedCache(slots=shared_cache)
+    lines = _read_forms(infile)
+    fork = preload and jobs > 1
+    if fork:
+        from prakriya import workers
+        lines = list(lines)
+        workers.preload(forms=[convert(line, intran, 'slp1')
+                               for line in lines], generator=False)
+    try:
+        records = _run(lines, _init_analyser,
+                       (intran, outtran, fields, cache and cache.name),
+                       _analyse, jobs, fork)
+        _write_analyses(records, outfile, outformat, fields or FIELDS)
+    finally:
+        if fork:
+            workers.release()
+            workers.PRELOADED.clear()
+        if cache is not None:
+            cache.close()
+            cache.unlink()
+
+
+def _write_analyses(records, outfile, outformat, columns):
+    """Write the records of prakriya-batch in outformat."""
+    if outformat == 'ndjson':
+        for record in records:
+            outfile.write(json.dumps(record, ensure_ascii=False) + '\n')
+        return
+    writer = csv.writer(outfile)
+    writer.writerow(['input'] + columns + ['error'])
+    for record in records:
+        if 'error' in record:
+            writer.writerow([record['input']] + [''] * len(columns) +
+                            [record['error']])
+            continue
+        for member in record['result']:
+            row = [record['input']]
+            for column in columns:
+                value = member.get(column, '')
+                if column == 'prakriya':
+                    value = json.dumps(value, ensure_ascii=False)
+                row.append(value)
+            writer.writerow(row + [''])
+
+
+@click.command()
+@click.option('--intran', default='slp1', type=click.Choice(TRANSLITERATIONS))
+@click.option('--outtran', default='slp1',
+              type=click.Choice(TRANSLITERATIONS))
+@click.option('--format', 'outformat', default='ndjson',
+              type=click.Choice(['ndjson', 'csv']))
+@click.option('--fields', default='',
+              help='Comma separated columns to output. All by default.')
+@click.option('--jobs', default=1, type=int,
+              help='Number of worker processes.')
+@click.argument('infile', type=click.File('r'), default='-')
+@click.argument('outfile', type=click.File('w'), default='-')
+def generate_batch(infile, outfile, intran, outtran, outformat, fields, jobs):
+    """Console script to generate many verb forms in one go.
+
+        $ generate-batch [OPTIONS] [INFILE] [OUTFILE]
+
+    Every line of INFILE is ``VERB LAKARA PURUSHA VACHANA``
+    or ``VERB LAKARA SUFFIX``, separated by spaces, tabs or commas.
+    Standard input by default. OUTFILE is standard output by default.
+
+    ``ndjson`` writes one JSON object per input line with the query
+    and ``result`` (or ``error``) keys. A line which is not a query
+    gets ``input`` and ``error`` keys.
+
+    ``csv`` writes one row per generated form. Its columns are
+    verb, lakara, purusha, vachana, suffix, number, form and error.
+    FIELDS selects among them.
+    """
+    columns = _split_fields(fields) or ['verb', 'lakara', 'purusha',
+                                        'vachana', 'suffix', 'number',
+                                        'form', 'error']
+    records = _run(_read_queries(infile), _init_generator,
+                   (intran, outtran), _generate, jobs)
+    if outformat == 'ndjson':
+        for record in records:
+            if fields:
+                record = dict((key, record[key]) for key in columns
+                              if key in record)
+            outfile.write(json.dumps(record, ensure_ascii=False) + '\n')
+        return
+    writer = csv.writer(outfile)
+    writer.writerow(columns)
+    for record in records:
+        rows = []
+        for (number, forms) in sorted(record.get('result', {}).items()):
+            if not isinstance(forms, list):
+                forms = [json.dumps(forms, ensure_ascii=False)]
+            for form in forms:
+                rows.append(dict(record, number=number, form=form))
+        if not rows:
+            rows = [record]
+        for row in rows:
+            writer.writerow([row.get(column, '') for column in columns])
+
+
+@click.command()
+@click.argument('delta', type=click.Path(exists=True))
+def update(delta):
+    """Console script to apply a dataset delta.
+
+        $ prakriya-update DELTA
+
+    DELTA is a tar.gz file made by ``prakriya.dataset.make_delta``.
+    Only the shards in it are replaced, and the Bloom filter, the
+    sized shards, the trie store and the block store (those which
+    exist) are built again.
+    Running processes pick them up with ``Prakriya.reload()``.
+    """
+    import os.path
+    from prakriya.utils import app_dir
+    from prakriya.dataset import apply_delta, read_manifest
+    from prakriya.bloom import build_bloom, BLOOMFILE
+    from prakriya.reshard import reshard, INDEXFILE
+    from prakriya.trie import build_trie_store
+    from prakriya.blockstore import build_block_store
+    appdir = app_dir('prakriya')
+    changed = apply_delta(appdir, delta)
+    click.echo('Updated to ' + read_manifest(appdir)['version'] + '. ' +
+               str(len(changed)) + ' shards changed.')
+    if os.path.isfile(os.path.join(appdir, BLOOMFILE)):
+        build_bloom(appdir)
+        click.echo('Bloom filter built again.')
+    indexfile = os.path.join(appdir, 'shards', INDEXFILE)
+    if os.path.isfile(indexfile):
+        with open(indexfile, 'r') as fin:
+            maxsize = json.load(fin)['maxsize']
+        reshard(appdir, maxsize=maxsize)
+        click.echo('Sized shards built again.')
+    if os.path.isdir(os.path.join(appdir, 'trie', 'json')):
+        build_trie_store(appdir)
+        click.echo('Trie store built again.')
+    blockindex = os.path.join(appdir, 'blocks', 'blocks.json')
+    if os.path.isfile(blockindex):
+        with open(blockindex, 'r') as fin:
+            blocksize = json.load(fin).get('blocksize', 4096)
+        build_block_store(appdir, blocksize=blocksize)
+        click.echo('Block store built again.')
+
+
+@click.command()
+@click.option('--format', 'fmt', default='auto',
+              type=click.Choice(['auto', 'parquet', 'columns']),
+              help='parquet needs pyarrow. auto uses it when installed.')
+@click.option('--chunksize', default=100000, type=int,
+              help='Rows held in memory per table before writing.')
+@click.argument('outdir', type=click.Path())
+def export(outdir, fmt, chunksize):
+    """Console script to export the dataset to columnar files.
+
+        $ prakriya-export [OPTIONS] OUTDIR
+
+    Writes ``forms``, ``steps`` and ``generated`` tables to OUTDIR.
+    Works offline on the already downloaded data.
+    """
+    from prakriya.export import export as export_tables
+    counts = export_tables(outdir, fmt=fmt, chunksize=chunksize)
+    for table in sorted(counts):
+        click.echo(table + ': ' + str(counts[table]) + ' rows')
+
+
+@click.command()
+def sutra_index():
+    """Console script to build the sutra and derivation path index.
+
+        $ prakriya-sutra-index
+
+    Reads every shard once and writes ``sutraindex.json``
+    to the data directory. See ``prakriya.analytics.SutraIndex``.
+    """
+    from prakriya.analytics import build_sutra_index
+    click.echo(str(build_sutra_index()) + ' distinct derivation paths.')
+
+
+@click.command()
+def trie_store():
+    """Console script to build the trie store of derivations.
+
+        $ prakriya-trie-store
+
+    Writes the ``trie`` directory in the data directory.
+    Use it with ``Prakriya.use_trie_store()``.
+    """
+    from prakriya.trie import build_trie_store
+    counts = build_trie_store()
+    click.echo(str(counts['steps']) + ' derivation steps stored as ' +
+               str(counts['nodes']) + ' trie nodes.')
+
+
+@click.command()
+@click.option('--blocksize', default=4096, type=int,
+              help='Bytes of JSON per block before compression.')
+def block_store(blocksize):
+    """Console script to build the compressed block store of records.
+
+        $ prakriya-block-store [OPTIONS]
+
+    Writes the ``blocks`` directory in the data directory.
+    Use it with ``Prakriya.use_block_store()``.
+    """
+    from prakriya.blockstore import build_block_store
+    counts = build_block_store(blocksize=blocksize)
+    click.echo(str(counts['json']) + ' bytes of records stored in ' +
+               str(counts['blocks']) + ' blocks of ' +
+               str(counts['bytes']) + ' bytes.')
+
+
+@click.command()
+@click.option('--error-rate', default=0.01, type=float,
+              help='Share of unknown forms which pass the filter.')
+def bloom(error_rate):
+    """Console script to build the Bloom filter of all verb forms.
+
+        $ prakriya-bloom [OPTIONS]
+
+    Writes ``bloom.bin`` to the data directory. ``Prakriya`` then
+    rejects most unknown forms without reading a shard.
+    Build it again after ``prakriya-update``.
+    """
+    from prakriya.bloom import build_bloom
+    result = build_bloom(error_rate=error_rate)
+    click.echo(str(result.count) + ' verb forms in ' +
+               str(len(result.data)) + ' bytes.')
+
+
+@click.command()
+@click.option('--generator', is_flag=True,
+              help='Also load and report VerbFormGenerator data.')
+@click.option('--top', default=10, type=int,
+              help='Number of largest shards and allocations to show.')
+@click.option('--tracemalloc', 'trace', is_flag=True,
+              help='Trace allocations from the start.')
+@click.argument('verbforms', type=click.File('r', encoding='utf-8'),
+                required=False)
+def memory(verbforms, generator, top, trace):
+    """Console script to report memory taken by datasets and caches.
+
+        $ prakriya-memory [OPTIONS] [VERBFORMS]
+
+    VERBFORMS is a file with one verb form (SLP1) per line, looked up
+    before the report, e.g. an access log. Use - for stdin.
+    """
+    if trace:
+        import tracemalloc
+        tracemalloc.start()
+    from prakriya import Prakriya, VerbFormGenerator
+    from prakriya.memory import memory_report
+    prak = Prakriya()
+    gen = VerbFormGenerator() if generator else None
+    if verbforms is not None:
+        for (verbform, result) in prak.batch_info(_read_forms(verbforms),
+                                                  errors='record'):
+            pass
+    report = memory_report(prakriya=prak, generator=gen, top=top)
+    for component in report['components']:
+        click.echo('{name:<12}{bytes:>14,} bytes {entries:>10,} entries'
+                   .format(**component))
+    click.echo('{0:<12}{1:>14,} bytes'.format('total', report['total']))
+    if report['rss'] is not None:
+        click.echo('{0:<12}{1:>14,} bytes'.format('rss', report['rss']))
+    for (path, size) in report['top_shards']:
+        click.echo('shard {0:>14,} bytes {1}'.format(size, path))
+    if report['traced'] is not None:
+        click.echo('{0:<12}{1:>14,} bytes'.format(
+            'traced', report['traced']['current']))
+        for (line, size) in report['traced']['top']:
+            click.echo('{0:>14,} bytes {1}'.format(size, line))
+
+
+@click.command()
+@click.option('--host', default='127.0.0.1', help='Address to listen on.')
+@click.option('--port', default=8001, type=int,
+              help='Port to listen on. 0 picks a free port.')
+@click.option('--node', default=None,
+              help='Name of this node in --nodes. Default is host:port.')
+@click.option('--nodes', default=None,
+              help='Comma separated host:port of all nodes of the cluster.')
+@click.option('--prewarm/--no-prewarm', default=True,
+              help='Load the shards of this node before serving.')
+@click.option('--workers', default=1, type=int,
+              help='Processes serving the port, forked after the data '
+                   'is loaded.')
+def serve(host, port, node, nodes, prewarm, workers):
+    """Console script to run a lookup node of a cluster.
+
+        $ prakriya-serve [OPTIONS]
+
+    The shards of this node are decided by consistent hashing over
+    --nodes, the same list which is given to
+    ``prakriya.cluster.ClusterPrakriya``. Any node answers any form,
+    but only the shards of this node are kept hot.
+
+    With more than one of --workers, the data is loaded once and the
+    workers are forked from this process, sharing it (see
+    ``prakriya.workers``).
+    """
+    import sys
+    from prakriya import Prakriya
+    from prakriya import workers as forking
+    from prakriya.cluster import HashRing, make_server
+    if workers > 1:
+        prak = forking.preload(generator=False)['prakriya']
+    else:
+        prak = Prakriya()
+    server = make_server(host, port, prak)
+    address = host + ':' + str(server.server_address[1])
+    if node is None:
+        node = address
+    shards = []
+    if nodes:
+        ring = HashRing([member.strip() for member in nodes.split(',')])
+        shards = ring.shards_of(node, prak.jsonindex.values())
+    server.shards = shards
+    if prewarm and shards:
+        prak.prewarm(shards=shards, wait=True)
+    click.echo('Serving ' + str(len(shards)) + ' shards on ' + address)
+    sys.stdout.flush()
+    try:
+        if workers > 1:
+            forking.freeze()
+            processes = forking.fork_workers(workers, _serve_forever,
+                                             (server,))
+            forking.wait(processes)
+        else:
+            server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def _serve_forever(server):
+    """Serve in a forked worker till interrupted."""
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+@click.command()
+@click.option('--jobs', default=None, type=int,
+              help='Number of worker processes. All CPUs by default.')
+@click.option('--outtran', default='',
+              help='Comma separated output transliterations. All by '
+                   'default.')
+@click.option('--intran', default='',
+              help='Comma separated input transliterations. All by '
+                   'default.')
+@click.option('--sample', default=1, type=int,
+              help='Check one verb form in SAMPLE.')
+@click.option('--store', default='json',
+              type=click.Choice(['json', 'trie', 'blocks', 'sized']),
+              help='Store to read the shards from.')
+@click.option('--generator/--no-generator', default=True,
+              help='Cross check with the tables of VerbFormGenerator.')
+@click.option('--limit', default=100, type=int,
+              help='Mismatches of each kind kept per shard.')
+@click.argument('outfile', type=click.File('w'), default='-')
+def verify(outfile, jobs, outtran, intran, sample, store, generator, limit):
+    """Console script to check every verb form against the reference.
+
+        $ prakriya-verify [OPTIONS] [OUTFILE]
+
+    Writes every mismatch to OUTFILE (standard output by default) as
+    a line of JSON, and then a summary. Exits with status 1 if there
+    is a mismatch. See ``prakriya.verify``.
+    """
+    from prakriya.verify import verify as verify_dataset
+    outtrans = [tran.strip() for tran in outtran.split(',') if tran.strip()]
+    intrans = [tran.strip() for tran in intran.split(',') if tran.strip()]
+    report = verify_dataset(outtrans or None, intrans or None, jobs, sample,
+                            None if store == 'json' else store, generator,
+                            limit)
+    for mismatch in report['mismatches']:
+        outfile.write(json.dumps(mismatch, ensure_ascii=False) + '\n')
+    click.echo('{shards} shards, {forms} verb forms, {comparisons} '
+               'comparisons in {seconds:.1f} seconds.'.format(**report),
+               err=True)
+    for (kind, count) in sorted(report['counts'].items()):
+        click.echo(kind + ': ' + str(count), err=True)
+    if report['counts']:
+        raise click.ClickException('mismatches found.')
+
+
+@click.command()
+@click.option('--max-size', 'maxsize', default=256 * 1024, type=int,
+              help='Largest bytes of JSON in a shard.')
+def reshard(maxsize):
+    """Console script to cut the dataset into shards of bounded size.
+
+        $ prakriya-reshard [OPTIONS]
+
+    Writes the ``shards`` directory in the data directory.
+    Use it with ``Prakriya.use_sized_shards()``.
+    """
+    from prakriya.reshard import reshard as reshard_dataset
+    counts = reshard_dataset(maxsize=maxsize)
+    for key in ['before', 'after']:
+        click.echo('{0}: {1[shards]} shards, the largest of {1[largest]} '
+                   'bytes.'.format(key, counts[key]))
+
+
+@click.command()
+@click.option('--requests', 'count', default=100000, type=int,
+              help='Number of requests to generate.')
+@click.option('--skew', default=1.0, type=float,
+              help='Exponent of the Zipf law of forms. 0 is uniform.')
+@click.option('--scripts', default='slp1',
+              help='Script mix, e.g. devanagari:3,iast:1.')
+@click.option('--fields', default='all',
+              help='Field mix, e.g. all:3,verb:1. all is all the data.')
+@click.option('--generate', default=0.0, type=float,
+              help='Share of VerbFormGenerator requests.')
+@click.option('--dataset', is_flag=True,
+              help='Draw forms from all shards, not the generator tables.')
+@click.option('--seed', default=0, type=int,
+              help='Same seed, same workload.')
+@click.option('--save', default=None, type=click.Path(),
+              help='Write the workload to this file and stop.')
+@click.option('--replay', default=None, type=click.Path(exists=True),
+              help='Send the requests of this file (or access log).')
+@click.option('--nodes', default=None,
+              help='Comma separated host:port of prakriya-serve nodes '
+                   'to send lookups to.')
+@click.option('--threads', default=1, type=int,
+              help='Requests sent at the same time.')
+@click.option('--store', default='json',
+              type=click.Choice(['json', 'trie', 'blocks', 'sized']),
+              help='Store to read the shards from, in process.')
+@click.option('--shared-cache', default=0, type=int,
+              help='Slots of a shared result cache, in process.')
+def workload(count, skew, scripts, fields, generate, dataset, seed, save,
+             replay, nodes, threads, store, shared_cache):
+    """Console script to generate, replay and measure workloads.
+
+        $ prakriya-workload [OPTIONS]
+
+    Prints throughput, latency percentiles in milliseconds and hit
+    rates of caches. See ``prakriya.workload``.
+    """
+    from prakriya.workload import make_workload, read_workload
+    from prakriya.workload import write_workload, run_workload, parse_mix
+    from prakriya.workload import dataset_forms
+    if replay is not None:
+        requests = read_workload(replay)
+    else:
+        fields = dict(('' if name == 'all' else name, weight)
+                      for (name, weight) in parse_mix(fields).items())
+        requests = make_workload(count, skew, parse_mix(scripts), fields,
+                                 generate,
+                                 dataset_forms() if dataset else None,
+                                 seed=seed)
+    if save is not None:
+        write_workload(requests, save)
+        click.echo(str(len(requests)) + ' requests written to ' + save)
+        return
+    cache = None
+    if nodes:
+        from prakriya.cluster import ClusterPrakriya
+        prak = ClusterPrakriya([node.strip() for node in nodes.split(',')],
+                               poolsize=threads)
+    else:
+        from prakriya import Prakriya
+        prak = Prakriya()
+        if store == 'trie':
+            prak.use_trie_store()
+        elif store == 'blocks':
+            prak.use_block_store()
+        elif store == 'sized':
+            prak.use_sized_shards()
+        if shared_cache:
+            cache = prak.use_shared_cache(slots=shared_cache)
+    try:
+        report = run_workload(requests, prak, threads=threads)
+    finally:
+        if nodes:
+            prak.close()
+        if cache is not None:
+            cache.close()
+            cache.unlink()
+    click.echo('{requests} requests, {errors} errors in {seconds:.2f} '
+               'seconds, {throughput:.0f} per second.'.format(**report))
+    click.echo('latency ms: ' + ' '.join(
+        '{0} {1:.3f}'.format(name, report['latency'][name]) for name in
+        ['mean', 'p50', 'p90', 'p99', 'p999', 'max']
+        if report['latency'][name] is not None))
+    for (name, stats) in sorted(report['hits'].items()):
+        click.echo('{0} cache: {1[hits]} hits, {1[misses]} misses'.format(
+            name, stats) + ('' if stats['rate'] is None else
+                            ', {0:.1%}'.format(stats['rate'])))
@@ -0,0 +1,341 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Serve lookups from many nodes, each holding some of the shards.
+
+Shards are spread over the nodes by consistent hashing (``HashRing``),
+so that adding or removing a node moves only the shards of that node.
+Every node is a ``prakriya-serve`` process, which answers lookups
+with its own ``Prakriya`` object and keeps its shards hot.
+
+``ClusterPrakriya`` is used like ``Prakriya``. It sends every verb form
+to the node of its shard, over keep alive connections kept in a pool
+per node. A batch is split by node, sent to all nodes at the same time,
+and the results are put back in the order of the batch.
+
+The client needs no data files. It reads ``jsonindex`` from a node.
+
+Example
+-------
+
+On each node (all of them given the same list of nodes)::
+
+    host1$ prakriya-serve --node host1:8001 --nodes host1:8001,host2:8001
+    host2$ prakriya-serve --node host2:8001 --nodes host1:8001,host2:8001
+
+On the client::
+
+    >>> from prakriya.cluster import ClusterPrakriya
+    >>> p = ClusterPrakriya(['host1:8001', 'host2:8001'])
+    >>> p.get_info('Bavati', 'verb')
+    >>> list(p.batch_info(['Bavati', 'gacCati'], ['verb', 'lakara']))
+
+Protocol
+--------
+
+    ``GET /jsonindex`` - the jsonindex of the node.
+
+    ``GET /health`` - ``{"status": "ok", "shards": [owned shards]}``.
+
+    ``POST /lookup`` - ``{"forms": [SLP1 forms], "field": field(s),
+    "outtran": transliteration(s)}`` gives ``{"results": [...]}`` with
+    ``{"result": ...}`` or ``{"error": name, "message": ...}`` per form.
+"""
+import bisect
+import hashlib
+import json
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection, HTTPException
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .exceptions import PrakriyaError, ClusterError, FormNotFoundError
+from .exceptions import TransliterationError
+from .utils import check_translit, convert
+
+
+class HashRing():
+    """Consistent hashing of shard names to nodes.
+
+    Every node has ``replicas`` points on the ring. A shard belongs to
+    the node of the first point after the hash of its name.
+    """
+
+    def __init__(self, nodes, replicas=64):
+        """Place the points of all nodes."""
+        self.nodes = list(nodes)
+        points = []
+        for node in self.nodes:
+            for replica in range(replicas):
+                points.append((ring_hash(node + '#' + str(replica)), node))
+        points.sort()
+        self.hashes = [point for (point, node) in points]
+        self.owners = [node for (point, node) in points]
+
+    def node_for(self, slugname):
+        """Return the node which holds the shard."""
+        index = bisect.bisect(self.hashes, ring_hash(slugname))
+        return self.owners[index % len(self.owners)]
+
+    def shards_of(self, node, slugnames):
+        """Return the sorted shards, of given ones, held by node."""
+        return sorted(slugname for slugname in set(slugnames)
+                      if self.node_for(slugname) == node)
+
+
+def ring_hash(key):
+    """Return a position on the ring, the same in every process."""
+    digest = hashlib.md5(key.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+class LookupHandler(BaseHTTPRequestHandler):
+    """Answer requests of ClusterPrakriya with ``server.prakriya``."""
+
+    # Keep connections alive.
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately. With Nagle's algorithm,
+    # the body would wait for the delayed ACK of the client.
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        """Return jsonindex or the health of the node."""
+        if self.path == '/jsonindex':
+            self._send(self.server.prakriya.jsonindex)
+        elif self.path == '/health':
+            self._send({'status': 'ok', 'shards': self.server.shards})
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        """Look up a list of verb forms."""
+        if self.path != '/lookup':
+            self.send_error(404)
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length).decode('utf-8'))
+        results = []
+        try:
+            for (verbform, result) in self.server.prakriya.batch_info(
+                    request['forms'], request.get('field', 'prakriya'),
+                    'slp1', request.get('outtran', 'slp1'),
+                    errors='record'):
+                if isinstance(result, PrakriyaError):
+                    results.append({'error': type(result).__name__,
+                                    'message': str(result)})
+                else:
+                    results.append({'result': result})
+        except PrakriyaError as error:
+            # E.g. a bad transliteration fails the whole request.
+            results = [{'error': type(error).__name__,
+                        'message': str(error)}] * len(request['forms'])
+        self._send({'results': results})
+
+    def _send(self, data):
+        """Send data as JSON."""
+        content = json.dumps(data).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        """Do not log every request."""
+
+
+def make_server(host='127.0.0.1', port=8001, prakriya=None, shards=None):
+    """Return a threaded HTTP server answering lookups.
+
+    ``shards`` are the shards owned by this node. They are only reported
+    by ``/health``. Prewarm them with ``prakriya.prewarm(shards=...)``.
+    """
+    if prakriya is None:
+        from .verbforms import Prakriya
+        prakriya = Prakriya()
+    server = ThreadingHTTPServer((host, port), LookupHandler)
+    server.daemon_threads = True
+    server.prakriya = prakriya
+    server.shards = shards or []
+    return server
+
+
+class ConnectionPool():
+    """Keep alive connections to one node, reused by many threads."""
+
+    def __init__(self, address, size=4, timeout=30):
+        """Start without connections. address is host:port."""
+        (host, port) = address.rsplit(':', 1)
+        self.host = host
+        self.port = int(port)
+        self.timeout = timeout
+        self.idle = queue.LifoQueue(size)
+
+    def _connect(self):
+        """Return a new connection."""
+        return HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def request(self, method, path, data=None):
+        """Send a request with data as JSON, and return the JSON reply."""
+        body = None
+        headers = {}
+        if data is not None:
+            body = json.dumps(data).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        try:
+            connection = self.idle.get_nowait()
+        except queue.Empty:
+            connection = self._connect()
+        try:
+            try:
+                connection.request(method, path, body, headers)
+                response = connection.getresponse()
+                content = response.read()
+            except (HTTPException, OSError):
+                # The node may have closed an idle connection. Try once
+                # more on a new one.
+                connection.close()
+                connection = self._connect()
+                connection.request(method, path, body, headers)
+                response = connection.getresponse()
+                content = response.read()
+        except (HTTPException, OSError) as error:
+            connection.close()
+            raise ClusterError(self.host + ':' + str(self.port) + ': ' +
+                               str(error))
+        if response.status != 200:
+            connection.close()
+            raise ClusterError(self.host + ':' + str(self.port) +
+                               ': HTTP ' + str(response.status))
+        try:
+            self.idle.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+        return json.loads(content.decode('utf-8'))
+
+    def close(self):
+        """Close the idle connections."""
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class ClusterPrakriya():
+    """Look up verb forms on a cluster of ``prakriya-serve`` nodes.
+
+    ``nodes`` are host:port of the nodes, as given to them by --nodes.
+    ``poolsize`` connections per node are kept alive.
+    A batch is sent in requests of at most ``chunksize`` forms.
+    """
+
+    def __init__(self, nodes, poolsize=4, timeout=30, chunksize=256):
+        """Connect to the nodes and read jsonindex."""
+        from .verbforms import VALIDTRANS
+        self.validtrans = VALIDTRANS
+        self.ring = HashRing(nodes)
+        self.pools = dict((node, ConnectionPool(node, poolsize, timeout))
+                          for node in self.ring.nodes)
+        self.chunksize = chunksize
+        self.executor = ThreadPoolExecutor(
+            max_workers=poolsize * len(self.pools))
+        self.intran = 'slp1'
+        self.outtran = 'slp1'
+        self.jsonindex = self.pools[self.ring.nodes[0]].request(
+            'GET', '/jsonindex')
+
+    def input_translit(self, tran):
+        """Set input transliteration."""
+        check_translit(tran, self.validtrans)
+        self.intran = tran
+
+    def output_translit(self, tran):
+        """Set output transliteration."""
+        check_translit(tran, self.validtrans, several=True)
+        self.outtran = tran
+
+    def node_for(self, verbform):
+        """Return the node which holds the verb form (in SLP1)."""
+        return self.ring.node_for(self.jsonindex[verbform[:3]])
+
+    def __getitem__(self, items):
+        """Return the requested data by user."""
+        if isinstance(items, str):
+            return self.get_info(items, '')
+        return self.get_info(items[0], items[1] if len(items) > 1 else '')
+
+    def get_info(self, verbform, field='prakriya', intran=None,
+                 outtran=None):
+        """Return the data requested by user, as ``Prakriya.get_info()``."""
+        for (verbform, result) in self.batch_info([verbform], field, intran,
+                                                  outtran):
+            return result
+
+    def batch_info(self, verbforms, fields=None, intran=None, outtran=None,
+                   errors='raise'):
+        """Yield (verbform, result) for every verb form in verbforms.
+
+        As ``Prakriya.batch_info()``. All forms are sent before the
+        first result is yielded.
+        """
+        if errors not in ('raise', 'record'):
+            raise ValueError("errors is 'raise' or 'record'")
+        if intran is None:
+            intran = self.intran
+        else:
+            check_translit(intran, self.validtrans)
+        if outtran is None:
+            outtran = self.outtran
+        else:
+            check_translit(outtran, self.validtrans, several=True)
+        if not fields:
+            fields = ''
+        verbforms = list(verbforms)
+        results = [None] * len(verbforms)
+        # Group the forms by node.
+        bynode = {}
+        for (index, verbform) in enumerate(verbforms):
+            slp1 = convert(verbform, intran, 'slp1')
+            if slp1[:3] in self.jsonindex:
+                bynode.setdefault(self.node_for(slp1), []).append(
+                    (index, slp1))
+            else:
+                results[index] = FormNotFoundError(slp1)
+        # One request per chunk, all at the same time.
+        futures = []
+        for (node, items) in bynode.items():
+            for start in range(0, len(items), self.chunksize):
+                chunk = items[start:start + self.chunksize]
+                request = {'forms': [slp1 for (index, slp1) in chunk],
+                           'field': fields, 'outtran': outtran}
+                futures.append((chunk, self.executor.submit(
+                    self.pools[node].request, 'POST', '/lookup', request)))
+        for (chunk, future) in futures:
+            try:
+                replies = future.result()['results']
+            except ClusterError as error:
+                replies = [{'error': 'ClusterError', 'message': str(error)}
+                           for item in chunk]
+            for ((index, slp1), reply) in zip(chunk, replies):
+                if 'error' in reply:
+                    results[index] = make_error(reply, slp1, outtran)
+                else:
+                    results[index] = reply['result']
+        for (verbform, result) in zip(verbforms, results):
+            if isinstance(result, PrakriyaError) and errors == 'raise':
+                raise result
+            yield (verbform, result)
+
+    def close(self):
+        """Close the connections to the nodes."""
+        self.executor.shutdown()
+        for pool in self.pools.values():
+            pool.close()
+
+
+def make_error(reply, verbform, outtran):
+    """Return the exception for an error reply of a node."""
+    if reply['error'] == 'FormNotFoundError':
+        return FormNotFoundError(verbform)
+    elif reply['error'] == 'TransliterationError':
+        return TransliterationError(outtran)
+    return ClusterError(reply['message'])
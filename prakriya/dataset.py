@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Versioned dataset with per-shard hashes and incremental updates.
+
+A manifest (``manifest.json`` in the data directory) records the version
+of the dataset and the SHA-256 of every shard and index file::
+
+    {"version": "v004", "base": "v003",
+     "shards": {"Bav": "<sha256>", ...},
+     "files": {"jsonindex.json": "<sha256>", "sutrainfo.json": "<sha256>"}}
+
+A delta is a tar.gz file with the new ``manifest.json`` and only the
+files which changed since ``base``:
+
+    ``json/<shard>.json`` - replaced shards.
+
+    ``patches/<shard>.json`` - ``{verbform: records}`` to replace records
+    of a shard in place. ``null`` records delete the verb form.
+
+    ``jsonindex.json``, ``sutrainfo.json`` - replaced index files.
+
+Example
+-------
+
+    >>> from prakriya.dataset import build_manifest, make_delta, apply_delta
+    >>> build_manifest(appdir, 'v003')   # Once, on the old data.
+    >>> make_delta(old_manifest, new_appdir, 'v004', 'delta_v004.tar.gz')
+    >>> apply_delta(appdir, 'delta_v004.tar.gz')
+
+Running ``Prakriya`` objects pick up the new version with ``reload()``.
+A trie store (``prakriya.trie``), a block store (``prakriya.blockstore``)
+or sized shards (``prakriya.reshard``) have to be built again after an
+update, before ``reload()``. ``prakriya-update`` does so.
+"""
+import hashlib
+import io
+import json
+import os
+import tarfile
+from .exceptions import PrakriyaError
+from .utils import read_json, read_shard
+
+
+MANIFEST = 'manifest.json'
+INDEXFILES = ['jsonindex.json', 'sutrainfo.json']
+
+
+class DeltaError(PrakriyaError):
+    """Raised when a delta does not fit the installed dataset."""
+
+
+def file_hash(path):
+    """Return SHA-256 hex digest of the file."""
+    sha = hashlib.sha256()
+    with open(path, 'rb') as fin:
+        for chunk in iter(lambda: fin.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def shard_path(appdir, slugname):
+    """Return the path of the extracted shard."""
+    return os.path.join(appdir, 'json', slugname + '.json')
+
+
+def read_manifest(appdir):
+    """Return the manifest of the dataset in appdir, None if absent."""
+    path = os.path.join(appdir, MANIFEST)
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'r') as fin:
+        return json.load(fin)
+
+
+def write_atomic(path, content):
+    """Write bytes to path so that readers see either old or new file."""
+    tmpfile = path + '.tmp'
+    with open(tmpfile, 'wb') as fout:
+        fout.write(content)
+    os.replace(tmpfile, path)
+
+
+def build_manifest(appdir, version, tarpath=None):
+    """Hash every shard and index file and write the manifest.
+
+    Shards which are not extracted are hashed from ``tarpath``
+    (``composite_v003.tar.gz`` in appdir by default).
+    """
+    jsonindex = read_json(os.path.join(appdir, 'jsonindex.json'))
+    shards = {}
+    for slugname in sorted(set(jsonindex.values())):
+        if os.path.isfile(shard_path(appdir, slugname)):
+            shards[slugname] = file_hash(shard_path(appdir, slugname))
+    missing = set(jsonindex.values()) - set(shards)
+    if missing:
+        if tarpath is None:
+            tarpath = os.path.join(appdir, 'composite_v003.tar.gz')
+        with tarfile.open(tarpath, 'r:gz') as tar:
+            for member in tar:
+                slugname = os.path.basename(member.name)[:-len('.json')]
+                if member.isfile() and slugname in missing:
+                    content = tar.extractfile(member).read()
+                    shards[slugname] = hashlib.sha256(content).hexdigest()
+    manifest = {'version': version, 'shards': shards,
+                'files': dict((filename,
+                               file_hash(os.path.join(appdir, filename)))
+                              for filename in INDEXFILES)}
+    write_atomic(os.path.join(appdir, MANIFEST),
+                 json.dumps(manifest, sort_keys=True).encode('utf-8'))
+    return manifest
+
+
+def make_delta(oldmanifest, newappdir, version, outpath):
+    """Write a delta from oldmanifest to the extracted dataset in newappdir.
+
+    ``oldmanifest`` is a manifest dict or the path of a manifest file.
+    Returns the new manifest.
+    """
+    if not isinstance(oldmanifest, dict):
+        with open(oldmanifest, 'r') as fin:
+            oldmanifest = json.load(fin)
+    newmanifest = build_manifest(newappdir, version)
+    newmanifest['base'] = oldmanifest['version']
+    with tarfile.open(outpath, 'w:gz') as tar:
+        for (slugname, digest) in sorted(newmanifest['shards'].items()):
+            if oldmanifest['shards'].get(slugname) != digest:
+                tar.add(shard_path(newappdir, slugname),
+                        'json/' + slugname + '.json')
+        for (filename, digest) in newmanifest['files'].items():
+            if oldmanifest['files'].get(filename) != digest:
+                tar.add(os.path.join(newappdir, filename), filename)
+        content = json.dumps(newmanifest, sort_keys=True).encode('utf-8')
+        member = tarfile.TarInfo(MANIFEST)
+        member.size = len(content)
+        tar.addfile(member, io.BytesIO(content))
+    return newmanifest
+
+
+def apply_delta(appdir, delta, tarpath=None):
+    """Apply the delta file to the dataset in appdir.
+
+    Only the shards and index files in the delta are written, and the
+    shards which the new manifest does not have are deleted. Every
+    member is read and checked against the new manifest first, so that
+    a bad delta raises DeltaError before anything is written.
+    Returns the list of changed shards.
+    """
+    manifest = read_manifest(appdir)
+    if manifest is None:
+        raise DeltaError('No manifest in ' + appdir +
+                         '. Run build_manifest() first.')
+    if tarpath is None:
+        tarpath = os.path.join(appdir, 'composite_v003.tar.gz')
+    # path -> new content, shards before index files.
+    writes = []
+    changed = []
+    with tarfile.open(delta, 'r:gz') as tar:
+        newmanifest = json.loads(
+            tar.extractfile(MANIFEST).read().decode('utf-8'))
+        if newmanifest.get('base') != manifest['version']:
+            raise DeltaError('Delta is for ' + str(newmanifest.get('base')) +
+                             ', installed version is ' + manifest['version'])
+        indexwrites = []
+        for member in tar:
+            if not member.isfile() or member.name == MANIFEST:
+                continue
+            content = tar.extractfile(member).read()
+            if member.name in INDEXFILES:
+                if hashlib.sha256(content).hexdigest() != \
+                        newmanifest['files'].get(member.name):
+                    raise DeltaError('Hash mismatch for ' + member.name)
+                indexwrites.append((os.path.join(appdir, member.name),
+                                    content))
+            elif member.name.startswith('json/'):
+                slugname = os.path.basename(member.name)[:-len('.json')]
+                if hashlib.sha256(content).hexdigest() != \
+                        newmanifest['shards'].get(slugname):
+                    raise DeltaError('Hash mismatch for shard ' + slugname)
+                writes.append((shard_path(appdir, slugname), content))
+                changed.append(slugname)
+            elif member.name.startswith('patches/'):
+                slugname = os.path.basename(member.name)[:-len('.json')]
+                patch = json.loads(content.decode('utf-8'))
+                content = _patch_shard(appdir, slugname, patch, tarpath)
+                newmanifest['shards'][slugname] = \
+                    hashlib.sha256(content).hexdigest()
+                writes.append((shard_path(appdir, slugname), content))
+                changed.append(slugname)
+    for (path, content) in writes + indexwrites:
+        write_atomic(path, content)
+    # Shards which the new version dropped.
+    for slugname in set(manifest['shards']) - set(newmanifest['shards']):
+        if os.path.isfile(shard_path(appdir, slugname)):
+            os.remove(shard_path(appdir, slugname))
+    write_atomic(os.path.join(appdir, MANIFEST),
+                 json.dumps(newmanifest, sort_keys=True).encode('utf-8'))
+    return changed
+
+
+def _patch_shard(appdir, slugname, patch, tarpath):
+    """Return the content of the shard with the records of patch."""
+    path = shard_path(appdir, slugname)
+    if os.path.isfile(path):
+        with open(path, 'r') as fin:
+            compositedata = json.load(fin)
+    else:
+        with tarfile.open(tarpath, 'r:gz') as tar:
+            fin = tar.extractfile('json/' + slugname + '.json')
+            compositedata = json.loads(fin.read().decode('utf-8'))
+    for (verbform, records) in patch.items():
+        if records is None:
+            compositedata.pop(verbform, None)
+        else:
+            compositedata[verbform] = records
+    return json.dumps(compositedata).encode('utf-8')
+
+
+def extract_shards(tar, appdir):
+    """Extract the shards of the tar.gz into appdir.
+
+    Once appdir has a manifest, only the shards which it lists and
+    which are not extracted yet are, so that shards written by
+    ``apply_delta()`` are not overwritten and dropped shards do not
+    come back.
+    """
+    manifest = read_manifest(appdir)
+    if manifest is None:
+        tar.extractall(appdir)
+        return
+    for member in tar.getmembers():
+        slugname = os.path.basename(member.name)[:-len('.json')]
+        if member.isfile() and slugname in manifest['shards'] and \
+                not os.path.isfile(shard_path(appdir, slugname)):
+            tar.extract(member, appdir)
+
+
+def changed_shards(oldmanifest, newmanifest):
+    """Return shards whose hash differs between two manifests."""
+    if oldmanifest is None or newmanifest is None:
+        return None
+    slugnames = set(oldmanifest['shards']) | set(newmanifest['shards'])
+    return sorted(slugname for slugname in slugnames
+                  if oldmanifest['shards'].get(slugname) !=
+                  newmanifest['shards'].get(slugname))
+
+
+def invalidate(path):
+    """Forget the cached content of the JSON file at path."""
+    from .trie import read_trie_shard
+    read_json.cache.pop((path,), None)
+    read_shard.cache.pop((path,), None)
+    read_trie_shard.cache.pop((path,), None)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Exceptions raised by prakriya.
+
+All of them derive from ``PrakriyaError``, so that a caller serving
+many requests can catch bad input of one request and go on::
+
+    >>> from prakriya import Prakriya, PrakriyaError
+    >>> p = Prakriya()
+    >>> try:
+    ...     p['asdf']
+    ... except PrakriyaError as error:
+    ...     print(error)
+"""
+
+
+class PrakriyaError(Exception):
+    """Base class of the errors raised by prakriya."""
+
+
+class TransliterationError(PrakriyaError, ValueError):
+    """Raised for a transliteration scheme which is not supported."""
+
+    def __init__(self, tran):
+        """Keep the scheme."""
+        PrakriyaError.__init__(self, tran)
+        self.tran = tran
+
+    def __str__(self):
+        """Return the message."""
+        return 'Not a valid transliteration scheme: ' + repr(self.tran)
+
+
+class FormNotFoundError(PrakriyaError, KeyError):
+    """Raised when a verb form is not in the database.
+
+    It is a KeyError, as before it had a type of its own.
+    """
+
+    def __init__(self, verbform):
+        """Keep the verb form (in SLP1)."""
+        PrakriyaError.__init__(self, verbform)
+        self.verbform = verbform
+
+    def __str__(self):
+        """Return the message."""
+        return 'Verb form is not in our database: ' + self.verbform
+
+
+class ClusterError(PrakriyaError):
+    """Raised when a node of a lookup cluster fails to answer."""
+
+
+class VerbNotFoundError(PrakriyaError, KeyError):
+    """Raised when a verb is not in the database of VerbFormGenerator."""
+
+    def __init__(self, verb):
+        """Keep the verb (in SLP1)."""
+        PrakriyaError.__init__(self, verb)
+        self.verb = verb
+
+    def __str__(self):
+        """Return the message."""
+        return 'Verb is not in our database: ' + self.verb
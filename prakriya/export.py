@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Export the whole tinanta dataset to columnar files for analytics.
+
+Three tables are written.
+
+    ``forms`` - one row per derivation of a verb form, with every field
+    of ``Prakriya.get_info()`` but the derivation.
+
+    ``steps`` - one row per step of every derivation.
+
+    ``generated`` - one row per form of ``mapforms2.json``.
+
+Shards are read one at a time from the tar.gz (or the extracted JSON,
+if present), and rows are flushed every ``chunksize`` rows. Verb forms,
+which grow with the dataset, are not dictionary encoded; the
+dictionaries of the other string columns only hold values such as
+verbs, lakaras and sutras. So memory stays bounded whatever the number
+of verb forms.
+Nothing is downloaded.
+
+If pyarrow is installed, each table is a Parquet file with dictionary
+encoded string columns (but the verb forms). Otherwise each table is a
+directory with one file per column (see ``ColumnWriter``), readable by
+``read_table()``.
+
+Example
+-------
+
+    >>> from prakriya.export import export
+    >>> export('/path/to/outdir')
+"""
+import json
+import os
+import sys
+import tarfile
+from array import array
+from .utils import app_dir, read_json
+
+
+FORM_COLUMNS = ['form', 'record', 'verb', 'verbaccent', 'number', 'gana',
+                'lakara', 'purusha', 'vachana', 'suffix', 'meaning',
+                'upasarga', 'padadecider_id', 'padadecider_sutra', 'it_id',
+                'it_status', 'it_sutra', 'madhaviya', 'kshiratarangini',
+                'dhatupradipa', 'jnu', 'uohyd', 'steps']
+STEP_COLUMNS = ['form', 'record', 'step', 'sutra_num', 'step_form']
+GENERATED_COLUMNS = ['verb', 'number', 'lakara', 'suffix', 'form']
+# Columns which are integers.
+INTEGER_COLUMNS = set(['record', 'steps', 'step'])
+# String columns of verb forms, too many to keep a dictionary of. All
+# other columns are dictionary encoded strings.
+PLAIN_COLUMNS = set(['form', 'step_form'])
+
+
+class ColumnWriter():
+    """Write a table as a directory with one file per column.
+
+    String columns are dictionary encoded. ``<column>.dict`` has one
+    JSON string per line, and ``<column>.idx`` the index of every row's
+    value in it, as little endian unsigned 32 bit integers.
+    Columns of verb forms (``PLAIN_COLUMNS``) are stored in
+    ``<column>.txt`` as one JSON string per row.
+    Integer columns are stored in ``<column>.int`` as signed 32 bit
+    integers. ``schema.json`` has the columns and the number of rows.
+    """
+
+    def __init__(self, path, columns):
+        """Start an empty table."""
+        if not os.path.exists(path):
+            os.makedirs(path)
+        self.path = path
+        self.columns = columns
+        self.rows = 0
+        self.codes = dict((column, {}) for column in columns
+                          if column not in PLAIN_COLUMNS)
+        self.files = {}
+        for column in columns:
+            if column in INTEGER_COLUMNS:
+                self.files[column] = open(os.path.join(path, column + '.int'),
+                                          'wb')
+            elif column in PLAIN_COLUMNS:
+                self.files[column] = open(os.path.join(path, column + '.txt'),
+                                          'w')
+            else:
+                self.files[column] = open(os.path.join(path, column + '.idx'),
+                                          'wb')
+                self.files[column + '.dict'] = open(
+                    os.path.join(path, column + '.dict'), 'w')
+
+    def write(self, chunk):
+        """Append a dict of column -> list of values."""
+        for column in self.columns:
+            if column in PLAIN_COLUMNS:
+                self.files[column].writelines(json.dumps(value) + '\n'
+                                              for value in chunk[column])
+                continue
+            if column in INTEGER_COLUMNS:
+                values = array('i', chunk[column])
+            else:
+                codes = self.codes[column]
+                values = array('I')
+                for value in chunk[column]:
+                    if value not in codes:
+                        codes[value] = len(codes)
+                        self.files[column + '.dict'].write(
+                            json.dumps(value) + '\n')
+                    values.append(codes[value])
+            if sys.byteorder == 'big':
+                values.byteswap()
+            values.tofile(self.files[column])
+        self.rows += len(chunk[self.columns[0]])
+
+    def close(self):
+        """Close the files and write the schema."""
+        for fout in self.files.values():
+            fout.close()
+        with open(os.path.join(self.path, 'schema.json'), 'w') as fout:
+            json.dump({'columns': self.columns, 'rows': self.rows}, fout)
+
+
+class ParquetWriter():
+    """Write a table as a Parquet file with pyarrow."""
+
+    def __init__(self, path, columns):
+        """Start the file."""
+        import pyarrow
+        import pyarrow.parquet
+        self.pyarrow = pyarrow
+        self.columns = columns
+        fields = []
+        for column in columns:
+            if column in INTEGER_COLUMNS:
+                fields.append(pyarrow.field(column, pyarrow.int32()))
+            elif column in PLAIN_COLUMNS:
+                fields.append(pyarrow.field(column, pyarrow.string()))
+            else:
+                fields.append(pyarrow.field(
+                    column, pyarrow.dictionary(pyarrow.int32(),
+                                               pyarrow.string())))
+        self.schema = pyarrow.schema(fields)
+        self.writer = pyarrow.parquet.ParquetWriter(path + '.parquet',
+                                                    self.schema)
+
+    def write(self, chunk):
+        """Append a dict of column -> list of values as a row group."""
+        arrays = []
+        for column in self.columns:
+            if column in INTEGER_COLUMNS:
+                arrays.append(self.pyarrow.array(chunk[column],
+                                                 self.pyarrow.int32()))
+            elif column in PLAIN_COLUMNS:
+                arrays.append(self.pyarrow.array(chunk[column],
+                                                 self.pyarrow.string()))
+            else:
+                arrays.append(self.pyarrow.array(
+                    chunk[column], self.pyarrow.string()).dictionary_encode())
+        self.writer.write_table(self.pyarrow.Table.from_arrays(
+            arrays, schema=self.schema))
+
+    def close(self):
+        """Close the file."""
+        self.writer.close()
+
+
+class Table():
+    """Buffer rows of a table and flush them to a writer in chunks."""
+
+    def __init__(self, writer, chunksize):
+        """Start with an empty buffer."""
+        self.writer = writer
+        self.chunksize = chunksize
+        self.chunk = dict((column, []) for column in writer.columns)
+        self.size = 0
+
+    def append(self, row):
+        """Add a row, given as a dict."""
+        for column in self.writer.columns:
+            self.chunk[column].append(row.get(column, ''))
+        self.size += 1
+        if self.size >= self.chunksize:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered rows."""
+        if self.size:
+            self.writer.write(self.chunk)
+        self.chunk = dict((column, []) for column in self.writer.columns)
+        self.size = 0
+
+    def close(self):
+        """Flush and close."""
+        self.flush()
+        self.writer.close()
+
+
+def iter_shards(appdir):
+    """Yield (slugname, data) of every shard, one at a time.
+
+    Extracted (and possibly updated) JSON files are preferred
+    over the copies in the tar.gz.
+    """
+    jsondir = os.path.join(appdir, 'json')
+    tarpath = os.path.join(appdir, 'composite_v003.tar.gz')
+    seen = set()
+    if os.path.isfile(tarpath):
+        # Stream the tar file, so that it is read only once.
+        with tarfile.open(tarpath, 'r|gz') as tar:
+            for member in tar:
+                if not member.isfile() or not member.name.endswith('.json'):
+                    continue
+                slugname = os.path.basename(member.name)[:-len('.json')]
+                seen.add(slugname)
+                path = os.path.join(jsondir, slugname + '.json')
+                if os.path.isfile(path):
+                    with open(path, 'r') as fin:
+                        yield (slugname, json.load(fin))
+                else:
+                    content = tar.extractfile(member).read()
+                    yield (slugname, json.loads(content.decode('utf-8')))
+    # Shards which are only on the disk, e.g. added by a delta.
+    if os.path.isdir(jsondir):
+        for filename in sorted(os.listdir(jsondir)):
+            slugname = filename[:-len('.json')]
+            if filename.endswith('.json') and slugname not in seen:
+                with open(os.path.join(jsondir, filename), 'r') as fin:
+                    yield (slugname, json.load(fin))
+
+
+def export(outdir, appdir=None, fmt='auto', chunksize=100000):
+    """Export forms, steps and generated tables to outdir.
+
+    ``fmt`` is ``parquet``, ``columns`` or ``auto``
+    (parquet if pyarrow is installed).
+    Returns the number of rows written to each table.
+    """
+    if appdir is None:
+        appdir = app_dir('prakriya')
+    if fmt == 'auto':
+        try:
+            import pyarrow.parquet  # noqa: F401
+            fmt = 'parquet'
+        except ImportError:
+            fmt = 'columns'
+    if fmt == 'parquet':
+        writerclass = ParquetWriter
+    else:
+        writerclass = ColumnWriter
+    if not os.path.exists(outdir):
+        os.makedirs(outdir)
+    forms = Table(writerclass(os.path.join(outdir, 'forms'), FORM_COLUMNS),
+                  chunksize)
+    steps = Table(writerclass(os.path.join(outdir, 'steps'), STEP_COLUMNS),
+                  chunksize)
+    counts = {'forms': 0, 'steps': 0, 'generated': 0}
+    for (slugname, compositedata) in iter_shards(appdir):
+        for verbform in sorted(compositedata):
+            for (record, datum) in enumerate(compositedata[verbform]):
+                row = dict((key, value) for (key, value) in datum.items()
+                           if key != 'derivation')
+                derivation = datum.get('derivation', [])
+                row.update({'form': verbform, 'record': record,
+                            'steps': len(derivation)})
+                forms.append(row)
+                counts['forms'] += 1
+                for (step, member) in enumerate(derivation):
+                    steps.append({'form': verbform, 'record': record,
+                                  'step': step,
+                                  'sutra_num': member['sutra_num'],
+                                  'step_form': member['form']})
+                    counts['steps'] += 1
+    forms.close()
+    steps.close()
+    mapjson = os.path.join(appdir, 'mapforms2.json')
+    if os.path.isfile(mapjson):
+        generated = Table(writerclass(os.path.join(outdir, 'generated'),
+                                      GENERATED_COLUMNS), chunksize)
+        for (verb, numbers) in read_json(mapjson).items():
+            for (number, lakaras) in numbers.items():
+                for (lakara, suffices) in lakaras.items():
+                    for (suffix, verbforms) in suffices.items():
+                        for verbform in verbforms:
+                            generated.append({'verb': verb,
+                                              'number': number,
+                                              'lakara': lakara,
+                                              'suffix': suffix,
+                                              'form': verbform})
+                            counts['generated'] += 1
+        generated.close()
+    return counts
+
+
+def read_table(path, columns=None):
+    """Read a table written by ColumnWriter as a dict of column -> list."""
+    with open(os.path.join(path, 'schema.json'), 'r') as fin:
+        schema = json.load(fin)
+    result = {}
+    for column in columns or schema['columns']:
+        if column in PLAIN_COLUMNS:
+            with open(os.path.join(path, column + '.txt'), 'r') as fin:
+                result[column] = [json.loads(line) for line in fin]
+            continue
+        if column in INTEGER_COLUMNS:
+            values = array('i')
+            with open(os.path.join(path, column + '.int'), 'rb') as fin:
+                values.fromfile(fin, schema['rows'])
+        else:
+            values = array('I')
+            with open(os.path.join(path, column + '.idx'), 'rb') as fin:
+                values.fromfile(fin, schema['rows'])
+        if sys.byteorder == 'big':
+            values.byteswap()
+        if column in INTEGER_COLUMNS:
+            result[column] = values.tolist()
+        else:
+            with open(os.path.join(path, column + '.dict'), 'r') as fin:
+                dictionary = [json.loads(line) for line in fin]
+            result[column] = [dictionary[code] for code in values]
+    return result
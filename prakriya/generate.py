@@ -2,9 +2,11 @@
 # -*- coding: utf-8 -*-
 """Create a python library which gives derivation for given verb and tense."""
 import os.path
-import sys
 import json
-from .utils import app_dir, read_json, convert
+from collections.abc import Mapping
+from .utils import app_dir, read_json, convert, check_translit
+from .exceptions import PrakriyaError, VerbNotFoundError
+from .exceptions import FormNotFoundError
 # import datetime
 
 
@@ -34,6 +36,15 @@ class VerbFormGenerator():
 
         __getitem__ method is discouraged. Will be deprecated in later versions.
 
+    Without purusha and vachana or suffix, getforms returns a read only
+    ``FormsView`` of all forms of the verb (or of the lakara). Only the
+    parts which are read are transliterated. ``materialize()`` returns
+    plain dicts, e.g. for ``json.dumps``.
+
+        >>> forms = g.getforms('BU')
+        >>> forms['1.0001']['law']['tip']
+        >>> forms.materialize()
+
 
     transliteration
     ---------------
@@ -46,6 +57,11 @@ class VerbFormGenerator():
       >>> g.output_translit('devanagari') # Customize 'devanagari'
       >>> g.getforms('bhU', 'laT', 'prathama', 'bahu') # Input in HK and output in Devanagari.
 
+    Transliterations can also be given for a single call.
+    They do not change the transliterations set on the object.
+
+      >>> g.getforms('bhU', 'laT', 'prathama', 'bahu', intran='hk', outtran='iast')
+
     Valid transliterations are slp1, itrans, hk, iast, devanagari, wx, bengali,
     gujarati, gurmukhi, kannada, malayalam, oriya and telugu.
     They can be used both as input transliteration and output transliteration.
@@ -64,6 +80,8 @@ class VerbFormGenerator():
                            'gurmukhi', 'kannada', 'malayalam', 'oriya',
                            'telugu', 'tamil']
         self.appdir = app_dir('prakriya')
+        # Set to a prakriya.telemetry.Telemetry object to count requests.
+        self.telemetry = None
         self.intran = 'slp1'
         self.outtran = 'slp1'
         self.mapform = 'mapforms2.json'
@@ -90,32 +108,50 @@ class VerbFormGenerator():
 
     def input_translit(self, tran):
         """Set input transliteration."""
-        # If valid transliteration, set transliteration.
-        if tran in self.validtrans:
-            self.intran = tran
-        # If not valid, throw error.
-        else:
-            print('Error. Not a valid transliteration scheme.')
-            exit(0)
+        # If not valid, raise TransliterationError.
+        check_translit(tran, self.validtrans)
+        self.intran = tran
 
     def output_translit(self, tran):
         """Set output transliteration."""
-        # If valid transliteration, set transliteration.
-        if tran in self.validtrans:
-            self.outtran = tran
-        # If not valid, throw error.
-        else:
-            print('Error. Not a valid transliteration scheme.')
-            exit(0)
+        # If not valid, raise TransliterationError.
+        check_translit(tran, self.validtrans)
+        self.outtran = tran
+
+    def memory_report(self, top=10):
+        """Return sizes of the data and caches of this object.
 
-    def getforms(self, inputverb, lakara='', purusha='', vachana='', suffix=''):
-        """Get verb form data for given input."""
+        See ``prakriya.memory.memory_report()``.
+        """
+        from .memory import memory_report
+        return memory_report(generator=self, top=top)
+
+    def getforms(self, inputverb, lakara='', purusha='', vachana='', suffix='',
+                 intran=None, outtran=None):
+        """Get verb form data for given input.
+
+        ``intran`` and ``outtran`` override the input and output
+        transliteration for this call only.
+        Raises VerbNotFoundError if the verb is not in the database,
+        FormNotFoundError if it has no form in the lakara,
+        and TransliterationError for an invalid transliteration.
+        """
+        if intran is None:
+            intran = self.intran
+        else:
+            check_translit(intran, self.validtrans)
+        if outtran is None:
+            outtran = self.outtran
+        else:
+            check_translit(outtran, self.validtrans)
         # Change the transliteration to SLP1.
-        inputverb = convert(inputverb, self.intran, 'slp1')
-        lakara = convert(lakara, self.intran, 'slp1')
-        suffix = convert(suffix, self.intran, 'slp1')
-        purusha = convert(purusha, self.intran, 'slp1')
-        vachana = convert(vachana, self.intran, 'slp1')
+        inputverb = convert(inputverb, intran, 'slp1')
+        lakara = convert(lakara, intran, 'slp1')
+        suffix = convert(suffix, intran, 'slp1')
+        purusha = convert(purusha, intran, 'slp1')
+        vachana = convert(vachana, intran, 'slp1')
+        if self.telemetry is not None:
+            self.telemetry.request(inputverb, lakara, purusha, vachana, suffix)
         suffices = ['']
         # Get suffices
         if suffix in self.validsuffices:
@@ -129,17 +165,54 @@ class VerbFormGenerator():
         elif inputverb in self.verbmap:
             verbs = self.verbmap[inputverb]
         else:
-            print('Verb is not in our database. Sorry!')
-            exit(0)
+            raise VerbNotFoundError(inputverb)
         for verb in verbs:
             wholeresult = self.data[verb]
-        output = self._remove_unnecessary(wholeresult, lakara, suffices)
+        try:
+            output = self._remove_unnecessary(wholeresult, lakara, suffices)
+        except KeyError:
+            # No form of the verb in this lakara.
+            raise FormNotFoundError(inputverb + ' ' + lakara)
+        if suffices == ['']:
+            # Whole verb or whole lakara. Transliterate what is read.
+            return FormsView(output, outtran)
         # Transliterate the output
         outputstr = json.dumps(output)
-        outputstr = convert(outputstr, 'slp1', self.outtran)
+        outputstr = convert(outputstr, 'slp1', outtran)
         output = json.loads(outputstr)
         return output
 
+    def batch_forms(self, queries, intran=None, outtran=None,
+                    errors='raise'):
+        """Yield (query, result) for every query in queries.
+
+        A query is a tuple of arguments of ``getforms()``, i.e.
+        (verb, lakara, purusha, vachana) or (verb, lakara, suffix).
+        ``intran`` and ``outtran`` are as in ``getforms()``.
+        ``errors`` - ``raise`` raises the PrakriyaError of a bad query.
+        ``record`` yields the error in place of its result and goes on.
+        """
+        if errors not in ('raise', 'record'):
+            raise ValueError("errors is 'raise' or 'record'")
+        # Bad transliterations fail the whole batch at once.
+        for tran in [intran, outtran]:
+            if tran is not None:
+                check_translit(tran, self.validtrans)
+        for query in queries:
+            try:
+                if len(query) == 3:
+                    result = self.getforms(query[0], query[1],
+                                           suffix=query[2], intran=intran,
+                                           outtran=outtran)
+                else:
+                    result = self.getforms(*query, intran=intran,
+                                           outtran=outtran)
+            except PrakriyaError as error:
+                if errors == 'raise':
+                    raise
+                result = error
+            yield (query, result)
+
     def _remove_unnecessary(self, wholeresult, lakara='', suffices=['']):
         """Remove redundant data."""
         output = {}
@@ -160,22 +233,15 @@ class VerbFormGenerator():
         arguments = ''
         # print(datetime.datetime.now())
         # If there is only one entry in items, it is treated as verb.
-        if isinstance(items, ("".__class__, u"".__class__)):
+        if isinstance(items, str):
             inputverb = items
         else:
             # Otherwise, first is verbform and the next is argument1.
             inputverb = items[0]
-            # py2
-            if len(items) > 1 and sys.version_info[0] < 3:
-                arguments = [convert(member.decode(
-                    'utf-8'), self.intran, 'slp1') for member in items[1:]]
-            # py3
-            elif len(items) > 1:
+            if len(items) > 1:
                 arguments = [convert(member, self.intran, 'slp1')
                              for member in items[1:]]
             # Convert verbform from desired input transliteration to SLP1.
-            if sys.version_info[0] < 3:
-                inputverb = inputverb.decode('utf-8')
             inputverb = convert(inputverb, self.intran, 'slp1')
             # Enter user defined values
             for member in arguments:
@@ -195,10 +261,13 @@ class VerbFormGenerator():
         elif inputverb in self.verbmap:
             verbs = self.verbmap[inputverb]
         else:
-            print('Verb is not in our database. Sorry!')
-            exit(0)
+            raise VerbNotFoundError(inputverb)
         for verb in verbs:
             wholeresult = self.data[verb]
+            if 'tense' in vars() and any(tense not in wholeresult[verb_num]
+                                         for verb_num in wholeresult):
+                # No form of the verb in this lakara, as in getforms().
+                raise FormNotFoundError(inputverb + ' ' + tense)
             for verb_num in wholeresult:
                 # Tense not specified. Return whole data
                 if 'tense' not in vars():
@@ -241,3 +310,57 @@ def getsuffix(purusha, vachana):
     elif purusha == 'uttama' and vachana == 'bahu':
         result = ['mas', 'mahiN']
     return result
+
+
+class FormsView(Mapping):
+    """Read only view of forms of VerbFormGenerator in a transliteration.
+
+    ``data`` is the nested dict of forms in SLP1. Keys and forms are
+    transliterated to ``outtran`` when they are read. A view is equal
+    to the dict which ``materialize()`` returns.
+    """
+
+    __slots__ = ('data', 'outtran', '_keys')
+
+    def __init__(self, data, outtran='slp1'):
+        """Keep the data. Nothing is transliterated yet."""
+        self.data = data
+        self.outtran = outtran
+        self._keys = None
+
+    def _keymap(self):
+        """Return {transliterated key: key in SLP1}."""
+        if self._keys is None:
+            self._keys = dict((convert(key, 'slp1', self.outtran), key)
+                              for key in self.data)
+        return self._keys
+
+    def __getitem__(self, key):
+        """Return the transliterated value of key."""
+        value = self.data[self._keymap()[key]]
+        if isinstance(value, dict):
+            return FormsView(value, self.outtran)
+        return [convert(form, 'slp1', self.outtran) for form in value]
+
+    def __iter__(self):
+        """Iterate over the transliterated keys."""
+        return iter(self._keymap())
+
+    def __len__(self):
+        """Return the number of keys."""
+        return len(self._keymap())
+
+    def __repr__(self):
+        """Return the repr of the materialized dict."""
+        return repr(self.materialize())
+
+    def materialize(self):
+        """Return the whole view as plain dicts and lists."""
+        return materialize(self)
+
+
+def materialize(value):
+    """Return value with every FormsView in it made a plain dict."""
+    if isinstance(value, FormsView):
+        return dict((key, materialize(value[key])) for key in value)
+    return value
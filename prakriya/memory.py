@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Report how much memory the datasets and caches of prakriya take.
+
+Sizes are deep sizes: an object and everything reachable from it,
+each object counted once. The size of a component includes objects
+it shares with other components (e.g. interned strings). ``total``
+counts such objects once.
+
+If ``tracemalloc`` is tracing, the report also has the traced memory
+and the source lines which allocated most of it. Start tracing before
+the data is loaded for this to be of use::
+
+    $ python -X tracemalloc=1 ...
+
+Example
+-------
+
+    >>> from prakriya import Prakriya
+    >>> p = Prakriya()
+    >>> p['Bavati']
+    >>> p.memory_report()
+"""
+import os
+import sys
+import tracemalloc
+from .bloom import BloomFilter
+from .reshard import ShardIndex
+from .trie import TrieDerivation, read_trie_shard
+from .utils import convert, read_json, read_shard
+
+
+def deep_sizeof(obj, seen=None):
+    """Return bytes taken by obj and the objects it holds.
+
+    Objects whose id is in ``seen`` are skipped, and every counted
+    object is added to it, so that it can be shared between calls.
+    """
+    if seen is None:
+        seen = set()
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif isinstance(obj, (TrieDerivation, BloomFilter, ShardIndex)):
+            stack.extend(getattr(obj, name) for name in
+                         getattr(obj, '__slots__', ()))
+            stack.extend(getattr(obj, '__dict__', {}).values())
+    return size
+
+
+def rss():
+    """Return resident set size of this process in bytes, None if unknown."""
+    try:
+        with open('/proc/self/statm', 'r') as fin:
+            pages = int(fin.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, AttributeError):
+        return None
+
+
+def memory_report(prakriya=None, generator=None, top=10):
+    """Return sizes of datasets and caches.
+
+    ``prakriya`` and ``generator`` are Prakriya and VerbFormGenerator
+    objects whose data is reported. Module level caches are always
+    reported.
+
+    Returns a dict with
+
+        ``components`` - list of {name, bytes, entries}.
+
+        ``total`` - bytes of all components, shared objects counted once.
+
+        ``top_shards`` - [path, bytes] of the ``top`` largest cached
+        shards. Shards of the same name in different stores (plain,
+        trie or sized shards) are apart.
+
+        ``rss`` - resident set size of the process.
+
+        ``traced`` - {current, peak, top: [[source line, bytes]]} if
+        tracemalloc is tracing, else None.
+    """
+    # Before sizing, which allocates memory of its own.
+    traced = None
+    if tracemalloc.is_tracing():
+        (current, peak) = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)])
+        traced = {'current': current, 'peak': peak,
+                  'top': [[str(stat.traceback), stat.size] for stat
+                          in snapshot.statistics('lineno')[:top]]}
+    components = []
+    if prakriya is not None:
+        components.extend([('sutrainfo', prakriya.sutrainfo),
+                           ('jsonindex', prakriya.jsonindex),
+                           ('missing', prakriya.missing),
+                           ('bloom', prakriya.bloom),
+                           ('shardindex', prakriya.shardindex)])
+    if generator is not None:
+        components.extend([('mapforms', generator.data),
+                           ('verbmap', generator.verbmap)])
+    shards = {}
+    for cache in [read_shard.cache, read_trie_shard.cache]:
+        for ((path,), data) in cache.items():
+            shards[path] = data
+    # Files read with read_json, other than the ones above.
+    listed = set(id(obj) for (name, obj) in components)
+    jsonfiles = dict((path, data) for ((path,), data)
+                     in read_json.cache.items() if id(data) not in listed)
+    components.extend([('shards', list(shards.values())),
+                       ('read_json', list(jsonfiles.values())),
+                       ('convert', convert.cache)])
+    report = {'components': [], 'total': 0}
+    allseen = set()
+    for (name, obj) in components:
+        entries = 0
+        if obj is not None:
+            entries = obj.count if name == 'bloom' else len(obj)
+        report['components'].append({'name': name,
+                                     'bytes': deep_sizeof(obj),
+                                     'entries': entries})
+        report['total'] += deep_sizeof(obj, allseen)
+    sizes = [[path, deep_sizeof(data)] for (path, data) in shards.items()]
+    sizes.sort(key=lambda item: item[1], reverse=True)
+    report['top_shards'] = sizes[:top]
+    report['rss'] = rss()
+    report['traced'] = traced
+    return report
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Cut the dataset into shards of bounded size, by sorted key ranges.
+
+``jsonindex.json`` puts every verb form in the shard of its first three
+letters, so that a few common prefixes make huge shards, which are
+slow to parse and take much of the cache. Here the verb forms are
+sorted and cut into ranges of at most ``maxsize`` bytes of JSON (a
+verb form larger than that gets a shard of its own). A cold lookup
+then reads at most one shard of that size, and the cache holds shards
+of about the same size.
+
+The shards live in ``shards`` in the data directory.
+
+    ``shards/json/<number>.json`` - shards as usual.
+
+    ``shards/shardindex.json`` - ``{"maxsize": maxsize, "firsts":
+    [first verb form of every shard], "shards": [name of every
+    shard]}``, sorted by first verb form. The shard of a verb form is
+    found by binary search in ``firsts``.
+
+Run it again after an update. ``prakriya-update`` does so if the shards
+exist.
+
+Example
+-------
+
+    >>> from prakriya import Prakriya
+    >>> from prakriya.reshard import reshard
+    >>> reshard(maxsize=256 * 1024)   # Once, takes a while.
+    >>> p = Prakriya()
+    >>> p.use_sized_shards()
+"""
+import bisect
+import json
+import os
+import shutil
+from .export import iter_shards
+from .utils import app_dir
+
+
+INDEXFILE = 'shardindex.json'
+MAXSIZE = 256 * 1024
+
+
+class ShardIndex():
+    """Find the shard of a verb form by binary search of first forms."""
+
+    def __init__(self, firsts, shards):
+        """Keep the sorted first forms and the names of the shards."""
+        self.firsts = firsts
+        self.shards = shards
+
+    def slug(self, verbform):
+        """Return the name of the shard which may hold verbform."""
+        index = bisect.bisect_right(self.firsts, verbform) - 1
+        return self.shards[max(index, 0)]
+
+    def __len__(self):
+        """Return the number of shards."""
+        return len(self.shards)
+
+
+def read_shard_index(directory):
+    """Return the ShardIndex of the shards in directory."""
+    with open(os.path.join(directory, INDEXFILE), 'r') as fin:
+        index = json.load(fin)
+    return ShardIndex(index['firsts'], index['shards'])
+
+
+def boundaries(sizes, maxsize=MAXSIZE):
+    """Return the indices in sizes where shards start.
+
+    sizes are the sizes of the sorted verb forms. A shard is closed
+    before a verb form which would take it past maxsize.
+    """
+    starts = []
+    total = 0
+    for (index, size) in enumerate(sizes):
+        if not starts or total + size > maxsize:
+            starts.append(index)
+            total = 0
+        total += size
+    return starts
+
+
+def reshard(appdir=None, outdir=None, maxsize=MAXSIZE):
+    """Write the shards of at most maxsize bytes, and their index.
+
+    Reads the shards twice, and keeps only the sizes of the verb forms
+    and the shards being written in memory.
+    Returns the number of shards and the size of the largest one,
+    before and after.
+    """
+    if appdir is None:
+        appdir = app_dir('prakriya')
+    if outdir is None:
+        outdir = os.path.join(appdir, 'shards')
+    # Size and old shard of every verb form.
+    sizes = {}
+    oldsizes = {}
+    for (slugname, compositedata) in iter_shards(appdir):
+        for (verbform, data) in compositedata.items():
+            sizes[verbform] = (len(json.dumps(data)), slugname)
+        oldsizes[slugname] = sum(sizes[verbform][0]
+                                 for verbform in compositedata)
+    verbforms = sorted(sizes)
+    starts = boundaries([sizes[verbform][0] for verbform in verbforms],
+                        maxsize)
+    firsts = [verbforms[start] for start in starts]
+    names = ['%05d' % number for number in range(len(starts))]
+    # Old shards which still have to be read for every new shard.
+    pending = [set() for name in names]
+    newsizes = [0] * len(names)
+    for (position, verbform) in enumerate(verbforms):
+        number = bisect.bisect_right(starts, position) - 1
+        pending[number].add(sizes[verbform][1])
+        newsizes[number] += sizes[verbform][0]
+    tmpdir = outdir + '.tmp'
+    if os.path.exists(tmpdir):
+        shutil.rmtree(tmpdir)
+    os.makedirs(os.path.join(tmpdir, 'json'))
+    buffers = {}
+    for (slugname, compositedata) in iter_shards(appdir):
+        touched = set()
+        for (verbform, data) in compositedata.items():
+            number = bisect.bisect_right(firsts, verbform) - 1
+            buffers.setdefault(number, {})[verbform] = data
+            touched.add(number)
+        for number in touched:
+            pending[number].discard(slugname)
+            if not pending[number]:
+                path = os.path.join(tmpdir, 'json', names[number] + '.json')
+                with open(path, 'w') as fout:
+                    json.dump(buffers.pop(number), fout)
+    with open(os.path.join(tmpdir, INDEXFILE), 'w') as fout:
+        json.dump({'maxsize': maxsize, 'firsts': firsts, 'shards': names},
+                  fout)
+    if os.path.exists(outdir):
+        shutil.rmtree(outdir)
+    os.rename(tmpdir, outdir)
+    return {'before': {'shards': len(oldsizes),
+                       'largest': max(oldsizes.values() or [0])},
+            'after': {'shards': len(names), 'largest': max(newsizes or [0])}}
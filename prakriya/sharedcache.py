@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Cache of rendered results in shared memory, for all processes of a host.
+
+Every process has its own caches of shards and transliterations, so
+that each of many worker processes renders the same hot forms again.
+A ``SharedCache`` is a fixed size arena in shared memory which all of
+them read and write. A result rendered by one worker is then read by
+the others without reading its shard.
+
+The arena is a header followed by ``slots`` slots of ``slotsize`` bytes.
+Slots are grouped in sets of ``WAYS``. A key can only be in the set
+given by its hash, and a new key in a full set evicts the oldest one.
+A slot holds the key and the result as JSON, after a header with a
+sequence number, the hash of the key, the length and a checksum.
+
+There are no locks between processes. A writer makes the sequence
+number odd while it writes and even again after. A reader takes a slot
+only if the sequence number is even and unchanged after reading, and
+the checksum and key match; otherwise it is a miss. Two processes
+writing the same slot at once make it a miss, not a wrong result.
+
+Needs Python 3.8 or later (``multiprocessing.shared_memory``); on
+Python 3.7 ``SharedCache`` raises PrakriyaError.
+
+Example
+-------
+
+In the parent process::
+
+    >>> from prakriya.sharedcache import SharedCache
+    >>> cache = SharedCache('prakriya', slots=65536)
+
+In every worker::
+
+    >>> from prakriya import Prakriya
+    >>> p = Prakriya()
+    >>> p.use_shared_cache('prakriya')
+
+When all are done, in the parent::
+
+    >>> cache.close()
+    >>> cache.unlink()
+"""
+import hashlib
+import json
+import struct
+import sys
+import time
+import zlib
+from .exceptions import PrakriyaError
+
+
+# magic, layout version, slots, slotsize, pid of the resource tracker
+# of the creator.
+HEADER = struct.Struct('<4sIIII')
+HEADERSIZE = 64
+MAGIC = b'PRKC'
+# sequence number, length of key, hash of key, length of key and
+# result, checksum of key and result, time of writing.
+SLOT = struct.Struct('<IIQIId')
+SEQUENCE = struct.Struct('<I')
+# Slots in which a key may be.
+WAYS = 4
+
+
+def key_hash(key):
+    """Return a hash of key (bytes), the same in every process."""
+    digest = hashlib.blake2b(key, digest_size=8).digest()
+    return int.from_bytes(digest, 'little') | 1
+
+
+def tracker_pid():
+    """Return the pid of the resource tracker of this process."""
+    from multiprocessing import resource_tracker
+    resource_tracker.ensure_running()
+    return getattr(resource_tracker._resource_tracker, '_pid', None) or 0
+
+
+def attach(name):
+    """Return the existing shared memory of name, None if there is none.
+
+    Only the creator of the memory unlinks it.
+    """
+    from multiprocessing import shared_memory, resource_tracker
+    try:
+        try:
+            return shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            memory = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return None
+    # Before Python 3.13, the resource tracker of a process unlinks
+    # what the process attached to when it exits. Take it back from
+    # the tracker, unless it is the tracker of the creator (which is
+    # shared by forked processes).
+    if memory.size < HEADERSIZE or \
+            HEADER.unpack_from(memory.buf, 0)[4] != tracker_pid():
+        resource_tracker.unregister(memory._name, 'shared_memory')
+    return memory
+
+
+class SharedCache():
+    """Fixed size cache of JSON values in shared memory.
+
+    Attaches to the cache called ``name`` if there is one. Otherwise it
+    is created with ``slots`` slots of ``slotsize`` bytes (a random
+    name if ``name`` is None). Values larger than a slot are not kept.
+    ``hits``, ``misses`` and ``toolarge`` count the calls of this
+    process.
+    """
+
+    def __init__(self, name=None, slots=16384, slotsize=4096):
+        """Attach to or create the arena."""
+        if sys.version_info < (3, 8):
+            raise PrakriyaError('A shared cache needs Python 3.8 or later.')
+        from multiprocessing import shared_memory
+        memory = attach(name) if name is not None else None
+        self.owner = memory is None
+        if memory is None:
+            slots = max(WAYS, slots - slots % WAYS)
+            memory = shared_memory.SharedMemory(
+                name=name, create=True, size=HEADERSIZE + slots * slotsize)
+            HEADER.pack_into(memory.buf, 0, MAGIC, 1, slots, slotsize,
+                             tracker_pid())
+        (magic, version, slots, slotsize,
+         tracker) = HEADER.unpack_from(memory.buf, 0)
+        if magic != MAGIC or version != 1:
+            memory.close()
+            raise ValueError(repr(name) + ' is not a shared cache.')
+        self.memory = memory
+        self.name = memory.name
+        self.buf = memory.buf
+        self.slots = slots
+        self.slotsize = slotsize
+        self.hits = 0
+        self.misses = 0
+        self.toolarge = 0
+
+    def _offsets(self, keyhash):
+        """Return the offsets of the slots in which keyhash may be."""
+        first = keyhash % (self.slots // WAYS) * WAYS
+        return [HEADERSIZE + (first + way) * self.slotsize
+                for way in range(WAYS)]
+
+    def get(self, key):
+        """Return the value of key (a string), None if not cached."""
+        key = key.encode('utf-8')
+        keyhash = key_hash(key)
+        buf = self.buf
+        for offset in self._offsets(keyhash):
+            (sequence, keylength, slothash, length, checksum,
+             written) = SLOT.unpack_from(buf, offset)
+            if slothash != keyhash or sequence & 1 or \
+                    length > self.slotsize - SLOT.size:
+                continue
+            start = offset + SLOT.size
+            payload = bytes(buf[start:start + length])
+            if SEQUENCE.unpack_from(buf, offset)[0] != sequence or \
+                    zlib.crc32(payload) != checksum or \
+                    payload[:keylength] != key:
+                continue
+            self.hits += 1
+            return json.loads(payload[keylength:].decode('utf-8'))
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        """Keep value (JSON serializable) for key (a string).
+
+        Returns False if the value does not fit in a slot.
+        """
+        key = key.encode('utf-8')
+        payload = key + json.dumps(value, separators=(',', ':'),
+                                   ensure_ascii=False).encode('utf-8')
+        if len(payload) > self.slotsize - SLOT.size:
+            self.toolarge += 1
+            return False
+        keyhash = key_hash(key)
+        buf = self.buf
+        # The slot of the key, else an empty one, else the oldest.
+        chosen = None
+        for offset in self._offsets(keyhash):
+            slot = SLOT.unpack_from(buf, offset)
+            if slot[2] == keyhash:
+                chosen = offset
+                break
+            if chosen is None or slot[5] < SLOT.unpack_from(buf, chosen)[5]:
+                chosen = offset
+        offset = chosen
+        sequence = SEQUENCE.unpack_from(buf, offset)[0]
+        sequence = (sequence + 1 + sequence % 2) & 0xffffffff
+        # Odd while writing.
+        SEQUENCE.pack_into(buf, offset, sequence | 1)
+        start = offset + SLOT.size
+        buf[start:start + len(payload)] = payload
+        SLOT.pack_into(buf, offset, sequence | 1, len(key), keyhash,
+                       len(payload), zlib.crc32(payload), time.time())
+        SEQUENCE.pack_into(buf, offset, (sequence + 1) & 0xfffffffe)
+        return True
+
+    def clear(self):
+        """Forget every value."""
+        size = self.slots * self.slotsize
+        self.buf[HEADERSIZE:HEADERSIZE + size] = bytes(size)
+
+    def close(self):
+        """Detach this process from the arena."""
+        self.buf = None
+        self.memory.close()
+
+    def unlink(self):
+        """Free the arena when all processes have closed it."""
+        self.memory.unlink()
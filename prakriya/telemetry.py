@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Count which shards and forms are used, to size caches and prewarm."""
+import json
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+
+
+class Telemetry():
+    """Keep hit counts and cold load costs of shards and forms.
+
+    Example
+    -------
+
+    Attach a Telemetry object to Prakriya and / or VerbFormGenerator::
+
+        >>> from prakriya import Prakriya, VerbFormGenerator
+        >>> from prakriya.telemetry import Telemetry, recommend_cache_budget
+        >>> t = Telemetry('/path/to/telemetry.json', interval=60)
+        >>> p = Prakriya()
+        >>> p.telemetry = t
+        >>> g = VerbFormGenerator()
+        >>> g.telemetry = t
+
+    Counts are written to the file every ``interval`` seconds
+    (checked on every hit) and whenever ``export()`` is called.
+    The exported file can be given to ``Prakriya.prewarm(logfile=...)``.
+
+        >>> recommend_cache_budget('/path/to/telemetry.json', coverage=0.95)
+
+    When no Telemetry object is attached, nothing is counted.
+    A Telemetry object may be shared by threads.
+    """
+
+    def __init__(self, path=None, interval=60):
+        """Start with empty counters."""
+        self.path = path
+        self.interval = interval
+        self.shard_hits = Counter()
+        self.form_hits = Counter()
+        self.request_hits = Counter()
+        self.cold_loads = Counter()
+        self.cold_seconds = defaultdict(float)
+        self.shard_bytes = {}
+        self.last_export = time.time()
+        self.lock = threading.Lock()
+
+    def hit(self, slugname, verbform):
+        """Count a lookup of verbform in shard slugname."""
+        with self.lock:
+            self.shard_hits[slugname] += 1
+            self.form_hits[verbform] += 1
+        self._maybe_export()
+
+    def cold_load(self, slugname, seconds, size):
+        """Count a shard which had to be extracted and parsed."""
+        with self.lock:
+            self.cold_loads[slugname] += 1
+            self.cold_seconds[slugname] += seconds
+            self.shard_bytes[slugname] = size
+
+    def request(self, *arguments):
+        """Count a VerbFormGenerator request."""
+        key = ' '.join(arg for arg in arguments if arg)
+        with self.lock:
+            self.request_hits[key] += 1
+        self._maybe_export()
+
+    def _maybe_export(self):
+        """Export if more than ``interval`` seconds passed since the last."""
+        if self.path is not None and \
+                time.time() - self.last_export > self.interval:
+            self.export()
+
+    def as_dict(self):
+        """Return all counters as a JSON serialisable dict."""
+        shards = {}
+        with self.lock:
+            for slugname in set(self.shard_hits) | set(self.cold_loads):
+                shards[slugname] = {
+                    'hits': self.shard_hits[slugname],
+                    'cold_loads': self.cold_loads[slugname],
+                    'cold_seconds': self.cold_seconds[slugname],
+                    'bytes': self.shard_bytes.get(slugname, 0)}
+            return {'exported': time.time(),
+                    'shards': shards,
+                    'forms': dict(self.form_hits),
+                    'requests': dict(self.request_hits)}
+
+    def export(self, path=None):
+        """Write the counters to path (default is ``self.path``)."""
+        if path is None:
+            path = self.path
+        self.last_export = time.time()
+        # Write to a temporary file first, so that readers never see
+        # a half written file.
+        tmpfile = path + '.tmp'
+        with open(tmpfile, 'w') as fout:
+            json.dump(self.as_dict(), fout)
+        os.replace(tmpfile, path)
+
+
+def read_telemetry(source):
+    """Return exported counters from a Telemetry object or file."""
+    if isinstance(source, Telemetry):
+        return source.as_dict()
+    with open(source, 'r') as fin:
+        return json.load(fin)
+
+
+def recommend_cache_budget(source, coverage=0.95):
+    """Recommend the shards and forms to cache for given share of hits.
+
+    ``source`` is a Telemetry object or a file exported by it.
+    Shards are taken in the order of their hits,
+    till they serve ``coverage`` share of all recorded hits.
+    ``bytes`` is the on disk size of these shards.
+    ``forms`` is the number of most frequent forms needed
+    to serve the same share of hits from a result cache.
+    """
+    data = read_telemetry(source)
+    shards = sorted(data['shards'].items(),
+                    key=lambda item: item[1]['hits'], reverse=True)
+    total = sum(stats['hits'] for (slugname, stats) in shards)
+    selected = []
+    served = 0
+    size = 0
+    for (slugname, stats) in shards:
+        if total == 0 or served >= coverage * total:
+            break
+        selected.append(slugname)
+        served += stats['hits']
+        size += stats['bytes']
+    # Same for individual forms.
+    formcounts = sorted(data['forms'].values(), reverse=True)
+    formtotal = sum(formcounts)
+    formserved = 0
+    forms = 0
+    for count in formcounts:
+        if formtotal == 0 or formserved >= coverage * formtotal:
+            break
+        formserved += count
+        forms += 1
+    return {'shards': selected,
+            'shard_count': len(selected),
+            'bytes': size,
+            'forms': forms,
+            'coverage': float(served) / total if total else 0.0}
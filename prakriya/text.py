@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Split running text into tokens and guess their pre-sandhi forms."""
+import re
+
+
+# Characters which never occur inside a word, in any transliteration.
+SEPARATORS = u'\\s\u0964\u0965,;:!?"()\\[\\]{}0-9\u0966-\u096f'
+# ITRANS and Velthuis use '.' and '|' inside words.
+TOKEN = re.compile(u'[^' + SEPARATORS + u'.|]+')
+DOTTED_TOKEN = re.compile(u'[^' + SEPARATORS + u']+')
+
+
+# (final in sandhi, final before sandhi) in SLP1.
+# Tried in this order, only when the token itself is not a known form.
+SANDHI_FINALS = [('o', 'aH'), ('a', 'aH'), ('A', 'AH'), ('r', 'H'),
+                 ('s', 'H'), ('S', 'H'), ('z', 'H'), ('M', 'm'),
+                 ('d', 't'), ('g', 'k'), ('q', 'w'), ('b', 'p'),
+                 ('n', 't')]
+
+
+def tokenise(text, intran='slp1'):
+    """Return (token, start, end) for every word of the text."""
+    if intran in ['itrans', 'velthuis']:
+        pattern = DOTTED_TOKEN
+    else:
+        pattern = TOKEN
+    return [(match.group(0), match.start(), match.end())
+            for match in pattern.finditer(text)]
+
+
+def sandhi_variants(verbform):
+    """Return the possible pre-sandhi forms of the SLP1 verbform."""
+    variants = []
+    for (final, original) in SANDHI_FINALS:
+        if verbform.endswith(final) and len(verbform) > len(final):
+            variants.append(verbform[:-len(final)] + original)
+    return variants
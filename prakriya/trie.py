@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Store derivations as paths in a trie of steps shared by a dhatu.
+
+All forms of a dhatu start their derivations with the same steps
+(dhatu, lakara, vikarana ...). In the trie store every dhatu has one
+trie of (sutra_num, form) steps, and a derivation is a node of it.
+The steps of a derivation are the path from the root to that node.
+
+The store lives in ``trie`` in the data directory.
+
+    ``trie/json/<shard>.json`` - shards as usual, but every record has
+    ``derivation_ref: [dhatu, node]`` instead of ``derivation``.
+
+    ``trie/dhatu/<dhatu>.json`` - nodes of the trie of the dhatu as
+    ``[parent, sutra_num, form]``. Node 0 is the root.
+
+Tries are read and derivations rebuilt only when a derivation is read.
+After building the store again, call ``Prakriya.reload()``, which
+forgets every trie shard and trie read before.
+
+Example
+-------
+
+    >>> from prakriya import Prakriya
+    >>> from prakriya.trie import build_trie_store
+    >>> build_trie_store()   # Once, takes a while.
+    >>> p = Prakriya()
+    >>> p.use_trie_store()
+"""
+import json
+import os
+import shutil
+import sys
+from collections.abc import Sequence
+from .export import iter_shards
+from .utils import app_dir, cached, intern_values, read_json
+
+
+def build_trie_store(appdir=None, outdir=None):
+    """Convert every shard to the trie store.
+
+    The store is written next to outdir and then replaces it. Nodes are
+    numbered afresh, so running Prakriya objects have to ``reload()``.
+    Returns the number of derivation steps and of trie nodes.
+    """
+    if appdir is None:
+        appdir = app_dir('prakriya')
+    if outdir is None:
+        outdir = os.path.join(appdir, 'trie')
+    tmpdir = outdir + '.tmp'
+    if os.path.exists(tmpdir):
+        shutil.rmtree(tmpdir)
+    for subdir in ['json', 'dhatu']:
+        os.makedirs(os.path.join(tmpdir, subdir))
+    # dhatu -> list of nodes, and dhatu -> {(parent, sutra_num, form): node}
+    nodes = {}
+    children = {}
+    steps = 0
+    for (slugname, compositedata) in iter_shards(appdir):
+        for data in compositedata.values():
+            for datum in data:
+                dhatu = datum.get('number', '')
+                trie = nodes.setdefault(dhatu, [[-1, '', '']])
+                edges = children.setdefault(dhatu, {})
+                node = 0
+                for member in datum.pop('derivation', []):
+                    edge = (node, member['sutra_num'], member['form'])
+                    if edge not in edges:
+                        edges[edge] = len(trie)
+                        trie.append(list(edge))
+                    node = edges[edge]
+                    steps += 1
+                datum['derivation_ref'] = [dhatu, node]
+        with open(os.path.join(tmpdir, 'json', slugname + '.json'),
+                  'w') as fout:
+            json.dump(compositedata, fout)
+    for (dhatu, trie) in nodes.items():
+        with open(dhatu_path(tmpdir, dhatu), 'w') as fout:
+            json.dump(trie, fout)
+    if os.path.exists(outdir):
+        shutil.rmtree(outdir)
+    os.rename(tmpdir, outdir)
+    return {'steps': steps,
+            'nodes': sum(len(trie) - 1 for trie in nodes.values())}
+
+
+def dhatu_path(outdir, dhatu):
+    """Return the path of the trie of the dhatu."""
+    return os.path.join(outdir, 'dhatu', dhatu + '.json')
+
+
+class TrieDerivation(Sequence):
+    """A derivation rebuilt from the trie of its dhatu when it is read."""
+
+    __slots__ = ('store', 'dhatu', 'node')
+
+    def __init__(self, store, dhatu, node):
+        """Keep only the reference to the node."""
+        self.store = store
+        self.dhatu = dhatu
+        self.node = node
+
+    def steps(self):
+        """Return the list of {sutra_num, form} from the root."""
+        trie = read_json(dhatu_path(self.store, self.dhatu))
+        result = []
+        node = self.node
+        while node > 0:
+            (parent, sutra_num, form) = trie[node]
+            result.append({'sutra_num': sutra_num, 'form': form})
+            node = parent
+        result.reverse()
+        return result
+
+    def __getitem__(self, index):
+        """Return the step(s) at index."""
+        return self.steps()[index]
+
+    def __iter__(self):
+        """Iterate over the steps."""
+        return iter(self.steps())
+
+    def __len__(self):
+        """Return the number of steps."""
+        trie = read_json(dhatu_path(self.store, self.dhatu))
+        length = 0
+        node = self.node
+        while node > 0:
+            node = trie[node][0]
+            length += 1
+        return length
+
+
+@cached
+def read_trie_shard(path):
+    """Read a shard of the trie store (in ``<store>/json/``).
+
+    Derivations are TrieDerivation objects. Treat the data as read only.
+    """
+    store = os.path.dirname(os.path.dirname(path))
+    steps = {}
+
+    def hook(obj):
+        """Intern values and refer derivations to the trie."""
+        if 'derivation_ref' in obj:
+            (dhatu, node) = obj.pop('derivation_ref')
+            obj = intern_values(obj, steps)
+            obj['derivation'] = TrieDerivation(store, sys.intern(dhatu), node)
+            return obj
+        return intern_values(obj, steps)
+
+    with open(path, 'r') as fin:
+        return json.loads(fin.read(), object_hook=hook)
@@ -4,9 +4,10 @@
 """Helper functions for prakriya package."""
 
 import json
+import re
 import sys
 from functools import wraps
-from indic_transliteration import sanscript
+from .exceptions import TransliterationError
 
 
 # https://stackoverflow.com/questions/15585493/store-the-cache-to-a-file-functools-lru-cache-in-python-3-2
@@ -47,14 +48,240 @@ def read_json(path):
         return json.loads(fin.read())
 
 
+def intern_values(obj, steps):
+    """Share repeated string values and derivation steps of a record.
+
+    Used as ``object_hook`` while parsing a shard. Strings like URLs,
+    gana, lakara and sutra numbers repeat across thousands of records,
+    so each is kept only once in memory. Identical derivation steps
+    ({sutra_num, form}) within a shard become the same dict object.
+    ``steps`` is the memo of derivation steps seen in this shard.
+    """
+    for key in obj:
+        value = obj[key]
+        if value.__class__ is str:
+            obj[key] = sys.intern(value)
+    if len(obj) == 2 and 'sutra_num' in obj and 'form' in obj:
+        return steps.setdefault((obj['sutra_num'], obj['form']), obj)
+    return obj
+
+
+@cached
+def read_shard(path):
+    """Read the given composite JSON shard with shared repeated values.
+
+    The returned data must be treated as read only.
+    """
+    steps = {}
+    with open(path, 'r') as fin:
+        return json.loads(fin.read(),
+                          object_hook=lambda obj: intern_values(obj, steps))
+
+
+def check_translit(tran, validtrans, several=False):
+    """Raise TransliterationError if tran (or a member of list) is invalid.
+
+    A list is only valid if ``several`` is True (output transliterations).
+    """
+    if isinstance(tran, (list, tuple)):
+        if not several:
+            raise TransliterationError(tran)
+        for member in tran:
+            check_translit(member, validtrans)
+    elif tran not in validtrans:
+        raise TransliterationError(tran)
+
+
 @cached
 def convert(text, intran, outtran):
     """Convert a text from intran to outtran transliteration."""
+    return transliterate(text, intran, outtran)
+
+
+def transliterate(text, intran, outtran):
+    """Convert a text without cacheing. Meant for long running texts."""
     result = ''
     if intran == outtran:
         result = text
-    elif sys.version_info[0] < 3:
-        result = sanscript.transliterate(text, intran, outtran).replace(u'|', u'.')
     else:
-        result = sanscript.transliterate(text, intran, outtran).replace('|', '.')
+        result = BACKEND(text, intran, outtran).replace('|', '.')
     return result
+
+
+def sanscript_backend(text, intran, outtran):
+    """Transliterate with indic_transliteration."""
+    from indic_transliteration import sanscript
+    return sanscript.transliterate(text, intran, outtran)
+
+
+# Pairs for which the fast backend is used.
+FAST_PAIRS = set([('slp1', tran) for tran in
+                  ['devanagari', 'iast', 'hk', 'itrans', 'wx']] +
+                 [(tran, 'slp1') for tran in
+                  ['devanagari', 'iast', 'hk', 'itrans', 'wx']])
+# sanscript treats these specially (## toggles, <> suspends).
+UNSAFE = re.compile('[#<>]')
+FAST_TRANSLITERATORS = {}
+
+
+def fast_backend(text, intran, outtran):
+    """Transliterate with precompiled tables, else with sanscript.
+
+    Gives the same output as ``sanscript.transliterate``, whose scheme
+    maps the tables are made from, but replaces its character by
+    character Python loop with one regular expression pass and
+    ``str.translate``.
+    """
+    if (intran, outtran) not in FAST_PAIRS or UNSAFE.search(text):
+        return sanscript_backend(text, intran, outtran)
+    if (intran, outtran) not in FAST_TRANSLITERATORS:
+        FAST_TRANSLITERATORS[(intran, outtran)] = compile_transliterator(
+            intran, outtran)
+    func = FAST_TRANSLITERATORS[(intran, outtran)]
+    if func is None:
+        return sanscript_backend(text, intran, outtran)
+    return func(text)
+
+
+def compile_transliterator(intran, outtran):
+    """Return a function doing sanscript's transliteration from tables.
+
+    Returns None if the schemes need something which is not handled.
+    """
+    from indic_transliteration import sanscript
+    schememap = sanscript.SchemeMap(sanscript.SCHEMES[intran],
+                                    sanscript.SCHEMES[outtran])
+    mapping = schememap.non_marks_viraama
+    if schememap.from_scheme.is_roman and schememap.to_scheme.is_roman:
+        return _compile_roman_to_roman(schememap, mapping)
+    elif schememap.from_scheme.is_roman:
+        return _compile_roman_to_brahmic(schememap, mapping)
+    elif schememap.to_scheme.is_roman:
+        return _compile_brahmic_to_roman(schememap, mapping)
+    return None
+
+
+def _alternation(keys):
+    """Return a regex matching any of keys, longest first."""
+    return '|'.join(re.escape(key) for key in
+                    sorted(keys, key=lambda key: (-len(key), key)))
+
+
+def _compile_roman_to_roman(schememap, mapping):
+    """Between roman schemes the output of a token is context free."""
+    for vowel in schememap.vowels:
+        if (schememap.marks.get(vowel, '') or schememap.vowels[vowel]) != \
+                mapping[vowel]:
+            return None
+    if schememap.virama.get('', '') != '':
+        return None
+    singles = dict((key, value) for (key, value) in mapping.items()
+                   if len(key) == 1)
+    table = dict((ord(key), value) for (key, value) in singles.items())
+    # Longer keys whose output differs from that of their characters.
+    longer = [key for key in mapping if len(key) > 1 and
+              mapping[key] != ''.join(singles.get(char, char)
+                                      for char in key)]
+    if not longer:
+        return lambda text: text.translate(table)
+    # If they share no character with other longer keys (e.g. '..' of
+    # slp1), they are found as sanscript finds them, and only they need
+    # the regex.
+    others = set(char for key in mapping if len(key) > 1 and
+                 key not in longer for char in key)
+    if not any(char in others for key in longer for char in key) and \
+            not any(ord(char) in table for key in longer
+                    for char in mapping[key]):
+        pattern = re.compile(_alternation(longer))
+        return lambda text: pattern.sub(
+            lambda match: mapping[match.group()], text).translate(table)
+    # Otherwise every token has to be found as sanscript finds it.
+    pattern = re.compile(_alternation(mapping))
+    return lambda text: pattern.sub(lambda match: mapping[match.group()],
+                                    text)
+
+
+def _compile_roman_to_brahmic(schememap, mapping):
+    """A consonant takes the sign of the vowel after it, or a virama."""
+    consonants = schememap.consonants
+    vowels = schememap.vowels
+    virama = schememap.virama['']
+    others = [key for key in mapping if key not in consonants]
+    # Vowels are single characters in the schemes handled here.
+    if any(len(key) > 1 for key in vowels):
+        return None
+    syllables = {}
+    for consonant in consonants:
+        syllables[consonant] = mapping[consonant] + virama
+        for vowel in vowels:
+            syllables[consonant + vowel] = mapping[consonant] + \
+                schememap.marks.get(vowel, '')
+    longer = [key for key in others if len(key) > 1]
+    for key in longer:
+        syllables[key] = mapping[key]
+    # Greedy tokenisation prefers a longer key (e.g. oM) to a vowel.
+    lookahead = ''
+    if longer:
+        lookahead = '(?!' + _alternation(longer) + ')'
+    pattern = re.compile('(?:' + _alternation(consonants) + ')' +
+                         '(?:' + lookahead + '[' +
+                         ''.join(re.escape(key) for key in vowels) + '])?' +
+                         ('|' + _alternation(longer) if longer else ''))
+    table = dict((ord(key), mapping[key]) for key in others
+                 if len(key) == 1)
+    if any(ord(char) in table for value in syllables.values()
+           for char in value):
+        return None
+    return lambda text: pattern.sub(
+        lambda match: syllables[match.group()], text).translate(table)
+
+
+def _compile_brahmic_to_roman(schememap, mapping):
+    """A consonant without a vowel sign or virama gets an inherent 'a'."""
+    consonants = schememap.consonants
+    marks = schememap.marks
+    virama = list(schememap.virama.items())
+    if len(virama) != 1 or any(len(key) > 1 for key in mapping
+                               if key not in consonants):
+        return None
+    (viramakey, viramavalue) = virama[0]
+    syllables = {}
+    for consonant in consonants:
+        syllables[consonant] = mapping[consonant] + 'a'
+        syllables[consonant + viramakey] = mapping[consonant] + viramavalue
+        for mark in marks:
+            syllables[consonant + mark] = mapping[consonant] + marks[mark]
+    pattern = re.compile('(?:' + _alternation(consonants) + ')' +
+                         '(?:' + _alternation(list(marks) + [viramakey]) +
+                         ')?')
+    table = dict((ord(key), value) for (key, value) in mapping.items()
+                 if key not in consonants)
+    table.update((ord(key), value) for (key, value) in marks.items())
+    table[ord(viramakey)] = viramavalue
+    if any(ord(char) in table for value in syllables.values()
+           for char in value):
+        return None
+    return lambda text: pattern.sub(
+        lambda match: syllables[match.group()], text).translate(table)
+
+
+# The function which transliterates. See set_backend().
+BACKEND = fast_backend
+
+
+def set_backend(backend):
+    """Choose how texts are transliterated.
+
+    ``backend`` is ``'fast'`` (the default, which falls back to sanscript
+    for pairs it does not handle), ``'sanscript'``, or a function
+    ``(text, intran, outtran) -> text``.
+    """
+    global BACKEND
+    if backend == 'fast':
+        BACKEND = fast_backend
+    elif backend == 'sanscript':
+        BACKEND = sanscript_backend
+    else:
+        BACKEND = backend
+    # Results of the earlier backend are forgotten.
+    convert.cache.clear()
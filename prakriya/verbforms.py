@@ -1,11 +1,21 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 """Create a python library which returns details about a verb form."""
+import json
 import os.path
-import sys
 import tarfile
-import requests
-from .utils import app_dir, read_json, convert
+import threading
+import time
+from collections import Counter
+from .utils import app_dir, read_json, read_shard, convert, transliterate
+from .utils import check_translit
+from .exceptions import PrakriyaError, FormNotFoundError
+from .text import tokenise, sandhi_variants
+from .trie import read_trie_shard
+from .bloom import load_bloom
+from .telemetry import read_telemetry
+from .dataset import read_manifest, changed_shards, invalidate, INDEXFILES
+from .dataset import extract_shards
 # import datetime
 
 
@@ -42,12 +52,15 @@ class Prakriya():
     The input should be in SLP1 encoding.
 
     ``field`` is optional.
+    It can also be a list of fields. Only those fields are rendered then.
 
     Actual usage examples will be like the following.
 
         >>> p.get_info('Bavati')
         >>> p.get_info('Bavati', 'prakriya')
         >>> p.get_info('Bavati', 'verb')
+        >>> p.get_info('Bavati', ['lakara', 'purusha', 'vachana'])
+        >>> p.get_info('Bavati', 'prakriya', outtran=['devanagari', 'iast'])
 
 
     Valid values of ``field`` and expected output are as follows.
@@ -119,6 +132,122 @@ class Prakriya():
     Valid transliterations are slp1, itrans, hk, iast, devanagari, wx, bengali,
     gujarati, gurmukhi, kannada, malayalam, oriya and telugu.
     They can be used both as input transliteration and output transliteration.
+
+    Transliterations can also be given for a single call.
+    They do not change the transliterations set on the object.
+
+      >>> p.get_info('भवति', 'verb', intran='devanagari', outtran='iast')
+
+    To get the result in many transliterations from a single lookup,
+    give a list as ``outtran``. A dict keyed by transliteration is returned.
+
+      >>> p.get_info('Bavati', 'verb', outtran=['devanagari', 'iast', 'slp1'])
+
+
+    running text
+    ------------
+
+    Whole sentences or paragraphs can be analysed in one call.
+    Every token is returned with its offsets in the text.
+
+      >>> p.analyse_text('रामः वनं गच्छति।', intran='devanagari')
+
+
+    prewarming
+    ----------
+
+    A fresh process pays for extracting and parsing a shard the first time
+    a form from it is asked for. To pay that cost before taking traffic,
+    load the hot shards in background threads.
+
+      >>> p.access_log('/path/to/access.log') # Record looked up forms.
+      >>> p.prewarm(logfile='/path/to/access.log', top=1000)
+      >>> p.prewarm(forms=['Bavati', 'gacCati'], scripts=['devanagari', 'iast'])
+      >>> p.prewarm(shards=['Bav'], wait=True) # Block till loaded.
+
+    ``scripts`` also builds the sutra and transliteration tables
+    for the given output transliterations.
+
+
+    trie store
+    ----------
+
+    Derivations of the forms of a dhatu share most of their steps.
+    The trie store keeps every such step once (see ``prakriya.trie``).
+
+      >>> from prakriya.trie import build_trie_store
+      >>> build_trie_store() # One time requirement.
+      >>> p.use_trie_store()
+
+
+    sized shards
+    ------------
+
+    Shards of jsonindex.json are of very uneven size. They can be cut
+    again into shards of at most a given size (see ``prakriya.reshard``),
+    so that the cost of a cold lookup is bounded.
+
+      >>> from prakriya.reshard import reshard
+      >>> reshard(maxsize=256 * 1024) # One time requirement.
+      >>> p.use_sized_shards()
+
+
+    shared cache
+    ------------
+
+    Worker processes on one host can share the results they render,
+    in a fixed size cache in shared memory (see ``prakriya.sharedcache``).
+
+      >>> p.use_shared_cache('prakriya') # In every worker.
+
+
+    block store
+    -----------
+
+    Records can also be read from small blocks compressed with a shared
+    dictionary (see ``prakriya.blockstore``), which take about as much
+    disk as the tar.gz but are read one block at a time.
+
+      >>> from prakriya.blockstore import build_block_store
+      >>> build_block_store() # One time requirement.
+      >>> p.use_block_store()
+
+
+    updates
+    -------
+
+    New releases of the data can be applied as deltas,
+    which carry only the changed shards (see ``prakriya.dataset``).
+
+      $ prakriya-update delta_v004.tar.gz
+
+    A running object then reads again only the changed shards.
+
+      >>> p.reload()
+
+
+    bloom filter
+    ------------
+
+    With a Bloom filter of all verb forms, most tokens which are not
+    verb forms are rejected without reading a shard.
+
+      >>> from prakriya.bloom import build_bloom
+      >>> build_bloom() # Once, and after every update.
+
+
+    errors
+    ------
+
+    Bad input raises a ``prakriya.PrakriyaError`` instead of exiting,
+    e.g. ``FormNotFoundError`` (a ``KeyError``) for an unknown form and
+    ``TransliterationError`` (a ``ValueError``) for an unknown scheme.
+    Unknown forms are remembered, so that asking again costs no lookup.
+    In batches, errors can be returned in place of results.
+
+      >>> for (verbform, result) in p.batch_info(forms, errors='record'):
+      ...     if isinstance(result, PrakriyaError):
+      ...         print(verbform, result)
     """
 
     def __init__(self):
@@ -144,50 +273,323 @@ class Prakriya():
         download_from_github(self.appdir, 'sutrainfo.json')
         self.sutrainfo = read_json(os.path.join(self.appdir, 'sutrainfo.json'))
         self.json_cache = {}
+        # tarfile objects are not safe to share between threads.
+        self.tarlock = threading.Lock()
+        self.accesslog = None
+        # Set to a prakriya.telemetry.Telemetry object to count hits.
+        self.telemetry = None
+        # Version and shard hashes, if the dataset has a manifest.
+        self.manifest = read_manifest(self.appdir)
+        # Where shards are read from, and the function to read them.
+        self.jsondir = os.path.join(self.appdir, 'json')
+        self.shardreader = read_shard
+        # Block store to read records from instead, if any.
+        self.blockstore = None
+        # Index of shards of bounded size, if used (see prakriya.reshard).
+        self.shardindex = None
+        # Results shared with other processes, if used
+        # (see prakriya.sharedcache).
+        self.sharedcache = None
+        # Verb forms (SLP1) known not to be in the database.
+        self.missing = set()
+        # Bloom filter of all verb forms, if built (see prakriya.bloom).
+        self.bloom = load_bloom(self.appdir)
 
     def decompress(self):
-        """Decompress the tar file if user asks for it."""
-        self.tar.extractall(self.appdir)
+        """Decompress the tar file if user asks for it.
+
+        Shards of an updated dataset are kept (see ``extract_shards()``).
+        """
+        extract_shards(self.tar, self.appdir)
         print("data files extracted.")
         print("You shall not need to use decompress() function again.")
         print("Just do regular `p = Prakriya()`.")
 
     def input_translit(self, tran):
         """Set input transliteration."""
-        # If valid transliteration, set transliteration.
-        if tran in ['slp1', 'itrans', 'hk', 'iast', 'devanagari', 'velthuis',
-                    'wx', 'kolkata', 'bengali', 'gujarati', 'gurmukhi',
-                    'kannada', 'malayalam', 'oriya', 'telugu', 'tamil']:
-            self.intran = tran
-        # If not valid, throw error.
-        else:
-            print('Error. Not a valid transliteration scheme.')
-            exit(0)
+        # If not valid, raise TransliterationError.
+        check_translit(tran, VALIDTRANS)
+        self.intran = tran
 
     def output_translit(self, tran):
         """Set output transliteration."""
-        # If valid transliteration, set transliteration.
-        if tran in ['slp1', 'itrans', 'hk', 'iast', 'devanagari', 'velthuis',
-                    'wx', 'kolkata', 'bengali', 'gujarati', 'gurmukhi',
-                    'kannada', 'malayalam', 'oriya', 'telugu', 'tamil']:
-            self.outtran = tran
-        # If not valid, throw error.
-        else:
-            print('Error. Not a valid transliteration scheme.')
-            exit(0)
-
-    def get_data(self, verbform, tar, intran='slp1', outtran='slp1'):
-        """Get whole data from the json file for given verb form."""
-        # Find the parent directory
-        slugname = self.jsonindex[verbform[:3]]
+        # If not valid, raise TransliterationError.
+        check_translit(tran, VALIDTRANS, several=True)
+        self.outtran = tran
+
+    def shard_slug(self, verbform):
+        """Return the name of the shard which holds given verb form."""
+        if self.shardindex is not None:
+            return self.shardindex.slug(verbform)
+        return self.jsonindex[verbform[:3]]
+
+    def shard_names(self):
+        """Return the sorted names of all shards."""
+        if self.shardindex is not None:
+            return sorted(self.shardindex.shards)
+        return sorted(set(self.jsonindex.values()))
+
+    def load_shard(self, slugname, tar=None):
+        """Extract (if needed) and read the shard with given name."""
+        if tar is None:
+            tar = self.tar
         # path of json file.
-        json_in = os.path.join(self.appdir, 'json', slugname + '.json')
-        extract_from_tar(tar, json_in, slugname, self.appdir)
-        compositedata = read_json(json_in)
-        # Keep only the data related to inquired verbform.
-        data = compositedata[verbform]
+        json_in = os.path.join(self.jsondir, slugname + '.json')
+        reader = self.shardreader
+        if self.telemetry is not None and (json_in,) not in reader.cache:
+            start = time.time()
+            with self.tarlock:
+                extract_from_tar(tar, json_in, slugname, self.appdir)
+            compositedata = reader(json_in)
+            self.telemetry.cold_load(slugname, time.time() - start,
+                                     os.path.getsize(json_in))
+            return compositedata
+        with self.tarlock:
+            extract_from_tar(tar, json_in, slugname, self.appdir)
+        return reader(json_in)
+
+    def use_trie_store(self, directory=None):
+        """Read shards from the trie store built by ``build_trie_store()``.
+
+        Derivations are then kept as references to shared tries of
+        steps and rebuilt only when ``prakriya`` is asked for.
+        """
+        if directory is None:
+            directory = os.path.join(self.appdir, 'trie')
+        self.jsondir = os.path.join(directory, 'json')
+        self.shardreader = read_trie_shard
+        self.shardindex = None
+
+    def use_block_store(self, directory=None, cache=256):
+        """Read records from the block store built by ``build_block_store()``.
+
+        A lookup then decompresses one small block instead of reading
+        a whole shard. ``cache`` decompressed blocks are kept.
+        A block store used before is closed.
+        """
+        from .blockstore import BlockStore
+        if directory is None:
+            directory = os.path.join(self.appdir, 'blocks')
+        old = self.blockstore
+        self.blockstore = BlockStore(directory, cache)
+        if old is not None:
+            old.close()
+        self.shardindex = None
+
+    def use_sized_shards(self, directory=None):
+        """Read the shards of bounded size written by ``reshard()``.
+
+        They replace the shards of jsonindex.json, and the trie or
+        block store if one was used.
+        """
+        from .reshard import read_shard_index
+        if directory is None:
+            directory = os.path.join(self.appdir, 'shards')
+        self.shardindex = read_shard_index(directory)
+        self.jsondir = os.path.join(directory, 'json')
+        self.shardreader = read_shard
+        self.blockstore = None
+
+    def use_shared_cache(self, name=None, slots=16384, slotsize=4096):
+        """Keep rendered results in a cache shared by processes of a host.
+
+        Attaches to the ``prakriya.sharedcache.SharedCache`` called
+        ``name``, created with ``slots`` and ``slotsize`` if there is
+        none. Returns it.
+        """
+        from .sharedcache import SharedCache
+        self.sharedcache = SharedCache(name, slots, slotsize)
+        return self.sharedcache
+
+    def get_data(self, verbform, tar, intran='slp1', outtran='slp1',
+                 fields=None):
+        """Get data from the json file for given verb form.
+
+        If ``fields`` is given, only those fields are rendered.
+        """
+        if verbform in self.missing:
+            raise FormNotFoundError(verbform)
+        # Find the parent directory
+        if verbform[:3] not in self.jsonindex or \
+                (self.bloom is not None and verbform not in self.bloom):
+            self._not_found(verbform)
+        slugname = self.shard_slug(verbform)
+        if self.sharedcache is not None:
+            # The version keeps results of older data from being used.
+            key = json.dumps([verbform, outtran, fields,
+                              self.manifest and self.manifest['version']])
+            result = self.sharedcache.get(key)
+            if result is not None:
+                return result
+        if self.blockstore is not None:
+            data = self.blockstore.get(slugname, verbform)
+            if data is None:
+                self._not_found(verbform)
+        else:
+            compositedata = self.load_shard(slugname, tar)
+            if verbform not in compositedata:
+                self._not_found(verbform)
+            # Keep only the data related to inquired verbform.
+            data = compositedata[verbform]
+        # Only lookups which read the shard are its hits.
+        if self.telemetry is not None:
+            self.telemetry.hit(slugname, verbform)
+        result = storeresult(data, intran, outtran, self.sutrainfo, fields)
+        if self.sharedcache is not None:
+            self.sharedcache.put(key, result)
         # Return results
-        return storeresult(data, intran, outtran, self.sutrainfo)
+        return result
+
+    def _not_found(self, verbform):
+        """Remember that verbform is not in the database and raise."""
+        # Keep the memory bounded, whatever the input.
+        if len(self.missing) >= MISSING_LIMIT:
+            self.missing.clear()
+        self.missing.add(verbform)
+        raise FormNotFoundError(verbform)
+
+    def reload(self):
+        """Pick up a dataset updated by ``prakriya.dataset.apply_delta``.
+
+        Only the changed shards and index files are read again. Sized
+        shards, the trie store and the block store have to be built
+        again first; they are read again as a whole.
+        Returns the list of changed shards.
+        """
+        manifest = read_manifest(self.appdir)
+        changed = changed_shards(self.manifest, manifest)
+        jsondir = self.jsondir
+        if self.shardindex is not None:
+            # Sized shards do not have the names of the manifest.
+            self.use_sized_shards(os.path.dirname(jsondir))
+            changed = None
+        elif self.shardreader is read_trie_shard:
+            # A trie store built again numbers the nodes of every dhatu
+            # afresh, also for shards which did not change.
+            dhatudir = os.path.join(os.path.dirname(jsondir), 'dhatu')
+            for key in list(read_json.cache):
+                if os.path.dirname(key[0]) == dhatudir:
+                    read_json.cache.pop(key, None)
+            changed = None
+        if changed is None:
+            # Without manifests, forget every shard.
+            changed = [os.path.basename(key[0])[:-len('.json')]
+                       for key in list(self.shardreader.cache)
+                       if os.path.dirname(key[0]) == jsondir]
+        for slugname in changed:
+            invalidate(os.path.join(jsondir, slugname + '.json'))
+        for filename in INDEXFILES:
+            if self.manifest is None or manifest is None or \
+                    self.manifest['files'].get(filename) != \
+                    manifest['files'].get(filename):
+                invalidate(os.path.join(self.appdir, filename))
+        self.jsonindex = read_json(os.path.join(self.appdir, 'jsonindex.json'))
+        self.sutrainfo = read_json(os.path.join(self.appdir, 'sutrainfo.json'))
+        self.manifest = manifest
+        if self.blockstore is not None:
+            self.use_block_store(self.blockstore.directory,
+                                 self.blockstore.cache)
+        # New data may have forms which were missing.
+        self.missing = set()
+        self.bloom = load_bloom(self.appdir)
+        return changed
+
+    def memory_report(self, top=10):
+        """Return sizes of the data and caches of this object.
+
+        See ``prakriya.memory.memory_report()``.
+        """
+        from .memory import memory_report
+        return memory_report(prakriya=self, top=top)
+
+    def access_log(self, path):
+        """Append every looked up verb form (in SLP1) to given file.
+
+        The log can later be fed to ``prewarm(logfile=path)``.
+        Pass ``None`` to stop logging.
+        """
+        if self.accesslog is not None:
+            self.accesslog.close()
+        self.accesslog = None
+        if path is not None:
+            # Line buffered, so that the log survives a killed process.
+            self.accesslog = open(path, 'a', 1)
+
+    def prewarm(self, forms=None, shards=None, logfile=None, top=None,
+                scripts=None, threads=4, wait=False):
+        """Load shards and transliteration tables in background threads.
+
+        ``forms`` - verb forms (SLP1) whose shards and results are loaded.
+
+        ``shards`` - names of shards to be loaded, as in jsonindex.json.
+
+        ``logfile`` - access log written by ``access_log()``
+        or counters exported by ``prakriya.telemetry.Telemetry``.
+        Forms in it are loaded, most frequent first.
+
+        ``top`` - load only ``top`` most frequent forms from ``logfile``.
+
+        ``scripts`` - output transliterations for which sutra texts and
+        results of ``forms`` are rendered in advance.
+
+        Returns the background thread. If ``wait`` is True, returns
+        after everything is loaded. A shard which cannot be loaded is
+        skipped; its error is kept in ``errors`` of the thread, and the
+        first error is raised if ``wait`` is True.
+        """
+        forms = list(forms or [])
+        if logfile is not None:
+            forms += read_access_log(logfile, top)
+        if scripts is None:
+            scripts = []
+        # Shards are loaded first, so that rendering finds them warm.
+        slugnames = list(shards or [])
+        for verbform in forms:
+            if verbform[:3] in self.jsonindex:
+                slugnames.append(self.shard_slug(verbform))
+        # Keep the order, drop duplicates.
+        slugnames = sorted(set(slugnames), key=slugnames.index)
+        errors = []
+
+        def load(slugname):
+            """Load a shard, keeping its error to go on with the others."""
+            try:
+                self.load_shard(slugname)
+            except Exception as error:
+                errors.append(error)
+
+        def warm():
+            """Load everything with a pool of threads."""
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                list(pool.map(load, slugnames))
+                for tran in scripts:
+                    list(pool.map(self._warm_sutra, self.sutrainfo,
+                                  [tran] * len(self.sutrainfo)))
+                    list(pool.map(self._warm_form, forms,
+                                  [tran] * len(forms)))
+
+        thread = threading.Thread(target=warm, name='prakriya-prewarm')
+        thread.daemon = True
+        thread.errors = errors
+        thread.start()
+        if wait:
+            thread.join()
+            if errors:
+                raise errors[0]
+        return thread
+
+    def _warm_sutra(self, sutra_num, tran):
+        """Keep the sutra text in given transliteration ready."""
+        convert(self.sutrainfo[sutra_num], 'slp1', tran)
+
+    def _warm_form(self, verbform, tran):
+        """Render the result of given verb form in given transliteration."""
+        try:
+            self.get_data(verbform, self.tar, 'slp1', tran)
+        except KeyError:
+            # Forms which are not in the database need not be warmed.
+            pass
 
     def __getitem__(self, items):
         """Return the requested data by user."""
@@ -202,37 +604,187 @@ class Prakriya():
             verbform = items[0]
             if len(items) > 1:
                 argument = items[1]
+        return self._info(verbform, argument, self.intran, self.outtran)
+
+    def _info(self, verbform, argument, intran, outtran):
+        """Return the data of verbform for argument in outtran.
+
+        If outtran is a list, return a dict with result for each of them.
+        Does not depend on the transliteration set on the object.
+        """
         # Convert verbform from desired input transliteration to SLP1.
-        if sys.version_info[0] < 3:
-            verbform = verbform.decode('utf-8')
-        verbform = convert(verbform, self.intran, 'slp1')
-        # Read from tar.gz file.
-        data = self.get_data(verbform, self.tar, 'slp1', self.outtran)
+        verbform = convert(verbform, intran, 'slp1')
+        if self.accesslog is not None:
+            self.accesslog.write(verbform + '\n')
         # If there is no argument, return whole data.
         if argument == '':
-            result = data
-        # Else, keep only the data related to the provided argument.
+            # Read from tar.gz file.
+            result = self.get_data(verbform, self.tar, 'slp1', outtran)
+        # A list of fields gives dicts with only those fields.
+        elif isinstance(argument, (list, tuple)):
+            result = self.get_data(verbform, self.tar, 'slp1', outtran,
+                                   argument)
+        # Else, render and keep only the data related to the argument.
+        elif isinstance(outtran, (list, tuple)):
+            data = self.get_data(verbform, self.tar, 'slp1', outtran,
+                                 [argument])
+            result = dict((tran, keep_specific(data[tran], argument))
+                          for tran in data)
         else:
+            data = self.get_data(verbform, self.tar, 'slp1', outtran,
+                                 [argument])
             result = keep_specific(data, argument)
         # print(datetime.datetime.now())
         # Return the result.
         return result
 
-    def get_info(self, verbform, field='prakriya'):
-        """Return the data requested by user."""
-        items = [verbform, field]
-        return self.__getitem__(items)
+    def get_info(self, verbform, field='prakriya', intran=None, outtran=None):
+        """Return the data requested by user.
+
+        ``intran`` and ``outtran`` override the input and output
+        transliteration for this call only, so that one object can serve
+        callers who want different transliterations at the same time.
+        If ``outtran`` is a list, e.g. ``['devanagari', 'iast', 'slp1']``,
+        a dict with the result in each of them is returned.
+
+        Raises FormNotFoundError if the verb form is not in the database,
+        and TransliterationError for an invalid transliteration.
+        """
+        if intran is None:
+            intran = self.intran
+        else:
+            check_translit(intran, VALIDTRANS)
+        if outtran is None:
+            outtran = self.outtran
+        else:
+            check_translit(outtran, VALIDTRANS, several=True)
+        return self._info(verbform, field, intran, outtran)
+
+    def analyse_text(self, text, fields=None, intran=None, outtran=None):
+        """Analyse every verb form in a running text.
+
+        The whole text is transliterated once, split into tokens and
+        looked up shard by shard, so that every shard is read only once.
+        If a token is not a known form, forms before sandhi are tried for
+        its final sound, e.g. ``Bavato`` -> ``BavataH``.
+
+        Returns a list of dicts, one per token, with keys
+        ``token`` (as in text), ``start`` and ``end`` (offsets in text),
+        ``form`` (matched form in SLP1, None if not a known verb form)
+        and ``analysis`` (as from ``get_info()`` with ``fields``).
+        """
+        if intran is None:
+            intran = self.intran
+        else:
+            check_translit(intran, VALIDTRANS)
+        if outtran is None:
+            outtran = self.outtran
+        else:
+            check_translit(outtran, VALIDTRANS, several=True)
+        tokens = tokenise(text, intran)
+        # Transliterate all tokens in one go.
+        words = [token for (token, start, end) in tokens]
+        slp1words = transliterate('\n'.join(words), intran, 'slp1')
+        slp1words = slp1words.split('\n')
+        if len(slp1words) != len(words):
+            slp1words = [convert(word, intran, 'slp1') for word in words]
+        # Group the candidate forms by their shards.
+        candidates = {}
+        byshard = {}
+        bloom = self.bloom
+        for word in set(slp1words):
+            candidates[word] = [verbform for verbform
+                                in [word] + sandhi_variants(word)
+                                if verbform[:3] in self.jsonindex and
+                                (bloom is None or verbform in bloom)]
+            for verbform in candidates[word]:
+                byshard.setdefault(self.shard_slug(verbform),
+                                   set()).add(verbform)
+        # Read every shard once.
+        found = {}
+        for (slugname, verbforms) in byshard.items():
+            if self.blockstore is not None:
+                compositedata = self.blockstore.get_many(slugname, verbforms)
+            else:
+                compositedata = self.load_shard(slugname)
+            for verbform in verbforms:
+                if verbform in compositedata:
+                    if self.telemetry is not None:
+                        self.telemetry.hit(slugname, verbform)
+                    found[verbform] = compositedata[verbform]
+        # Render each distinct form once.
+        rendered = {}
+        result = []
+        for ((token, start, end), word) in zip(tokens, slp1words):
+            matched = None
+            for verbform in candidates[word]:
+                if verbform in found:
+                    matched = verbform
+                    break
+            analysis = None
+            if matched is not None:
+                if matched not in rendered:
+                    rendered[matched] = storeresult(found[matched], 'slp1',
+                                                    outtran, self.sutrainfo,
+                                                    fields)
+                analysis = rendered[matched]
+            result.append({'token': token, 'start': start, 'end': end,
+                           'form': matched, 'analysis': analysis})
+        return result
+
+    def batch_info(self, verbforms, fields=None, intran=None, outtran=None,
+                   errors='raise'):
+        """Yield (verbform, result) for every verb form in verbforms.
+
+        ``fields`` is a list of fields to render. All fields by default.
+        ``intran`` and ``outtran`` are as in ``get_info()``.
+        ``errors`` - ``raise`` raises the PrakriyaError of a bad verb form.
+        ``record`` yields the error in place of its result and goes on.
+        """
+        if errors not in ('raise', 'record'):
+            raise ValueError("errors is 'raise' or 'record'")
+        # Bad transliterations fail the whole batch at once.
+        if intran is not None:
+            check_translit(intran, VALIDTRANS)
+        if outtran is not None:
+            check_translit(outtran, VALIDTRANS, several=True)
+        if not fields:
+            fields = ''
+        for verbform in verbforms:
+            try:
+                result = self.get_info(verbform, fields, intran, outtran)
+            except PrakriyaError as error:
+                if errors == 'raise':
+                    raise
+                result = error
+            yield (verbform, result)
+
+
+# Valid input and output transliterations.
+VALIDTRANS = ['slp1', 'itrans', 'hk', 'iast', 'devanagari', 'velthuis',
+              'wx', 'kolkata', 'bengali', 'gujarati', 'gurmukhi',
+              'kannada', 'malayalam', 'oriya', 'telugu', 'tamil']
+# Number of missing verb forms remembered by a Prakriya object.
+MISSING_LIMIT = 100000
+
+
+# Fields in the order in which they are documented.
+FIELDS = ['prakriya', 'verb', 'verbaccent', 'lakara', 'purusha', 'vachana',
+          'gana', 'meaning', 'number', 'madhaviya', 'kshiratarangini',
+          'dhatupradipa', 'jnu', 'uohyd', 'upasarga', 'padadecider_id',
+          'padadecider_sutra', 'it_id', 'it_status', 'it_sutra', 'suffix']
+
+
+# Fields whose values are transliterated to the output transliteration.
+CONVERTIBLE = frozenset(['verb', 'lakara', 'gana', 'meaning', 'upasarga',
+                         'padadecider_id', 'padadecider_sutra', 'suffix',
+                         'it_status', 'it_sutra', 'it_id', 'vachana',
+                         'purusha'])
 
 
 def convertible(argument):
     """Returns whether the item is convertible to Devanagari or not."""
-    result = False
-    if argument in set(['verb', 'lakara', 'gana', 'meaning', 'upasarga',
-                        'padadecider_id', 'padadecider_sutra', 'suffix',
-                        'it_status', 'it_sutra', 'it_id', 'vachana',
-                        'purusha']):
-        result = True
-    return result
+    return argument in CONVERTIBLE
 
 
 def extract_from_tar(tar, filename, slugname, appdir):
@@ -242,56 +794,97 @@ def extract_from_tar(tar, filename, slugname, appdir):
         tar.extract(member, appdir)
 
 
-def storeresult(data, intran, outtran, sutrainfo):
-    """Store the result with necessary transliteration conversions."""
-    # Initialize empty result stack.
-    result = []
+def storeresult(data, intran, outtran, sutrainfo, fields=None):
+    """Store the result with necessary transliteration conversions.
+
+    If ``fields`` is given, only those fields are rendered.
+    The derivation is rendered only if ``prakriya`` is one of them.
+    If ``outtran`` is a list of transliterations, a dict with
+    the result in each of them is returned.
+    """
+    if isinstance(outtran, (list, tuple)):
+        return dict(zip(outtran, storeresults(data, intran, outtran,
+                                              sutrainfo, fields)))
+    return storeresults(data, intran, [outtran], sutrainfo, fields)[0]
+
+
+def storeresults(data, intran, outtrans, sutrainfo, fields=None):
+    """Return the result in each of outtrans, reading data only once."""
+    # Initialize empty result stack for each output transliteration.
+    results = [[] for outtran in outtrans]
     # For each possible derivation leading to the given verb form
     # e.g. baBUva can be from BU, asa~
     for datum in data:
         # Initialize a subresult stack as dict.
         # key will be argument and value will be data.
-        subresult = {}
-        # Start a list for derivation. It needs special treatment.
-        derivationlist = []
+        subresults = [{} for outtran in outtrans]
+        if fields is None:
+            items = datum
+        else:
+            items = [item for item in fields if item in datum]
         # For each key,
-        for item in datum:
-            # if not in these two
-            if item not in ['derivation']:
-                tmp = datum[item]
-                # correct the wrong anusvAra in SLP1 to correct one.
-                tmp = tmp.replace('!', '~')
-                # Store in subresult dict.
-                if convertible(item):
+        for item in items:
+            # derivation is a list (as compared to others which are strings.)
+            # It needs special treatment.
+            if item == 'derivation':
+                continue
+            tmp = datum[item]
+            # correct the wrong anusvAra in SLP1 to correct one.
+            tmp = tmp.replace('!', '~')
+            # Store in subresult dict.
+            isconvertible = item in CONVERTIBLE
+            for (subresult, outtran) in zip(subresults, outtrans):
+                if isconvertible:
                     subresult[item] = convert(tmp, intran, outtran)
                 else:
                     subresult[item] = tmp
-            # derivation is a list (as compared to others which are strings.)
-            elif item == 'derivation':
-                # For member of the list
-                for member in datum['derivation']:
-                    # Fetch sutratext
-                    if member['sutra_num'] not in sutrainfo:
-                        sutratext = ''
-                    else:
-                        sutratext = sutrainfo[member['sutra_num']]
-                    sutratext = convert(sutratext, intran, outtran)
-                    # Replace tilde with hyphen.
-                    # Otherwise wrong transliteration will happen.
-                    sutranum = member['sutra_num'].replace('~', '-')
-                    # sutranum = convert(sutranum, intran, outtran)
-                    # A decent representation for rutva.
-                    form = member['form'].replace('@', 'u~')
-                    form = convert(form, intran, outtran)
-                    # Add to derivationlist.
-                    derivationlist.append({'sutra': sutratext,
-                                           'sutra_num': sutranum, 'form': form})
         # Add the derivationlist to the prakriya key.
-        subresult['prakriya'] = derivationlist
+        if fields is None or 'prakriya' in fields:
+            steps = derivation_steps(datum.get('derivation', []), sutrainfo)
+            for (subresult, outtran) in zip(subresults, outtrans):
+                subresult['prakriya'] = [
+                    {'sutra': convert(sutratext, intran, outtran),
+                     'sutra_num': sutranum,
+                     'form': convert(form, intran, outtran)}
+                    for (sutratext, sutranum, form) in steps]
         # Append subresult to result and start again.
-        result.append(subresult)
+        for (result, subresult) in zip(results, subresults):
+            result.append(subresult)
     # Give result.
-    return result
+    return results
+
+
+def derivation_steps(derivation, sutrainfo):
+    """Return (sutratext, sutranum, form) of every step, untransliterated."""
+    steps = []
+    # For member of the list
+    for member in derivation:
+        # Fetch sutratext
+        if member['sutra_num'] not in sutrainfo:
+            sutratext = ''
+        else:
+            sutratext = sutrainfo[member['sutra_num']]
+        # Replace tilde with hyphen.
+        # Otherwise wrong transliteration will happen.
+        sutranum = member['sutra_num'].replace('~', '-')
+        # sutranum = convert(sutranum, intran, outtran)
+        # A decent representation for rutva.
+        form = member['form'].replace('@', 'u~')
+        steps.append((sutratext, sutranum, form))
+    return steps
+
+
+def read_access_log(logfile, top=None):
+    """Return verb forms from the access log, most frequent first."""
+    with open(logfile, 'r') as fin:
+        content = fin.read()
+    # Exported telemetry is a JSON object.
+    if content.startswith('{'):
+        counts = Counter(read_telemetry(logfile)['forms'])
+    else:
+        counts = Counter(line.strip() for line in content.splitlines()
+                         if line.strip())
+    return [verbform for (verbform, count) in counts.most_common(top)]
 
 
 def keep_specific(data, argument):
@@ -304,6 +897,7 @@ def download_from_github(appdir, filename):
     if not os.path.isfile(os.path.join(appdir, filename)):
         print('downloading ' + filename)
         url = 'https://github.com/drdhaval2785/python-prakriya/releases/download/v0.0.2/' + filename
+        import requests
         with open(os.path.join(appdir, filename), "wb") as fin:
             ret = requests.get(url)
             fin.write(ret.content)
@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Check every verb form of the dataset against the reference behaviour.
+
+For every shard, every verb form is looked up with a ``Prakriya``
+object as it serves (transliteration backend, caches, Bloom filter,
+trie or block store, sized shards), and its result in every output
+transliteration is compared with the reference: the records of the
+shard JSON rendered plainly, with ``indic_transliteration`` and
+without caches. Reading forms back from every input transliteration
+is checked the same way.
+
+The records are also cross checked with the tables of
+``VerbFormGenerator``. Every (verb, number, lakara, suffix, form) of
+``mapforms2.json`` should be a record of its verb form, and the other
+way round.
+
+Shards are checked by ``jobs`` processes at the same time. Shards not
+yet extracted from the tar.gz are extracted first.
+
+A mismatch is a dict with ``kind`` (``output``, ``input``, ``error``,
+``generator_only`` or ``prakriya_only``), ``shard`` and ``form``, and,
+as the kind needs, ``tran``, ``where`` (see ``first_difference()``),
+``expected`` and ``got``.
+
+Example
+-------
+
+    >>> from prakriya.verify import verify
+    >>> report = verify(jobs=8)
+    >>> report['counts']
+    >>> report['mismatches'][:10]
+"""
+import json
+import multiprocessing
+import os
+import tarfile
+import time
+import zlib
+from collections import Counter
+from .exceptions import PrakriyaError
+from .utils import convert
+
+
+# Reference transliterations. This and the cache of convert are cleared
+# when they grow past REFERENCE_LIMIT.
+REFERENCE_CACHE = {}
+REFERENCE_LIMIT = 500000
+# Prakriya object and options of a worker process.
+_WORKER = {}
+
+
+def reference_convert(text, intran, outtran):
+    """Transliterate as prakriya always did, with sanscript."""
+    key = (text, intran, outtran)
+    if key in REFERENCE_CACHE:
+        return REFERENCE_CACHE[key]
+    if len(REFERENCE_CACHE) > REFERENCE_LIMIT:
+        REFERENCE_CACHE.clear()
+    if intran == outtran:
+        result = text
+    else:
+        from indic_transliteration import sanscript
+        result = sanscript.transliterate(text, intran,
+                                         outtran).replace('|', '.')
+    REFERENCE_CACHE[key] = result
+    return result
+
+
+def reference_result(data, outtran, sutrainfo):
+    """Return the records of a verb form as Prakriya gives them."""
+    from .verbforms import CONVERTIBLE
+    result = []
+    for datum in data:
+        subresult = {}
+        for (item, value) in datum.items():
+            if item == 'derivation':
+                continue
+            value = value.replace('!', '~')
+            if item in CONVERTIBLE:
+                value = reference_convert(value, 'slp1', outtran)
+            subresult[item] = value
+        subresult['prakriya'] = []
+        for member in datum.get('derivation', []):
+            sutratext = sutrainfo.get(member['sutra_num'], '')
+            subresult['prakriya'].append({
+                'sutra': reference_convert(sutratext, 'slp1', outtran),
+                'sutra_num': member['sutra_num'].replace('~', '-'),
+                'form': reference_convert(member['form'].replace('@', 'u~'),
+                                          'slp1', outtran)})
+        result.append(subresult)
+    return result
+
+
+def first_difference(expected, got):
+    """Return (where, expected value, got value) of the first difference.
+
+    ``where`` is e.g. ``[0, 'prakriya', 3]`` for the fourth step of the
+    first record, and ``[]`` if the number of records differs.
+    """
+    if not isinstance(got, list) or len(got) != len(expected):
+        return ([], expected, got)
+    for (record, (left, right)) in enumerate(zip(expected, got)):
+        for field in sorted(set(left) | set(right)):
+            (value, other) = (left.get(field), right.get(field))
+            if value == other:
+                continue
+            if (isinstance(value, list) and isinstance(other, list) and
+                    len(value) == len(other)):
+                for (step, (member, othermember)) in enumerate(
+                        zip(value, other)):
+                    if member != othermember:
+                        return ([record, field, step], member, othermember)
+            return ([record, field], value, other)
+    return ([], expected, got)
+
+
+def generator_rows(data, sample=1):
+    """Yield (verb, number, lakara, suffix, form) of generator tables."""
+    for (verb, numbers) in data.items():
+        for (number, lakaras) in numbers.items():
+            for (lakara, suffices) in lakaras.items():
+                for (suffix, verbforms) in suffices.items():
+                    for verbform in verbforms:
+                        if sampled(verbform, sample):
+                            yield (verb, number, lakara, suffix, verbform)
+
+
+def record_row(datum, verbform):
+    """Return (verb, number, lakara, suffix, form) of a record."""
+    return tuple([datum.get(field, '').replace('!', '~') for field
+                  in ['verb', 'number', 'lakara', 'suffix']] + [verbform])
+
+
+def sampled(verbform, sample):
+    """Return whether verbform is one of the 1 in sample checked."""
+    return sample == 1 or zlib.crc32(verbform.encode('utf-8')) % sample == 0
+
+
+def extract_missing(prakriya, slugnames):
+    """Extract shards which are not on the disk, reading the tar once.
+
+    Shards already on the disk (maybe updated) are left as they are.
+    """
+    missing = set('json/' + slugname + '.json' for slugname in slugnames
+                  if not os.path.isfile(os.path.join(prakriya.appdir, 'json',
+                                                     slugname + '.json')))
+    if not missing or not os.path.isfile(prakriya.tarfile):
+        return
+    with tarfile.open(prakriya.tarfile, 'r|gz') as tar:
+        for member in tar:
+            if member.name in missing:
+                tar.extract(member, prakriya.appdir)
+
+
+def init_worker(outtrans, intrans, sample, store, limit):
+    """Start a Prakriya object in the worker."""
+    from .verbforms import Prakriya
+    prakriya = Prakriya()
+    if store == 'trie':
+        prakriya.use_trie_store()
+    elif store == 'blocks':
+        prakriya.use_block_store()
+    elif store == 'sized':
+        prakriya.use_sized_shards()
+    _WORKER.update({'prakriya': prakriya, 'outtrans': outtrans,
+                    'intrans': intrans, 'sample': sample, 'limit': limit})
+
+
+def verify_shard(task):
+    """Check the verb forms of a shard. task is (slugname, generator rows).
+
+    Returns {shard, forms, comparisons, counts, mismatches}.
+    """
+    (slugname, rows) = task
+    prakriya = _WORKER['prakriya']
+    outtrans = _WORKER['outtrans']
+    result = {'shard': slugname, 'forms': 0, 'comparisons': 0,
+              'counts': Counter(), 'mismatches': []}
+
+    def mismatch(kind, verbform, **details):
+        """Count a mismatch, and keep it if there are not too many."""
+        result['counts'][kind] += 1
+        if result['counts'][kind] <= _WORKER['limit']:
+            details.update({'kind': kind, 'shard': slugname,
+                            'form': verbform})
+            result['mismatches'].append(details)
+
+    path = os.path.join(prakriya.appdir, 'json', slugname + '.json')
+    try:
+        with open(path, 'r') as fin:
+            compositedata = json.load(fin)
+    except (IOError, OSError, ValueError) as error:
+        mismatch('error', None, got=str(error))
+        return result
+    records = set()
+    for verbform in sorted(compositedata):
+        if not sampled(verbform, _WORKER['sample']):
+            continue
+        data = compositedata[verbform]
+        result['forms'] += 1
+        records.update(record_row(datum, verbform) for datum in data)
+        try:
+            got = prakriya.get_info(verbform, '', 'slp1', outtrans)
+        except PrakriyaError as error:
+            mismatch('error', verbform, got=str(error))
+            continue
+        for tran in outtrans:
+            expected = reference_result(data, tran, prakriya.sutrainfo)
+            result['comparisons'] += 1
+            if got[tran] != expected:
+                (where, value, other) = first_difference(expected, got[tran])
+                mismatch('output', verbform, tran=tran, where=where,
+                         expected=value, got=other)
+        for tran in _WORKER['intrans']:
+            text = reference_convert(verbform, 'slp1', tran)
+            expected = reference_convert(text, tran, 'slp1')
+            calculated = convert(text, tran, 'slp1')
+            result['comparisons'] += 1
+            if calculated != expected:
+                mismatch('input', verbform, tran=tran, expected=expected,
+                         got=calculated)
+    if rows is not None:
+        rows = set(rows)
+        for row in sorted(rows - records):
+            mismatch('generator_only', row[4], expected=list(row))
+        for row in sorted(records - rows):
+            mismatch('prakriya_only', row[4], expected=list(row))
+    # Keep the memory of the worker bounded.
+    prakriya.shardreader.cache.clear()
+    if len(convert.cache) > REFERENCE_LIMIT:
+        convert.cache.clear()
+    result['counts'] = dict(result['counts'])
+    return result
+
+
+def verify(outtrans=None, intrans=None, jobs=None, sample=1, store=None,
+           generator=True, limit=100):
+    """Check every verb form, and return the report.
+
+    ``outtrans`` and ``intrans`` are the transliterations checked,
+    all valid ones by default.
+    ``jobs`` is the number of processes, all CPUs by default.
+    ``sample`` - check one verb form in ``sample`` (by a hash of it).
+    ``store`` is ``trie``, ``blocks`` or ``sized`` to read with that
+    store (see ``Prakriya.use_sized_shards()``).
+    ``generator`` - cross check with the VerbFormGenerator tables.
+    ``limit`` - mismatches of each kind kept per shard.
+
+    Returns a dict with ``shards``, ``forms``, ``comparisons``,
+    ``counts`` (mismatches of each kind), ``mismatches`` and
+    ``seconds``.
+    """
+    from .verbforms import Prakriya, VALIDTRANS
+    start = time.time()
+    if outtrans is None:
+        outtrans = VALIDTRANS
+    if intrans is None:
+        intrans = VALIDTRANS
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+    prakriya = Prakriya()
+    slugnames = sorted(set(prakriya.jsonindex.values()))
+    extract_missing(prakriya, slugnames)
+    report = {'shards': 0, 'forms': 0, 'comparisons': 0, 'counts': Counter(),
+              'mismatches': []}
+    tasks = dict((slugname, None) for slugname in slugnames)
+    if generator:
+        from .generate import VerbFormGenerator
+        tasks = dict((slugname, []) for slugname in slugnames)
+        for row in generator_rows(VerbFormGenerator().data, sample):
+            if row[4][:3] in prakriya.jsonindex:
+                tasks[prakriya.shard_slug(row[4])].append(row)
+            else:
+                report['counts']['generator_only'] += 1
+                report['mismatches'].append({
+                    'kind': 'generator_only', 'shard': None,
+                    'form': row[4], 'expected': list(row)})
+    initargs = (list(outtrans), list(intrans), sample, store, limit)
+    if jobs == 1:
+        init_worker(*initargs)
+        results = map(verify_shard, tasks.items())
+    else:
+        pool = multiprocessing.Pool(jobs, init_worker, initargs)
+        results = pool.imap_unordered(verify_shard, tasks.items())
+    try:
+        for result in results:
+            report['shards'] += 1
+            report['forms'] += result['forms']
+            report['comparisons'] += result['comparisons']
+            report['counts'].update(result['counts'])
+            report['mismatches'].extend(result['mismatches'])
+    finally:
+        if jobs != 1:
+            pool.terminate()
+    report['counts'] = dict(report['counts'])
+    report['seconds'] = time.time() - start
+    return report
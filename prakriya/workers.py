@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Load the data once in a master process, then fork the workers.
+
+Forked processes share the pages of their parent until one of them
+writes to a page (copy on write). Reading a Python object writes to it
+anyway, to its reference count, and every pass of the cyclic garbage
+collector writes to the header of every object it tracks. With the
+collector running, each worker soon has its own copy of the indexes and
+shards, and N workers take N times the memory.
+
+``preload()`` loads everything the workers need in the master process:
+``jsonindex.json``, ``sutrainfo.json``, ``mapforms2.json``,
+``verbmap.json`` and the shards asked for. The collector is disabled
+while loading, so that the new objects are not spread over pages freed
+by collections, and then ``gc.freeze()`` moves every object out of the
+reach of the collector, which runs again for the newer objects only.
+The workers started by ``pool()`` or
+``fork_workers()`` then share those pages; only the pages of the
+objects they read for reference counts are copied, not the whole heap.
+
+``after_fork()`` runs first in every worker. It reopens the tar.gz,
+whose file offset would otherwise be shared by all workers.
+
+Needs the ``fork`` start method (not on Windows).
+
+Example
+-------
+
+    >>> from prakriya import workers
+    >>> loaded = workers.preload(logfile='access.log', top=10000)
+    >>> pool = workers.pool(8)
+    >>> pool.map(workers.lookup, ['Bavati', 'gacCati'])
+    >>> workers.process_memory()
+"""
+import gc
+import multiprocessing
+import os
+import signal
+import tarfile
+
+
+# Objects loaded by preload(), inherited by the workers.
+PRELOADED = {}
+
+
+def preload(forms=None, shards=None, logfile=None, top=None, scripts=None,
+            store=None, generator=True, prakriya=None):
+    """Load the data for the workers, and keep it from the collector.
+
+    ``forms``, ``shards``, ``logfile``, ``top`` and ``scripts`` are as for
+    ``Prakriya.prewarm()``; ``shards='all'`` loads every shard.
+    ``store`` is ``trie``, ``blocks`` or ``sized`` to read with that
+    store. ``generator`` also loads a VerbFormGenerator. ``prakriya``
+    is a Prakriya object to use instead of a new one.
+
+    Returns PRELOADED, {'prakriya': object, 'generator': object or
+    None}.
+    """
+    gc.disable()
+    try:
+        if prakriya is None:
+            from .verbforms import Prakriya
+            prakriya = Prakriya()
+            if store == 'trie':
+                prakriya.use_trie_store()
+            elif store == 'blocks':
+                prakriya.use_block_store()
+            elif store == 'sized':
+                prakriya.use_sized_shards()
+        if shards == 'all':
+            shards = prakriya.shard_names()
+        if forms or shards or logfile:
+            prakriya.prewarm(forms=forms, shards=shards, logfile=logfile,
+                             top=top, scripts=scripts, wait=True)
+        gen = None
+        if generator:
+            from .generate import VerbFormGenerator
+            gen = VerbFormGenerator()
+    except BaseException:
+        # Nothing is frozen; the collector runs again.
+        gc.enable()
+        raise
+    PRELOADED.update({'prakriya': prakriya, 'generator': gen})
+    freeze()
+    return PRELOADED
+
+
+def freeze():
+    """Keep the objects loaded so far from the collector.
+
+    ``preload()`` calls it. Call it again after loading more in the
+    master process.
+    """
+    gc.collect()
+    gc.freeze()
+    gc.enable()
+
+
+def release():
+    """Give the preloaded data back to the collector, in this process."""
+    gc.unfreeze()
+    gc.enable()
+
+
+def after_fork():
+    """Make the inherited objects safe to use in a forked worker."""
+    prakriya = PRELOADED.get('prakriya')
+    if prakriya is not None:
+        prakriya.tar = tarfile.open(prakriya.tarfile, 'r:gz')
+
+
+def _start(target, args):
+    """Run target in a forked worker."""
+    after_fork()
+    target(*args)
+
+
+def fork_workers(count, target, args=()):
+    """Fork count processes running target(*args), and return them.
+
+    Call ``preload()`` first. Wait for them with ``wait()``.
+    """
+    context = multiprocessing.get_context('fork')
+    processes = []
+    for number in range(count):
+        process = context.Process(target=_start, args=(target, args))
+        process.daemon = True
+        process.start()
+        processes.append(process)
+    return processes
+
+
+def _terminated(signum, frame):
+    """Exit when terminated, so that the workers are stopped too."""
+    raise SystemExit(128 + signum)
+
+
+def wait(processes):
+    """Wait for the forked workers to exit.
+
+    If this process is interrupted or terminated first, the workers are
+    terminated.
+    """
+    previous = signal.signal(signal.SIGTERM, _terminated)
+    try:
+        for process in processes:
+            process.join()
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+
+
+def _init_pool(initializer, initargs):
+    """Start a worker of pool()."""
+    after_fork()
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def pool(jobs, initializer=None, initargs=()):
+    """Return a multiprocessing Pool of jobs forked workers.
+
+    Call ``preload()`` first. ``initializer(*initargs)`` runs in every
+    worker after ``after_fork()``, and finds the preloaded objects in
+    PRELOADED.
+    """
+    context = multiprocessing.get_context('fork')
+    return context.Pool(jobs, _init_pool, (initializer, initargs))
+
+
+def lookup(verbform, field='', intran='slp1', outtran='slp1'):
+    """Return get_info() of the preloaded Prakriya object."""
+    return PRELOADED['prakriya'].get_info(verbform, field, intran, outtran)
+
+
+def process_memory(pid=None):
+    """Return {rss, pss, shared, private} bytes of a process (this one).
+
+    ``pss`` counts every shared page divided by the number of processes
+    sharing it, so that the ``pss`` of the master and the workers add up
+    to the memory they take together. Returns None if unknown (only
+    Linux has ``/proc/<pid>/smaps_rollup``).
+    """
+    path = os.path.join('/proc', str(pid or 'self'), 'smaps_rollup')
+    fields = {'Rss': 'rss', 'Pss': 'pss', 'Shared_Clean': 'shared',
+              'Shared_Dirty': 'shared', 'Private_Clean': 'private',
+              'Private_Dirty': 'private'}
+    memory = {'rss': 0, 'pss': 0, 'shared': 0, 'private': 0}
+    try:
+        with open(path, 'r') as fin:
+            for line in fin:
+                parts = line.split()
+                name = parts[0].rstrip(':')
+                if name in fields and len(parts) > 1:
+                    memory[fields[name]] += int(parts[1]) * 1024
+    except (IOError, OSError, ValueError):
+        return None
+    return memory
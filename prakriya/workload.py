@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Generate and replay skewed workloads, to compare caches and stores.
+
+Words of real texts follow Zipf's law: a few forms are most of the
+tokens. ``make_workload()`` draws requests from the dataset's own verb
+forms, the form of rank r (in a random order of all forms) with a
+weight of 1 / r ** skew. Every request is in a script drawn from a
+script mix, and asks for a field drawn from a field mix. A share of
+the requests are for VerbFormGenerator instead.
+
+A workload is a list of requests, one JSON object per line on disk:
+
+    ``{"form": form, "field": field, "tran": script}`` - a lookup with
+    ``Prakriya.get_info()``. ``field`` is "" for all the data.
+
+    ``{"verb": verb, "lakara": lakara, "suffix": suffix, "tran":
+    script}`` - ``VerbFormGenerator.getforms()``. ``suffix`` is "" for
+    the whole lakara.
+
+Texts are in ``tran`` and results are asked in it too. Any other line
+(e.g. of an access log) is a lookup of all data of that form in SLP1.
+
+``run_workload()`` sends the requests to a ``Prakriya`` object, or to
+a ``prakriya.cluster.ClusterPrakriya`` of local ``prakriya-serve``
+nodes, and to a VerbFormGenerator, and reports throughput, latency
+percentiles and the hit rates of the caches it can see.
+
+Example
+-------
+
+    >>> from prakriya import Prakriya
+    >>> from prakriya.workload import make_workload, run_workload
+    >>> requests = make_workload(100000, skew=1.1,
+    ...                          scripts={'devanagari': 3, 'iast': 1})
+    >>> run_workload(requests, Prakriya())
+"""
+import bisect
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .exceptions import PrakriyaError
+from .generate import materialize
+from .utils import app_dir, convert
+
+
+def generator_forms(data):
+    """Return the sorted verb forms of VerbFormGenerator data."""
+    verbforms = set()
+    for numbers in data.values():
+        for lakaras in numbers.values():
+            for suffices in lakaras.values():
+                for forms in suffices.values():
+                    verbforms.update(forms)
+    return sorted(verbforms)
+
+
+def dataset_forms(appdir=None):
+    """Return the sorted verb forms of all shards. Reads every shard."""
+    from .export import iter_shards
+    if appdir is None:
+        appdir = app_dir('prakriya')
+    verbforms = []
+    for (slugname, compositedata) in iter_shards(appdir):
+        verbforms.extend(compositedata)
+    return sorted(verbforms)
+
+
+class Zipf():
+    """Draw items with weight 1 / rank ** skew.
+
+    Ranks are given to the items in a random order (from ``rng``), so
+    that the most frequent items are not, say, alphabetically first.
+    """
+
+    def __init__(self, items, skew=1.0, rng=None):
+        """Order the items and sum the weights."""
+        if rng is None:
+            rng = random.Random(0)
+        self.items = list(items)
+        rng.shuffle(self.items)
+        self.cumulative = []
+        total = 0.0
+        for rank in range(1, len(self.items) + 1):
+            total += 1.0 / rank ** skew
+            self.cumulative.append(total)
+        self.rng = rng
+
+    def draw(self):
+        """Return an item."""
+        value = self.rng.random() * self.cumulative[-1]
+        return self.items[bisect.bisect(self.cumulative, value)]
+
+
+def parse_mix(text):
+    """Return {name: weight} of 'name:weight,name,...' (weight 1)."""
+    mix = {}
+    for member in text.split(','):
+        member = member.strip()
+        if not member:
+            continue
+        (name, sep, weight) = member.partition(':')
+        mix[name.strip()] = float(weight) if sep else 1.0
+    return mix
+
+
+def _chooser(mix, rng):
+    """Return a function which draws a name of mix by its weight."""
+    names = sorted(mix)
+    weights = [mix[name] for name in names]
+    return lambda: rng.choices(names, weights)[0]
+
+
+def make_workload(count, skew=1.0, scripts=None, fields=None,
+                  generate=0.0, forms=None, generator=None, seed=0):
+    """Return a list of count requests.
+
+    ``skew`` is the exponent of Zipf's law (0 is uniform).
+    ``scripts`` and ``fields`` are {name: weight}; by default SLP1 and
+    all fields (field ""). ``generate`` is the share of
+    VerbFormGenerator requests, whose verbs follow the same law.
+    ``forms`` are the verb forms (SLP1) to draw from, by default those
+    of the VerbFormGenerator data. ``generator`` is a VerbFormGenerator,
+    made if needed. The same ``seed`` gives the same workload.
+    """
+    rng = random.Random(seed)
+    script = _chooser(scripts or {'slp1': 1}, rng)
+    field = _chooser(fields or {'': 1}, rng)
+    if generator is None and (forms is None or generate):
+        from .generate import VerbFormGenerator
+        generator = VerbFormGenerator()
+    if forms is None:
+        forms = generator_forms(generator.data)
+    formzipf = Zipf(forms, skew, rng)
+    if generate:
+        verbzipf = Zipf(sorted(generator.data), skew, rng)
+    requests = []
+    for number in range(count):
+        tran = script()
+        if generate and rng.random() < generate:
+            verb = verbzipf.draw()
+            lakaras = {}
+            for member in generator.data[verb].values():
+                for (lakara, suffices) in member.items():
+                    lakaras.setdefault(lakara, set()).update(suffices)
+            lakara = rng.choice(sorted(lakaras))
+            suffix = rng.choice(sorted(lakaras[lakara]) + [''])
+            requests.append({'verb': convert(verb, 'slp1', tran),
+                             'lakara': convert(lakara, 'slp1', tran),
+                             'suffix': convert(suffix, 'slp1', tran),
+                             'tran': tran})
+        else:
+            requests.append({'form': convert(formzipf.draw(), 'slp1', tran),
+                             'field': field(), 'tran': tran})
+    return requests
+
+
+def write_workload(requests, path):
+    """Write requests to path, one JSON object per line."""
+    with open(path, 'w') as fout:
+        for request in requests:
+            fout.write(json.dumps(request, ensure_ascii=False) + '\n')
+
+
+def read_workload(path):
+    """Return the requests written by write_workload(), or of a log.
+
+    Lines which are not JSON objects are lookups of a form in SLP1.
+    """
+    requests = []
+    with open(path, 'r') as fin:
+        for line in fin:
+            line = line.strip()
+            if line.startswith('{'):
+                requests.append(json.loads(line))
+            elif line:
+                requests.append({'form': line, 'field': '', 'tran': 'slp1'})
+    return requests
+
+
+def percentile(values, share):
+    """Return the value below which share of the sorted values are."""
+    if not values:
+        return None
+    index = min(len(values) - 1, int(share * len(values)))
+    return values[index]
+
+
+def run_workload(requests, prakriya=None, generator=None, threads=1):
+    """Send the requests and return the report.
+
+    ``prakriya`` is a Prakriya or ClusterPrakriya object (made if
+    needed), ``generator`` a VerbFormGenerator (made if needed).
+    ``threads`` send requests at the same time.
+
+    Returns a dict with ``requests``, ``errors`` (e.g. forms not in
+    the database), ``seconds``, ``throughput`` (requests per second),
+    ``latency`` ({mean, p50, p90, p99, p999, max} in milliseconds) and
+    ``hits`` ({cache: {hits, misses, rate}} of the caches of an
+    in-process Prakriya object).
+    """
+    from .telemetry import Telemetry
+    lookups = any('form' in request for request in requests)
+    if prakriya is None and lookups:
+        from .verbforms import Prakriya
+        prakriya = Prakriya()
+    if generator is None and len(requests) > 0 and not all(
+            'form' in request for request in requests):
+        from .generate import VerbFormGenerator
+        generator = VerbFormGenerator()
+    # Counters of caches before the run.
+    telemetry = None
+    if getattr(prakriya, 'telemetry', False) is None:
+        telemetry = prakriya.telemetry = Telemetry()
+    before = cache_counts(prakriya)
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def send(request):
+        """Send a request, and keep its latency."""
+        start = time.perf_counter()
+        try:
+            if 'form' in request:
+                prakriya.get_info(request['form'], request.get('field', ''),
+                                  request['tran'], request['tran'])
+            else:
+                # Views of all forms are read lazily; time the reading.
+                materialize(generator.getforms(
+                    request['verb'], request['lakara'],
+                    suffix=request.get('suffix', ''),
+                    intran=request['tran'], outtran=request['tran']))
+            failed = 0
+        except PrakriyaError:
+            failed = 1
+        latency = time.perf_counter() - start
+        with lock:
+            latencies.append(latency)
+            errors[0] += failed
+
+    start = time.perf_counter()
+    if threads == 1:
+        for request in requests:
+            send(request)
+    else:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            for result in executor.map(send, requests):
+                pass
+    seconds = time.perf_counter() - start
+    after = cache_counts(prakriya)
+    if telemetry is not None:
+        prakriya.telemetry = None
+        after['shards'] = (sum(telemetry.shard_hits.values()) -
+                           sum(telemetry.cold_loads.values()),
+                           sum(telemetry.cold_loads.values()))
+    latencies.sort()
+    hits = {}
+    for (name, (hit, miss)) in after.items():
+        (hit, miss) = (hit - before.get(name, (0, 0))[0],
+                       miss - before.get(name, (0, 0))[1])
+        hits[name] = {'hits': hit, 'misses': miss,
+                      'rate': float(hit) / (hit + miss) if hit + miss
+                      else None}
+    milliseconds = [latency * 1000 for latency in latencies]
+    return {'requests': len(requests), 'errors': errors[0],
+            'seconds': seconds,
+            'throughput': len(requests) / seconds if seconds else None,
+            'latency': {'mean': sum(milliseconds) / len(milliseconds)
+                        if milliseconds else None,
+                        'p50': percentile(milliseconds, 0.5),
+                        'p90': percentile(milliseconds, 0.9),
+                        'p99': percentile(milliseconds, 0.99),
+                        'p999': percentile(milliseconds, 0.999),
+                        'max': milliseconds[-1] if milliseconds else None},
+            'hits': hits}
+
+
+def cache_counts(prakriya):
+    """Return {cache: (hits, misses)} so far of a Prakriya object."""
+    counts = {}
+    if getattr(prakriya, 'blockstore', None) is not None:
+        info = prakriya.blockstore.read_block.cache_info()
+        counts['blocks'] = (info.hits, info.misses)
+    if getattr(prakriya, 'sharedcache', None) is not None:
+        counts['shared'] = (prakriya.sharedcache.hits,
+                            prakriya.sharedcache.misses)
+    return counts
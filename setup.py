@@ -34,7 +34,20 @@ setup(
     entry_points={
         'console_scripts': [
             'prakriya=prakriya.cli:main',
-            'generate=prakriya.cli:generate'
+            'generate=prakriya.cli:generate',
+            'prakriya-batch=prakriya.cli:batch',
+            'generate-batch=prakriya.cli:generate_batch',
+            'prakriya-update=prakriya.cli:update',
+            'prakriya-export=prakriya.cli:export',
+            'prakriya-sutra-index=prakriya.cli:sutra_index',
+            'prakriya-trie-store=prakriya.cli:trie_store',
+            'prakriya-block-store=prakriya.cli:block_store',
+            'prakriya-bloom=prakriya.cli:bloom',
+            'prakriya-memory=prakriya.cli:memory',
+            'prakriya-serve=prakriya.cli:serve',
+            'prakriya-verify=prakriya.cli:verify',
+            'prakriya-reshard=prakriya.cli:reshard',
+            'prakriya-workload=prakriya.cli:workload'
         ]
     },
     include_package_data=True,
@@ -55,9 +68,8 @@ setup(
         'Programming Language :: Python :: 3.9',
         'Programming Language :: Python :: 3.8',
         'Programming Language :: Python :: 3.7',
-        'Programming Language :: Python :: 3.6',
-        'Programming Language :: Python :: 3.5',
     ],
+    python_requires='>=3.7',
     test_suite='tests',
     tests_require=test_requirements,
     setup_requires=setup_requirements,
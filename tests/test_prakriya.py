@@ -6,10 +6,54 @@
 
 import unittest
 import json
+import gc
+import io
+import multiprocessing
 import os.path
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
 from click.testing import CliRunner
 from prakriya import Prakriya, VerbFormGenerator
+from prakriya import TransliterationError, FormNotFoundError
+from prakriya import VerbNotFoundError
 from prakriya import cli
+from prakriya.generate import FormsView
+from prakriya.telemetry import Telemetry, recommend_cache_budget
+from prakriya import dataset
+from prakriya.export import export, read_table
+from prakriya.analytics import build_sutra_index, SutraIndex
+from prakriya.trie import build_trie_store
+from prakriya.blockstore import build_block_store
+from prakriya.reshard import reshard, boundaries
+from prakriya.sharedcache import SharedCache
+from prakriya.bloom import build_bloom, read_bloom
+from prakriya.memory import deep_sizeof
+from prakriya.verify import verify, reference_convert
+from prakriya.cluster import ClusterPrakriya, HashRing, make_server
+from prakriya import workload
+from prakriya import workers
+from prakriya import utils
+from indic_transliteration import sanscript
+
+
+# Seconds allowed for ``import prakriya`` and for the first lookup
+# (including ``Prakriya()``) of an extracted shard in a new process.
+IMPORT_BUDGET = 0.5
+FIRST_LOOKUP_BUDGET = 2.0
+COLD_START = """
+import sys
+import time
+start = time.time()
+import prakriya
+imported = time.time()
+prakriya.Prakriya().get_info('Bavati', 'verb')
+print(imported - start, time.time() - imported)
+print(' '.join(sorted(sys.modules)))
+"""
 
 
 def read_json(path):
@@ -18,13 +62,15 @@ def read_json(path):
         return json.load(fin)
 
 
-def comparetranslit(verbform, intran, outtran, arguments=''):
-    """Compare the transliteration conversion from prestored data."""
-    prak = Prakriya()
+def comparetranslit(prak, superdata, verbform, intran, outtran,
+                    arguments=''):
+    """Compare the transliteration conversion from prestored data.
+
+    superdata is the content of tests/testdata/Bavati.json.
+    """
     prak.input_translit(intran)
     prak.output_translit(outtran)
     calculated = prak.get_info(verbform, arguments)
-    superdata = read_json(os.path.join('tests', 'testdata', 'Bavati.json'))
     wholedata = superdata[outtran]
     if arguments == '':
         assert calculated == wholedata
@@ -45,17 +91,658 @@ class TestPrakriya(unittest.TestCase):
     def test_false_input(self):
         """Test for false input transliteration."""
         prak = Prakriya()
-        with self.assertRaises(SystemExit):
+        with self.assertRaises(TransliterationError):
             prak.input_translit('asdfasdf')
+        # Only output transliterations may be a list.
+        with self.assertRaises(TransliterationError):
+            prak.input_translit(['slp1', 'iast'])
+        with self.assertRaises(TransliterationError):
+            prak.get_info('Bavati', 'verb', intran=['slp1'])
+        with self.assertRaises(TransliterationError):
+            VerbFormGenerator().getforms('BU', 'law', outtran=['iast'])
+        assert prak.get_info('Bavati', 'verb', outtran=['slp1']) == {
+            'slp1': ['BU']}
 
     def test_false_output(self):
         """Test for false output transliteration."""
         prak = Prakriya()
-        with self.assertRaises(SystemExit):
+        with self.assertRaises(TransliterationError):
             prak.output_translit('fdasfdas')
+        with self.assertRaises(TransliterationError):
+            prak.get_info('Bavati', outtran=['iast', 'fdasfdas'])
+
+    def test_missing_form(self):
+        """Test errors for unknown forms and the batch error records."""
+        prak = Prakriya()
+        for _ in range(2):
+            with self.assertRaises(FormNotFoundError):
+                prak.get_info('Bavatiq')
+        assert 'Bavatiq' in prak.missing
+        results = list(prak.batch_info(['Bavatiq', 'Bavati'], ['verb'],
+                                       errors='record'))
+        assert isinstance(results[0][1], FormNotFoundError)
+        assert results[1][1] == prak.get_info('Bavati', ['verb'])
+        prak.reload()
+        assert not prak.missing
+
+    def test_block_store(self):
+        """Test records read from the compressed block store."""
+        prak = Prakriya()
+        verbforms = sorted(prak.load_shard(prak.shard_slug('Bavati')))
+        expected = [prak.get_info(verbform, '', outtran='devanagari')
+                    for verbform in verbforms]
+        directory = os.path.join(tempfile.mkdtemp(), 'blocks')
+        try:
+            counts = build_block_store(outdir=directory, blocksize=512)
+            assert counts['blocks'] > 1
+            prak.use_block_store(directory)
+            assert [prak.get_info(verbform, '', outtran='devanagari')
+                    for verbform in verbforms] == expected
+            with self.assertRaises(FormNotFoundError):
+                prak.get_info('Bavatiq')
+            assert prak.analyse_text('Bavati')[0]['form'] == 'Bavati'
+            # Built again with larger blocks, and reloaded.
+            slugname = prak.shard_slug('Bavati')
+            blocks = len(prak.blockstore.index[slugname][1])
+            build_block_store(outdir=directory, blocksize=65536)
+            # The old store is read till the reload.
+            prak.blockstore.read_block.cache_clear()
+            assert [prak.get_info(verbform, '', outtran='devanagari')
+                    for verbform in verbforms] == expected
+            old = prak.blockstore
+            prak.reload()
+            assert old.blocks.closed and old.fin.closed
+            assert len(prak.blockstore.index[slugname][1]) < blocks
+            assert [prak.get_info(verbform, '', outtran='devanagari')
+                    for verbform in verbforms] == expected
+            prak.blockstore.close()
+        finally:
+            shutil.rmtree(os.path.dirname(directory))
+
+    def test_sized_shards(self):
+        """Test shards of bounded size found by binary search."""
+        assert boundaries([5, 5, 5, 20, 1], 10) == [0, 2, 3, 4]
+        prak = Prakriya()
+        verbforms = []
+        for slugname in prak.shard_names():
+            verbforms.extend(prak.load_shard(slugname))
+        expected = [prak.get_info(verbform, '', outtran='iast')
+                    for verbform in verbforms]
+        sizes = [len(json.dumps(prak.load_shard(prak.shard_slug(verbform))
+                                [verbform])) for verbform in verbforms]
+        maxsize = sorted(sizes)[-2] * 2
+        directory = os.path.join(tempfile.mkdtemp(), 'shards')
+        try:
+            counts = reshard(outdir=directory, maxsize=maxsize)
+            assert counts['after']['largest'] <= max(maxsize, max(sizes))
+            prak.use_sized_shards(directory)
+            assert counts['after']['shards'] == len(prak.shard_names()) > 1
+            assert [prak.get_info(verbform, '', outtran='iast')
+                    for verbform in verbforms] == expected
+            for verbform in verbforms:
+                assert verbform in prak.load_shard(prak.shard_slug(verbform))
+            with self.assertRaises(FormNotFoundError):
+                prak.get_info('Bavatiq')
+            prak.reload()
+            assert prak.shardindex is not None
+            assert prak.get_info('Bavati', 'lakara') == ['law']
+        finally:
+            shutil.rmtree(os.path.dirname(directory))
+
+    @unittest.skipIf(sys.version_info < (3, 8),
+                     'needs multiprocessing.shared_memory')
+    def test_shared_cache(self):
+        """Test results shared between processes in shared memory."""
+        prak = Prakriya()
+        expected = prak.get_info('Bavati', '', outtran='devanagari')
+        cache = prak.use_shared_cache(slots=64)
+        try:
+            assert prak.get_info('Bavati', '', outtran='devanagari') == \
+                expected
+            # Another process reads what this one rendered.
+            script = ('from prakriya import Prakriya\n'
+                      'p = Prakriya()\n'
+                      'c = p.use_shared_cache(%r)\n'
+                      'p.get_info("Bavati", "", outtran="devanagari")\n'
+                      'p.get_info("Bavanti", "verb")\n'
+                      'print(c.owner, c.hits)\n' % cache.name)
+            output = subprocess.check_output([sys.executable, '-c', script])
+            assert output.split() == [b'False', b'1']
+            version = prak.manifest and prak.manifest['version']
+            assert cache.get(json.dumps(['Bavanti', 'slp1', ['verb'],
+                                         version])) == [{'verb': 'BU'}]
+            prak.get_info('Bavati', '', outtran='devanagari')
+            assert cache.hits >= 1
+            # Sets of four slots evict their oldest key.
+            small = SharedCache(slots=4, slotsize=256)
+            for number in range(5):
+                assert small.put('key' + str(number), [number])
+            assert small.get('key0') is None
+            assert small.get('key4') == [4]
+            assert not small.put('large', 'x' * 256)
+            small.close()
+            small.unlink()
+        finally:
+            cache.close()
+            cache.unlink()
+
+    def test_bloom(self):
+        """Test that the Bloom filter rejects unknown forms early."""
+        prak = Prakriya()
+        path = os.path.join(tempfile.mkdtemp(), 'bloom.bin')
+        try:
+            bloom = build_bloom(path=path)
+            (prak.bloom, version) = read_bloom(path)
+        finally:
+            shutil.rmtree(os.path.dirname(path))
+        assert prak.bloom.data == bloom.data
+        for verbform in prak.load_shard(prak.shard_slug('Bavati')):
+            assert verbform in prak.bloom
+        unknown = ['Bavati' + str(number) for number in range(1000)]
+        assert sum(verbform in prak.bloom for verbform in unknown) < 50
+        prak.telemetry = Telemetry()
+        for verbform in unknown:
+            if verbform not in prak.bloom:
+                with self.assertRaises(FormNotFoundError):
+                    prak.get_info(verbform)
+        assert not prak.telemetry.shard_hits
+        assert prak.get_info('Bavati', 'lakara') == ['law']
+
+    def test_memory_report(self):
+        """Test the memory report of data and caches."""
+        text = 'x' * 100
+        assert deep_sizeof([text, text]) == \
+            sys.getsizeof([text, text]) + sys.getsizeof(text)
+        prak = Prakriya()
+        prak.get_info('Bavati', outtran='devanagari')
+        report = prak.memory_report()
+        components = dict((component['name'], component)
+                          for component in report['components'])
+        assert components['shards']['entries'] >= 1
+        assert components['convert']['entries'] >= 1
+        assert report['total'] <= sum(component['bytes'] for component
+                                      in report['components'])
+        path = os.path.join(prak.jsondir, prak.shard_slug('Bavati') + '.json')
+        assert path in dict(report['top_shards'])
+        # The same shard read from another store is counted apart.
+        directory = os.path.join(tempfile.mkdtemp(), 'trie')
+        try:
+            build_trie_store(outdir=directory)
+            prak.use_trie_store(directory)
+            prak.get_info('Bavati')
+            shards = dict(prak.memory_report()['top_shards'])
+            assert path in shards
+            assert os.path.join(prak.jsondir, prak.shard_slug('Bavati') +
+                                '.json') in shards
+        finally:
+            shutil.rmtree(os.path.dirname(directory))
+        report = VerbFormGenerator().memory_report()
+        assert 'mapforms' in [component['name'] for component
+                              in report['components']]
+        runner = CliRunner()
+        result = runner.invoke(cli.memory, ['--generator', '-'],
+                               input='Bavati\nasdf\n')
+        assert result.exit_code == 0
+        assert 'mapforms' in result.output
+
+    def test_cluster(self):
+        """Test lookups on a cluster of local lookup nodes."""
+        prak = Prakriya()
+        slugnames = set(prak.jsonindex.values())
+        ring = HashRing(['a:1', 'b:1', 'c:1'])
+        smaller = HashRing(['a:1', 'b:1'])
+        for slugname in slugnames:
+            if ring.node_for(slugname) != 'c:1':
+                assert smaller.node_for(slugname) == ring.node_for(slugname)
+        code = 'from prakriya.cli import serve; serve()'
+        processes = []
+        nodes = []
+        try:
+            for _ in range(2):
+                process = subprocess.Popen([sys.executable, '-c', code,
+                                            '--port', '0'],
+                                           stdout=subprocess.PIPE)
+                processes.append(process)
+                line = process.stdout.readline().decode('utf-8')
+                nodes.append(line.split()[-1])
+            client = ClusterPrakriya(nodes, chunksize=2)
+            verbforms = sorted(prak.load_shard(prak.shard_slug('Bavati')))
+            verbforms = verbforms[:5] + ['asdf', 'Bavatiq', 'Bavati']
+            results = list(client.batch_info(verbforms, ['verb', 'lakara'],
+                                             outtran='devanagari',
+                                             errors='record'))
+            assert [verbform for (verbform, result) in results] == verbforms
+            for (verbform, result) in results:
+                if verbform in ['asdf', 'Bavatiq']:
+                    assert isinstance(result, FormNotFoundError)
+                else:
+                    assert result == prak.get_info(verbform,
+                                                   ['verb', 'lakara'],
+                                                   outtran='devanagari')
+            assert client['Bavati', 'verb'] == prak['Bavati', 'verb']
+            with self.assertRaises(FormNotFoundError):
+                client.get_info('Bavatiq')
+            client.close()
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait()
+
+    def test_workload(self):
+        """Test skewed workloads, their replay and their report."""
+        gen = VerbFormGenerator()
+        forms = workload.generator_forms(gen.data)
+        requests = workload.make_workload(
+            500, 2.0, {'devanagari': 1, 'iast': 1}, {'': 1, 'verb': 1},
+            0.2, generator=gen, seed=1)
+        assert requests == workload.make_workload(
+            500, 2.0, {'devanagari': 1, 'iast': 1}, {'': 1, 'verb': 1},
+            0.2, generator=gen, seed=1)
+        lookups = [request for request in requests if 'form' in request]
+        assert 300 < len(lookups) < 500
+        assert set(request['tran'] for request in requests) == \
+            set(['devanagari', 'iast'])
+        # With skew 2, the commonest form is more than half the lookups.
+        counts = {}
+        for request in lookups:
+            form = utils.convert(request['form'], request['tran'], 'slp1')
+            assert form in forms
+            counts[form] = counts.get(form, 0) + 1
+        assert max(counts.values()) > len(lookups) / 2
+        path = os.path.join(tempfile.mkdtemp(), 'workload.ndjson')
+        try:
+            workload.write_workload(requests, path)
+            assert workload.read_workload(path) == requests
+        finally:
+            shutil.rmtree(os.path.dirname(path))
+        assert workload.percentile([1, 2, 3, 4], 0.5) == 3
+        report = workload.run_workload(requests, Prakriya(), gen)
+        assert report['requests'] == 500
+        assert report['latency']['p50'] <= report['latency']['p99'] <= \
+            report['latency']['max']
+        assert report['hits']['shards']['hits'] > 0
+        # Views of all forms are read in the timed requests.
+        generated = [request for request in requests if 'form' not in
+                     request and request['suffix'] == ''][:5]
+        outputs = []
+
+        def backend(text, intran, outtran):
+            if intran == 'slp1':
+                outputs.append(text)
+            return utils.fast_backend(text, intran, outtran)
+
+        utils.set_backend(backend)
+        try:
+            workload.run_workload(generated, generator=gen)
+        finally:
+            utils.set_backend('fast')
+        assert len(generated) > 0 and len(outputs) > 0
+        # Through a local lookup server.
+        server = make_server(port=0, prakriya=Prakriya())
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            client = ClusterPrakriya(['127.0.0.1:' +
+                                      str(server.server_address[1])])
+            remote = workload.run_workload(lookups, client, threads=4)
+            client.close()
+        finally:
+            server.shutdown()
+            server.server_close()
+        assert remote['requests'] == len(lookups)
+        assert remote['errors'] <= report['errors']
+        assert remote['hits'] == {}
+
+    def test_workers(self):
+        """Test preloading the data and forking the workers."""
+        expected = Prakriya().get_info('Bavati', '')
+        loaded = workers.preload(forms=['Bavati'])
+        try:
+            prak = loaded['prakriya']
+            assert loaded['generator'].data
+            path = os.path.join(prak.jsondir, prak.shard_slug('Bavati') +
+                                '.json')
+            assert (path,) in prak.shardreader.cache
+            # Frozen, and the collector runs again.
+            assert gc.isenabled()
+            assert gc.get_freeze_count() > 0
+            pool = workers.pool(2)
+            try:
+                assert pool.map(workers.lookup, ['Bavati'] * 4) == \
+                    [expected] * 4
+            finally:
+                pool.terminate()
+            queue = multiprocessing.get_context('fork').Queue()
+            processes = workers.fork_workers(2, lambda: queue.put(
+                (gc.isenabled(), workers.lookup('Bavati', 'lakara'))))
+            results = [queue.get(timeout=60) for process in processes]
+            workers.wait(processes)
+            assert results == [(True, ['law'])] * 2
+            memory = workers.process_memory()
+            if memory is not None:
+                assert 0 < memory['pss'] <= memory['rss']
+        finally:
+            workers.release()
+            workers.PRELOADED.clear()
+        assert gc.isenabled()
+        # A failed preload enables the collector again.
+        with self.assertRaises(IOError):
+            workers.preload(store='blocks', generator=False)
+        assert gc.isenabled()
+        runner = CliRunner()
+        result = runner.invoke(cli.batch, ['--fields', 'lakara', '--jobs',
+                                           '2', '--preload'],
+                               input='Bavati\nasdfasdf\n')
+        assert result.exit_code == 0
+        assert [json.loads(line) for line in result.output.splitlines()] == \
+            [{'input': 'Bavati', 'result': [{'lakara': 'law'}]},
+             {'input': 'asdfasdf', 'error': 'not found'}]
+        assert gc.isenabled() and not workers.PRELOADED
+
+    def test_prewarm(self):
+        """Test prewarming from an access log."""
+        prak = Prakriya()
+        logfile = os.path.join(tempfile.mkdtemp(), 'access.log')
+        try:
+            prak.access_log(logfile)
+            prak.get_info('Bavati')
+            prak.get_info('Bavati', 'verb')
+            prak.access_log(None)
+            with open(logfile) as fin:
+                assert fin.read() == 'Bavati\nBavati\n'
+            thread = prak.prewarm(logfile=logfile, top=1,
+                                  scripts=['devanagari'], wait=True)
+            assert not thread.is_alive()
+            runner = CliRunner()
+            result = runner.invoke(cli.main, ['--prewarm', logfile, 'Bavati',
+                                              'verb'])
+            assert result.exit_code == 0
+            assert 'BU' in result.output
+        finally:
+            shutil.rmtree(os.path.dirname(logfile))
+        # A shard which cannot be loaded does not stop the others.
+        prak = Prakriya()
+        slugname = prak.shard_slug('Bavati')
+        prak.shardreader.cache.clear()
+        thread = prak.prewarm(shards=['nosuchshard', slugname])
+        thread.join()
+        assert [type(error) for error in thread.errors] == [KeyError]
+        path = os.path.join(prak.jsondir, slugname + '.json')
+        assert (path,) in prak.shardreader.cache
+        with self.assertRaises(KeyError):
+            prak.prewarm(shards=['nosuchshard'], wait=True)
+
+    def test_telemetry(self):
+        """Test hit counters and cache budget."""
+        prak = Prakriya()
+        gen = VerbFormGenerator()
+        path = os.path.join(tempfile.mkdtemp(), 'telemetry.json')
+        try:
+            prak.telemetry = gen.telemetry = Telemetry(path)
+            prak.get_info('Bavati')
+            prak.get_info('Bavati', 'verb')
+            # A form which is not in its shard is not a hit.
+            with self.assertRaises(FormNotFoundError):
+                prak.get_info('Bavatiq')
+            gen.getforms('BU', 'law', 'praTama', 'eka')
+            prak.telemetry.export()
+            with open(path) as fin:
+                data = json.load(fin)
+            assert data['forms'] == {'Bavati': 2}
+            assert data['requests'] == {'BU law praTama eka': 1}
+            assert data['shards'][prak.shard_slug('Bavati')]['hits'] == 2
+            budget = recommend_cache_budget(path)
+            assert budget['shards'] == [prak.shard_slug('Bavati')]
+            assert budget['forms'] == 1
+            assert prak.prewarm(logfile=path, wait=True)
+        finally:
+            shutil.rmtree(os.path.dirname(path))
+        # Hits of many threads are all counted.
+        telemetry = Telemetry()
+        threads = [threading.Thread(target=lambda: [
+            telemetry.hit('Bav', 'Bavati') for number in range(10000)])
+            for number in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert telemetry.as_dict()['shards']['Bav']['hits'] == 40000
+
+    def test_fields(self):
+        """Test rendering of selected fields only."""
+        prak = Prakriya()
+        assert prak.get_info('Bavati', ['lakara', 'gana']) == [
+            {'lakara': 'law', 'gana': 'BvAdi'}]
+        assert prak.get_info('Bavati', 'purusha') == ['praTama']
+
+    def test_delta(self):
+        """Test making and applying a dataset delta."""
+        tmpdir = tempfile.mkdtemp()
+        try:
+            olddir = os.path.join(tmpdir, 'old')
+            newdir = os.path.join(tmpdir, 'new')
+            # The new version drops the shard eDi.
+            for (appdir, form, slugnames) in [
+                    (olddir, 'Bavati', ['Bav', 'eDi', 'gam']),
+                    (newdir, 'BavataH', ['Bav', 'gam'])]:
+                os.makedirs(os.path.join(appdir, 'json'))
+                shards = {'Bav': {form: []}, 'eDi': {'eDizyante': []},
+                          'gam': {'gacCati': []}}
+                files = [('jsonindex.json', dict((slugname, slugname)
+                                                 for slugname in slugnames)),
+                         ('sutrainfo.json', {'1.1.1': form})]
+                files += [('json/' + slugname + '.json', shards[slugname])
+                          for slugname in slugnames]
+                for (filename, content) in files:
+                    with open(os.path.join(appdir, filename), 'w') as fout:
+                        json.dump(content, fout)
+            tarpath = os.path.join(olddir, 'composite_v003.tar.gz')
+            with tarfile.open(tarpath, 'w:gz') as tar:
+                tar.add(os.path.join(olddir, 'json'), 'json')
+            oldmanifest = dataset.build_manifest(olddir, 'v003')
+            delta = os.path.join(tmpdir, 'delta.tar.gz')
+            dataset.make_delta(oldmanifest, newdir, 'v004', delta)
+            # A delta whose index file does not match its manifest writes
+            # nothing, not even the shards before it.
+            bad = os.path.join(tmpdir, 'bad.tar.gz')
+            with tarfile.open(delta, 'r:gz') as tar:
+                with tarfile.open(bad, 'w:gz') as out:
+                    for member in tar:
+                        content = tar.extractfile(member).read()
+                        if member.name == 'manifest.json':
+                            manifest = json.loads(content.decode('utf-8'))
+                            manifest['files']['sutrainfo.json'] = '0' * 64
+                            content = json.dumps(manifest).encode('utf-8')
+                            member.size = len(content)
+                        out.addfile(member, io.BytesIO(content))
+            with self.assertRaises(dataset.DeltaError):
+                dataset.apply_delta(olddir, bad)
+            assert dataset.read_manifest(olddir)['version'] == 'v003'
+            assert read_json(os.path.join(olddir, 'json', 'Bav.json')) == {
+                'Bavati': []}
+            assert dataset.file_hash(os.path.join(
+                olddir, 'sutrainfo.json')) == oldmanifest['files'][
+                    'sutrainfo.json']
+            assert dataset.apply_delta(olddir, delta) == ['Bav']
+            assert dataset.read_manifest(olddir)['version'] == 'v004'
+            assert read_json(os.path.join(olddir, 'json', 'Bav.json')) == {
+                'BavataH': []}
+            assert not os.path.exists(os.path.join(olddir, 'json',
+                                                   'eDi.json'))
+            with self.assertRaises(dataset.DeltaError):
+                dataset.apply_delta(olddir, delta)
+            # Extracting the old tar.gz keeps the new shards and brings
+            # back only the missing shards of the new version.
+            os.remove(os.path.join(olddir, 'json', 'gam.json'))
+            with tarfile.open(tarpath, 'r:gz') as tar:
+                dataset.extract_shards(tar, olddir)
+            assert sorted(os.listdir(os.path.join(olddir, 'json'))) == [
+                'Bav.json', 'gam.json']
+            assert read_json(os.path.join(olddir, 'json', 'Bav.json')) == {
+                'BavataH': []}
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_multiple_outtran(self):
+        """Test many output transliterations from one lookup."""
+        prak = Prakriya()
+        superdata = read_json(os.path.join('tests', 'testdata', 'Bavati.json'))
+        trans = ['devanagari', 'iast', 'slp1']
+        assert prak.get_info('Bavati', '', outtran=trans) == dict(
+            (tran, superdata[tran]) for tran in trans)
+        assert prak.get_info('Bavati', 'verb', outtran=trans) == dict(
+            (tran, [superdata[tran][0]['verb']]) for tran in trans)
+
+    def test_analyse_text(self):
+        """Test analysis of running text."""
+        prak = Prakriya()
+        text = u'रामः भवति। सः भवतो'
+        result = prak.analyse_text(text, ['purusha'], intran='devanagari')
+        assert [(item['token'], text[item['start']:item['end']])
+                for item in result] == [(u'रामः', u'रामः'),
+                                        (u'भवति', u'भवति'),
+                                        (u'सः', u'सः'), (u'भवतो', u'भवतो')]
+        assert result[0]['analysis'] is None
+        assert result[1]['form'] == 'Bavati'
+        assert result[1]['analysis'] == [{'purusha': 'praTama'}]
+        assert result[3]['form'] == 'BavataH'
+
+    def test_export(self):
+        """Test columnar export of the dataset."""
+        Prakriya()
+        VerbFormGenerator()
+        tmpdir = tempfile.mkdtemp()
+        try:
+            counts = export(tmpdir, fmt='columns', chunksize=1000)
+            forms = read_table(os.path.join(tmpdir, 'forms'),
+                               ['form', 'lakara', 'uohyd', 'steps'])
+            assert len(forms['form']) == counts['forms']
+            index = forms['form'].index('Bavati')
+            assert forms['lakara'][index] == 'law'
+            assert forms['uohyd'][index] == Prakriya().get_info(
+                'Bavati', 'uohyd')[0]
+            steps = read_table(os.path.join(tmpdir, 'steps'))
+            assert len(steps['form']) == counts['steps'] == sum(
+                forms['steps'])
+            generated = read_table(os.path.join(tmpdir, 'generated'))
+            assert 'Bavati' in generated['form']
+            # Verb forms are not dictionary encoded.
+            assert not os.path.exists(os.path.join(tmpdir, 'steps',
+                                                   'step_form.dict'))
+            assert steps['form'][0] == forms['form'][0]
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_sutra_index(self):
+        """Test the sutra and derivation path index."""
+        prak = Prakriya()
+        path = os.path.join(tempfile.mkdtemp(), 'sutraindex.json')
+        try:
+            build_sutra_index(outpath=path)
+            index = SutraIndex(path)
+        finally:
+            shutil.rmtree(os.path.dirname(path))
+        assert 'Bavati' in index.forms_for_sutra('3.2.123')
+        pathid = index.forms['Bavati'][0]
+        assert index.path(pathid) == [member['sutra_num'] for member in
+                                      prak.get_info('Bavati')[0]]
+        assert sum(count for (pathid, count) in index.top_paths()) == sum(
+            len(ids) for ids in index.forms.values())
+        assert index.sutra_frequencies()['3.2.123'] >= 1
+        assert 'Bavati' not in index.forms_sharing_derivation('Bavati')
+
+    def test_trie_store(self):
+        """Test derivations read from the trie store."""
+        prak = Prakriya()
+        expected = prak.get_info('Bavati', '', outtran='devanagari')
+        directory = os.path.join(tempfile.mkdtemp(), 'trie')
+        try:
+            counts = build_trie_store(outdir=directory)
+            assert counts['nodes'] < counts['steps']
+            prak.use_trie_store(directory)
+            assert prak.get_info('Bavati', '', outtran='devanagari') == \
+                expected
+            assert prak.get_info('Bavati', 'lakara') == ['law']
+        finally:
+            shutil.rmtree(os.path.dirname(directory))
+
+    def test_trie_store_reload(self):
+        """Test that reload() forgets a trie store built again."""
+        prak = Prakriya()
+        slugname = prak.shard_slug('Bavati')
+        compositedata = json.loads(json.dumps(prak.load_shard(slugname)))
+        steps = len(compositedata['Bavati'][0]['derivation'])
+        tmpdir = tempfile.mkdtemp()
+        try:
+            appdir = os.path.join(tmpdir, 'appdir')
+            store = os.path.join(tmpdir, 'trie')
+            os.makedirs(os.path.join(appdir, 'json'))
+            path = os.path.join(appdir, 'json', slugname + '.json')
+            with open(path, 'w') as fout:
+                json.dump(compositedata, fout)
+            build_trie_store(appdir, store)
+            prak.use_trie_store(store)
+            assert len(prak.get_info('Bavati')[0]) == steps
+            # A new step in the derivations of the dhatu.
+            for data in compositedata.values():
+                for datum in data:
+                    datum['derivation'].insert(1, {'sutra_num': '1.1.1',
+                                                   'form': 'new'})
+            with open(path, 'w') as fout:
+                json.dump(compositedata, fout)
+            build_trie_store(appdir, store)
+            prak.reload()
+            derivation = prak.get_info('Bavati')[0]
+            assert len(derivation) == steps + 1
+            assert derivation[1]['form'] == 'new'
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_fast_transliteration(self):
+        """Test that the fast backend gives the output of sanscript."""
+        # Text is returned as it is when nothing is to be converted.
+        assert utils.transliterate('rAmaH|', 'slp1', 'slp1') == 'rAmaH|'
+        assert utils.transliterate('rAmaH|', 'slp1', 'iast') == 'rāmaḥ.'
+        superdata = read_json(os.path.join('tests', 'testdata', 'Bavati.json'))
+        texts = set(['koM', 'kzA..', 'jYa', 'rAmaH|', '#k#a', 'k<a>', ''])
+        for data in superdata['slp1']:
+            for (key, value) in data.items():
+                if key == 'prakriya':
+                    texts.update(member['form'] for member in value)
+                    texts.update(member['sutra'] for member in value)
+                else:
+                    texts.add(value)
+        for (intran, outtran) in utils.FAST_PAIRS:
+            for text in texts:
+                if intran != 'slp1':
+                    text = sanscript.transliterate(text, 'slp1', intran)
+                assert utils.fast_backend(text, intran, outtran) == \
+                    sanscript.transliterate(text, intran, outtran)
+        utils.set_backend('sanscript')
+        try:
+            comparetranslit(Prakriya(), superdata, 'Bavati', 'slp1',
+                            'devanagari')
+        finally:
+            utils.set_backend('fast')
+
+    def test_cold_start(self):
+        """Test import and first lookup times and deferred imports."""
+        # Have the shard extracted.
+        Prakriya().get_info('Bavati', 'verb')
+        output = subprocess.check_output([sys.executable, '-c', COLD_START])
+        (times, modules) = output.decode('utf-8').splitlines()[-2:]
+        (importtime, lookuptime) = [float(item) for item in times.split()]
+        modules = set(module.split('.')[0] for module in modules.split())
+        assert importtime < IMPORT_BUDGET
+        assert lookuptime < FIRST_LOOKUP_BUDGET
+        for module in ['click', 'requests', 'indic_transliteration']:
+            assert module not in modules
 
     def test_bhavati(self):
         """Test somethingen."""
+        prak = Prakriya()
+        superdata = read_json(os.path.join('tests', 'testdata', 'Bavati.json'))
         for (verbform, intran) in [('Bavati', 'slp1'), ('ഭവതി', 'malayalam'),
                                    ('భవతి', 'telugu'), ('bhavati', 'iast'),
                                    ('भवति', 'devanagari'), ('Bavawi', 'wx'),
@@ -67,27 +754,40 @@ class TestPrakriya(unittest.TestCase):
                             'bengali', 'gujarati', 'gurmukhi', 'kannada',
                             'malayalam', 'oriya', 'telugu']:
                 print('Testing ' + intran + ' ' + outtran)
-                comparetranslit(verbform, intran, outtran)
-                comparetranslit(verbform, intran, outtran, 'prakriya')
-                comparetranslit(verbform, intran, outtran, 'verb')
-                comparetranslit(verbform, intran, outtran, 'verbaccent')
-                comparetranslit(verbform, intran, outtran, 'lakara')
-                comparetranslit(verbform, intran, outtran, 'gana')
-                comparetranslit(verbform, intran, outtran, 'meaning')
-                comparetranslit(verbform, intran, outtran, 'number')
-                comparetranslit(verbform, intran, outtran, 'madhaviya')
-                comparetranslit(verbform, intran, outtran, 'kshiratarangini')
-                comparetranslit(verbform, intran, outtran, 'dhatupradipa')
-                comparetranslit(verbform, intran, outtran, 'jnu')
-                comparetranslit(verbform, intran, outtran, 'uohyd')
-                comparetranslit(verbform, intran, outtran, 'upasarga')
-                comparetranslit(verbform, intran, outtran, 'padadecider_id')
-                comparetranslit(verbform, intran, outtran, 'padadecider_sutra')
-                comparetranslit(verbform, intran, outtran, 'it_id')
-                comparetranslit(verbform, intran, outtran, 'it_status')
-                comparetranslit(verbform, intran, outtran, 'it_sutra')
-                comparetranslit(verbform, intran, outtran, 'purusha')
-                comparetranslit(verbform, intran, outtran, 'vachana')
+                for arguments in ['', 'prakriya', 'verb', 'verbaccent',
+                                  'lakara', 'gana', 'meaning', 'number',
+                                  'madhaviya', 'kshiratarangini',
+                                  'dhatupradipa', 'jnu', 'uohyd', 'upasarga',
+                                  'padadecider_id', 'padadecider_sutra',
+                                  'it_id', 'it_status', 'it_sutra',
+                                  'purusha', 'vachana']:
+                    comparetranslit(prak, superdata, verbform, intran,
+                                    outtran, arguments)
+
+    def test_verify(self):
+        """Test the verification of the whole dataset."""
+        report = verify(outtrans=['slp1', 'devanagari', 'iast'],
+                        intrans=['devanagari', 'hk'], jobs=2)
+        assert report['shards'] > 0 and report['forms'] > 0
+        assert report['comparisons'] == report['forms'] * 5
+        for mismatch in report['mismatches']:
+            assert mismatch['kind'] in ['generator_only', 'prakriya_only']
+        # A broken fast path is caught, in the same process.
+        utils.set_backend(lambda text, intran, outtran: utils.fast_backend(
+            text, intran, outtran).replace('a', 'e'))
+        try:
+            report = verify(outtrans=['iast'], intrans=[], jobs=1,
+                            generator=False)
+        finally:
+            utils.set_backend('fast')
+        assert report['counts']['output'] == report['forms']
+        mismatch = report['mismatches'][0]
+        assert mismatch['kind'] == 'output' and mismatch['tran'] == 'iast'
+        assert mismatch['expected'] != mismatch['got']
+        # The reference is the transliteration of convert().
+        for (intran, outtran) in [('slp1', 'slp1'), ('slp1', 'iast')]:
+            assert reference_convert('rAmaH|', intran, outtran) == \
+                utils.convert('rAmaH|', intran, outtran)
 
     def test_command_line_interface(self):
         """Test the CLI."""
@@ -102,6 +802,33 @@ class TestPrakriya(unittest.TestCase):
         assert result1.exit_code == 0
         assert 'Bavati' in result1.output
 
+    def test_batch_command_line_interface(self):
+        """Test the batch CLI."""
+        runner = CliRunner()
+        result = runner.invoke(cli.batch, ['--fields', 'lakara,gana'],
+                               input='Bavati\nasdfasdf\n')
+        assert result.exit_code == 0
+        lines = [json.loads(line) for line in result.output.splitlines()]
+        assert lines == [{'input': 'Bavati',
+                          'result': [{'lakara': 'law', 'gana': 'BvAdi'}]},
+                         {'input': 'asdfasdf', 'error': 'not found'}]
+        result = runner.invoke(cli.batch, ['--format', 'csv', '--fields',
+                                           'lakara', '--jobs', '2'],
+                               input='Bavati\n')
+        assert result.exit_code == 0
+        assert result.output.splitlines()[1] == 'Bavati,law,'
+        result = runner.invoke(cli.generate_batch, ['--format', 'csv'],
+                               input='eD lfw Ja\n')
+        assert result.exit_code == 0
+        assert 'eD,lfw,,,Ja,01.0002,eDizyante,' in result.output
+        result = runner.invoke(cli.generate_batch, [],
+                               input='eD lfw\n\neD lfw Ja\n')
+        assert result.exit_code == 0
+        lines = [json.loads(line) for line in result.output.splitlines()]
+        assert len(lines) == 2
+        assert lines[0]['input'] == 'eD lfw' and 'error' in lines[0]
+        assert lines[1]['suffix'] == 'Ja' and 'result' in lines[1]
+
     def test_generate(self):
         """Test generation class."""
         gen = VerbFormGenerator()
@@ -205,21 +932,78 @@ class TestPrakriya(unittest.TestCase):
         assert(gen.getforms('bhU', 'laT', suffix='jhi') == {u'01.0001': [
             u'bhavanti'], u'10.0382': [u'bhAvayanti'], u'10.0277': [u'bhAvayanti']})
 
+    def test_generate_call_translit(self):
+        """Test transliteration given for a single call."""
+        gen = VerbFormGenerator()
+        assert(gen.getforms('bhU', 'laT', suffix='jhi', intran='hk',
+                            outtran='itrans') == {
+            u'01.0001': [u'bhavanti'], u'10.0382': [u'bhAvayanti'],
+            u'10.0277': [u'bhAvayanti']})
+        assert gen.intran == 'slp1' and gen.outtran == 'slp1'
+        prak = Prakriya()
+        assert prak.get_info('bhavati', 'verb', intran='hk',
+                             outtran='devanagari') == [u'भू']
+        assert prak.get_info('Bavati', 'verb') == [u'BU']
+
+    def test_generate_view(self):
+        """Test lazy views of whole verbs and lakaras."""
+        gen = VerbFormGenerator()
+        for outtran in ['slp1', 'devanagari', 'iast']:
+            forms = gen.getforms('BU', outtran=outtran)
+            assert isinstance(forms, FormsView)
+            # As the whole data transliterated at once.
+            eager = json.loads(utils.convert(json.dumps(gen.data['BU']),
+                                             'slp1', outtran))
+            assert forms == eager
+            assert forms.materialize() == eager
+            assert type(forms.materialize()) is dict
+            assert json.loads(json.dumps(forms.materialize())) == eager
+        # Only what is read is transliterated.
+        forms = gen.getforms('BU', 'law', outtran='devanagari')
+        utils.convert.cache.clear()
+        assert forms[u'०१।०००१'][u'तिप्'] == [u'भवति']
+        converted = set(args[0] for args in utils.convert.cache)
+        assert 'Bavati' in converted
+        assert 'Bavanti' not in converted
+        with self.assertRaises(TypeError):
+            forms[u'०१।०००१'] = []
+        # Narrow queries are plain dicts as before.
+        assert type(gen.getforms('BU', 'law', suffix='tip')) is dict
+        # Keys which are the same in the output are counted once.
+        forms = FormsView({'E': ['E'], 'ai': ['ai']}, 'iast')
+        assert len(forms) == len(list(forms)) == 1
+
     def test_false_in(self):
         """Test for false input transliteration."""
         gen = VerbFormGenerator()
-        with self.assertRaises(SystemExit):
+        with self.assertRaises(TransliterationError):
             gen.input_translit('asdfasdf')
 
     def test_false_out(self):
         """Test for false output transliteration."""
         gen = VerbFormGenerator()
-        with self.assertRaises(SystemExit):
+        with self.assertRaises(TransliterationError):
             gen.output_translit('fdasfdas')
 
     def test_wrong_verb(self):
         """Test for verb absent in database."""
         gen = VerbFormGenerator()
-        with self.assertRaises(SystemExit):
+        with self.assertRaises(VerbNotFoundError):
             # gen['adsfasdf', 'tip']
             gen.getforms('adsfasdf', suffix='tip')
+        results = list(gen.batch_forms([('adsfasdf', 'law', 'tip'),
+                                        ('BU', 'law', 'tip')],
+                                       errors='record'))
+        assert isinstance(results[0][1], VerbNotFoundError)
+        assert results[1][1] == gen.getforms('BU', 'law', suffix='tip')
+        # A lakara in which the verb has no form.
+        missing = [(verb, lakara) for (verb, numbers) in gen.data.items()
+                   for lakara in gen.validtenses
+                   if any(lakara not in lakaras
+                          for lakaras in numbers.values())]
+        if missing:
+            (verb, lakara) = missing[0]
+            with self.assertRaises(FormNotFoundError):
+                gen.getforms(verb, lakara)
+            with self.assertRaises(FormNotFoundError):
+                gen[verb, lakara]